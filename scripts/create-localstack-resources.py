@@ -6,13 +6,14 @@ colas SQS, suscripciones y políticas necesarias.
 """
 
 import boto3
+import os
 import time
 import sys
 import json
 from botocore.exceptions import ClientError, EndpointConnectionError
 
 # Configuración
-LOCALSTACK_ENDPOINT = "http://localstack:4566"
+LOCALSTACK_ENDPOINT = os.getenv("SQS_ENDPOINT", "http://localstack:4566")  # o sqs-sns-server.py en local
 REGION = "us-east-1"
 STAGE = "dev"
 MAX_RETRIES = 30
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Generador de carga para la API de pagos.
+
+Cada iteración recorre el flujo del frontend: lista los productos, crea una
+transacción con una clave de idempotencia única, procesa el pago y consulta el
+estado de la transacción hasta que deja de estar PENDING.
+
+Dos modos de carga:
+  closed  (--users N)  N usuarios virtuales repiten el flujo sin pausa; mide la
+                       capacidad del stack a una concurrencia fija.
+  open    (--rate R)   se inician R flujos por segundo (llegadas de Poisson)
+                       sin importar cuánto tarden los anteriores; las latencias
+                       se miden desde el instante programado, de modo que una
+                       API lenta no oculta su propia demora (coordinated omission).
+
+Las latencias de cada endpoint se acumulan en histogramas log-lineales al estilo
+HDR (error relativo < 1%) y el resultado se escribe en JSON con --output.
+
+Ejemplos:
+  python scripts/payments-load-test.py --users 20 --duration 60
+  python scripts/payments-load-test.py --rate 50 --duration 120 --output results.json
+  python scripts/payments-load-test.py --users 5 --steps products,transaction
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.parse
+import uuid
+
+# Configuración
+API_URL = os.getenv("API_URL", "http://localhost:3001")
+DURATION = 60  # segundos de carga
+WARMUP = 5  # segundos iniciales que no se cuentan en los resultados
+REQUEST_TIMEOUT = 30  # segundos máximos por request
+STATUS_POLL_INTERVAL = 1.0  # segundos entre consultas del estado de la transacción
+STATUS_POLL_TIMEOUT = 120  # segundos máximos esperando que la transacción deje de estar PENDING
+MAX_OUTSTANDING = 2000  # flujos simultáneos máximos en modo open (los que no caben se cuentan como descartados)
+PRODUCTS_REFRESH = 30  # segundos que se reutiliza la lista de productos para elegir qué comprar
+STEPS = ("products", "transaction", "payment", "status")
+
+# Datos de prueba (tarjeta de la pasarela sandbox que aprueba el pago)
+TEST_CARD = {"cardNumber": "4242424242424242", "cvc": "123", "expMonth": "12", "expYear": "29", "cardHolder": "Load Test"}
+TEST_CUSTOMER = {
+    "customerName": "Load Test",
+    "deliveryAddress": "Calle 123 #45-67",
+    "deliveryCity": "Bogotá",
+    "deliveryPhone": "+573001234567",
+}
+
+class LatencyHistogram:
+    """
+    Histograma log-lineal de latencias en microsegundos, al estilo de HdrHistogram:
+    cada potencia de dos se divide en 2^SUB_BUCKET_BITS sub-buckets lineales, lo
+    que acota el error relativo de los percentiles a 1/2^(SUB_BUCKET_BITS - 1)
+    con memoria proporcional al rango y no a la cantidad de muestras.
+    """
+
+    SUB_BUCKET_BITS = 8
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0
+        self.min = None
+        self.sum = 0
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        return (shift, value >> shift)
+
+    @staticmethod
+    def _value(index):
+        shift, sub_bucket = index
+        # Punto medio del rango de valores que cae en el bucket
+        return (sub_bucket << shift) + ((1 << shift) >> 1)
+
+    def record(self, seconds):
+        value = max(1, int(seconds * 1_000_000))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, fraction):
+        """Percentil en milisegundos."""
+        if not self.total:
+            return 0.0
+        target = max(1, int(round(fraction * self.total)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._value(index), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "minMs": round((self.min or 0) / 1000, 3),
+            "meanMs": round(self.sum / self.total / 1000, 3) if self.total else 0.0,
+            "p50Ms": round(self.percentile(0.50), 3),
+            "p90Ms": round(self.percentile(0.90), 3),
+            "p95Ms": round(self.percentile(0.95), 3),
+            "p99Ms": round(self.percentile(0.99), 3),
+            "p999Ms": round(self.percentile(0.999), 3),
+            "maxMs": round(self.max / 1000, 3),
+        }
+
+class EndpointStats:
+    """Latencias, códigos de estado y errores de un endpoint."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, seconds, status=None, error=None):
+        self.latency.record(seconds)
+        if status is not None:
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    @property
+    def failures(self):
+        return sum(self.errors.values()) + sum(count for status, count in self.statuses.items() if int(status) >= 400)
+
+class LoadStats:
+    """Resultados de la corrida por endpoint; las muestras del warmup se descartan."""
+
+    def __init__(self, warmup_until):
+        self.warmup_until = warmup_until
+        self.endpoints = {}
+        self.outcomes = {}  # estado final de las transacciones
+        self.dropped = 0
+        self.started = None
+        self.finished = None
+
+    def record(self, endpoint, started, seconds, status=None, error=None):
+        if started < self.warmup_until:
+            return
+        self.endpoints.setdefault(endpoint, EndpointStats()).record(seconds, status, error)
+
+    def outcome(self, started, status):
+        if started >= self.warmup_until:
+            self.outcomes[status] = self.outcomes.get(status, 0) + 1
+
+    def elapsed(self):
+        return max(0.001, (self.finished or time.monotonic()) - max(self.warmup_until, self.started or 0))
+
+    def to_dict(self):
+        elapsed = self.elapsed()
+        return {
+            "elapsedSeconds": round(elapsed, 3),
+            "dropped": self.dropped,
+            "outcomes": self.outcomes,
+            "endpoints": {
+                name: {
+                    "throughputPerSecond": round(stats.latency.total / elapsed, 2),
+                    "failures": stats.failures,
+                    "statuses": stats.statuses,
+                    "errors": stats.errors,
+                    "latency": stats.latency.summary(),
+                }
+                for name, stats in self.endpoints.items()
+            },
+        }
+
+    def print(self):
+        elapsed = self.elapsed()
+        print("=" * 100)
+        print(f"{'Endpoint':<28} {'Count':>7} {'Req/s':>8} {'Fail':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+        for name, stats in self.endpoints.items():
+            latency = stats.latency
+            print(f"{name:<28} {latency.total:>7} {latency.total / elapsed:>8.1f} {stats.failures:>6} "
+                  f"{latency.percentile(0.5):>9.1f} {latency.percentile(0.95):>9.1f} "
+                  f"{latency.percentile(0.99):>9.1f} {latency.max / 1000:>9.1f}")
+        print("=" * 100)
+        if self.outcomes:
+            print("Final transaction status: " + ", ".join(f"{status} {count}" for status, count in sorted(self.outcomes.items())))
+        if self.dropped:
+            print(f"⚠ {self.dropped} iteration(s) not started: more than {MAX_OUTSTANDING} in flight")
+        for name, stats in self.endpoints.items():
+            for error, count in stats.errors.items():
+                print(f"⚠ {name}: {count}x {error}")
+
+class HTTPError(Exception):
+    pass
+
+class AsyncHTTPClient:
+    """Cliente HTTP/1.1 mínimo para asyncio con conexiones keep-alive reutilizables."""
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.use_ssl = parsed.scheme == "https"
+        self.port = parsed.port or (443 if self.use_ssl else 80)
+        self.base_path = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = []
+
+    async def request(self, method, path, body=None):
+        """Retorna (status, JSON de la respuesta o None)."""
+        payload = json.dumps(body).encode() if body is not None else b""
+        lines = [
+            f"{method} {self.base_path}{path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Accept: application/json",
+            f"Content-Length: {len(payload)}",
+        ]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        raw = ("\r\n".join(lines) + "\r\n\r\n").encode() + payload
+
+        # Una conexión keep-alive reutilizada puede haber sido cerrada por el servidor
+        for attempt in range(2):
+            reused = bool(self._idle)
+            connection = self._idle.pop() if reused else await self._connect()
+            try:
+                status, headers, data = await asyncio.wait_for(self._send(connection, raw), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection[1].close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                connection[1].close()
+            else:
+                self._idle.append(connection)
+            break
+
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    async def _connect(self):
+        return await asyncio.open_connection(self.host, self.port, ssl=self.use_ssl or None)
+
+    async def _send(self, connection, raw):
+        reader, writer = connection
+        writer.write(raw)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by the API")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                data += await reader.readexactly(size)
+                await reader.readline()
+        else:
+            data = await reader.read()
+            headers["connection"] = "close"
+        return status, headers, data
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+class PaymentFlow:
+    """Una iteración del flujo de compra, registrando cada request en las estadísticas."""
+
+    def __init__(self, client, stats, steps, poll_interval, poll_timeout):
+        self.client = client
+        self.stats = stats
+        self.steps = steps
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self._products = []
+        self._products_at = 0.0
+
+    async def call(self, endpoint, method, path, body=None, scheduled=None):
+        """Request cronometrado; `scheduled` mide desde el instante programado (modo open)."""
+        started = time.monotonic()
+        origin = scheduled if scheduled is not None else started
+        try:
+            status, data = await self.client.request(method, path, body)
+        except asyncio.TimeoutError:
+            self.stats.record(endpoint, origin, time.monotonic() - origin, error="timeout")
+            return None, None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+            self.stats.record(endpoint, origin, time.monotonic() - origin, error=type(e).__name__)
+            return None, None
+        self.stats.record(endpoint, origin, time.monotonic() - origin, status=status)
+        return status, data
+
+    async def pick_product(self, scheduled):
+        """Producto a comprar; la lista se consulta en cada iteración si el paso está activo."""
+        if "products" in self.steps or not self._products or time.monotonic() - self._products_at > PRODUCTS_REFRESH:
+            status, data = await self.call("GET /products", "GET", "/products", scheduled=scheduled)
+            scheduled = None
+            if status == 200 and data and data.get("data"):
+                self._products = data["data"]
+                self._products_at = time.monotonic()
+        if not self._products:
+            return None, scheduled
+        return random.choice(self._products), scheduled
+
+    async def run(self, scheduled=None):
+        """Ejecuta el flujo; `scheduled` es el instante programado de la iteración en modo open."""
+        started = scheduled if scheduled is not None else time.monotonic()
+        product, scheduled = await self.pick_product(scheduled)
+        if "transaction" not in self.steps or product is None:
+            return
+
+        amount = int(product.get("price") or 100000)
+        status, data = await self.call("POST /transactions", "POST", "/transactions", {
+            "productId": product["id"],
+            "amount": amount,
+            "commission": amount // 20,
+            "shippingCost": 10000,
+            "customerEmail": f"load-{uuid.uuid4().hex[:12]}@example.com",
+            "idempotencyKey": f"load-{uuid.uuid4()}",
+            **TEST_CUSTOMER,
+        }, scheduled=scheduled)
+        if status not in (200, 201) or not data or not data.get("data"):
+            return
+        transaction_id = data["data"]["id"]
+
+        if "payment" in self.steps:
+            status, _ = await self.call("POST /payments/process", "POST", "/payments/process", {
+                "transactionId": transaction_id,
+                "installments": 1,
+                **TEST_CARD,
+            })
+            if status not in (200, 201):
+                return
+
+        if "status" in self.steps:
+            final_status = await self.wait_for_status(transaction_id)
+            self.stats.outcome(started, final_status)
+            self.stats.record("transaction settled", started, time.monotonic() - started)
+
+    async def wait_for_status(self, transaction_id):
+        """Consulta la transacción hasta que deja de estar PENDING o se agota poll_timeout."""
+        deadline = time.monotonic() + self.poll_timeout
+        while True:
+            status, data = await self.call("GET /transactions/:id", "GET", f"/transactions/{transaction_id}")
+            current = ((data or {}).get("data") or {}).get("status") if status == 200 else None
+            if current and current != "PENDING":
+                return current
+            if time.monotonic() >= deadline:
+                return "PENDING (timed out)"
+            await asyncio.sleep(self.poll_interval)
+
+async def run_closed(args, stats, stop_at):
+    """N usuarios virtuales, cada uno con su conexión, repitiendo el flujo hasta stop_at."""
+    async def user():
+        client = AsyncHTTPClient(args.url, args.timeout)
+        flow = PaymentFlow(client, stats, args.steps, args.poll_interval, args.poll_timeout)
+        try:
+            while time.monotonic() < stop_at:
+                await flow.run()
+        finally:
+            await client.close()
+
+    await asyncio.gather(*(user() for _ in range(args.users)))
+
+async def run_open(args, stats, stop_at):
+    """Inicia flujos a una tasa fija (llegadas de Poisson) hasta stop_at, sin esperar a los anteriores."""
+    idle_clients = []
+    tasks = set()
+
+    async def iteration(scheduled):
+        client = idle_clients.pop() if idle_clients else AsyncHTTPClient(args.url, args.timeout)
+        try:
+            await PaymentFlow(client, stats, args.steps, args.poll_interval, args.poll_timeout).run(scheduled)
+        finally:
+            idle_clients.append(client)
+
+    next_start = time.monotonic()
+    while next_start < stop_at:
+        delay = next_start - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= MAX_OUTSTANDING:
+            stats.dropped += 1
+        else:
+            task = asyncio.create_task(iteration(next_start))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        next_start += random.expovariate(args.rate)
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for client in idle_clients:
+        await client.close()
+
+async def run(args):
+    started = time.monotonic()
+    stats = LoadStats(warmup_until=started + args.warmup)
+    stats.started = started
+    stop_at = started + args.warmup + args.duration
+
+    async def progress():
+        while True:
+            await asyncio.sleep(10)
+            done = sum(endpoint.latency.total for endpoint in stats.endpoints.values())
+            print(f"  ... {time.monotonic() - started:.0f}s, {done} request(s) measured", flush=True)
+
+    reporter = asyncio.create_task(progress())
+    try:
+        if args.rate:
+            await run_open(args, stats, stop_at)
+        else:
+            await run_closed(args, stats, stop_at)
+    finally:
+        reporter.cancel()
+        stats.finished = time.monotonic()
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the payments API")
+    parser.add_argument("--url", default=API_URL, help=f"API base URL (default {API_URL})")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--users", type=int, default=10, help="closed loop: concurrent virtual users (default 10)")
+    load.add_argument("--rate", type=float, help="open loop: iterations started per second")
+    parser.add_argument("--duration", type=float, default=DURATION, help=f"seconds of measured load (default {DURATION})")
+    parser.add_argument("--warmup", type=float, default=WARMUP, help=f"seconds excluded from the results (default {WARMUP})")
+    parser.add_argument("--steps", default=",".join(STEPS), help=f"comma separated steps to run (default {','.join(STEPS)})")
+    parser.add_argument("--poll-interval", type=float, default=STATUS_POLL_INTERVAL, help="seconds between status polls")
+    parser.add_argument("--poll-timeout", type=float, default=STATUS_POLL_TIMEOUT, help="max seconds waiting for a final status")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="per request timeout in seconds")
+    parser.add_argument("--seed", type=int, help="random seed for product choice and arrivals")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    args.steps = {step.strip() for step in args.steps.split(",") if step.strip()}
+    unknown = args.steps - set(STEPS)
+    if unknown:
+        parser.error(f"unknown step(s): {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    mode = f"open loop, {args.rate:g} iteration(s)/s" if args.rate else f"closed loop, {args.users} user(s)"
+    print(f"Load test against {args.url}: {mode}, {args.duration:g}s (+{args.warmup:g}s warmup), "
+          f"steps {', '.join(step for step in STEPS if step in args.steps)}", flush=True)
+
+    try:
+        stats = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n⚠ Interrupted")
+        return 1
+
+    stats.print()
+    if args.output:
+        results = {
+            "url": args.url,
+            "mode": "open" if args.rate else "closed",
+            "users": None if args.rate else args.users,
+            "rate": args.rate,
+            "durationSeconds": args.duration,
+            "warmupSeconds": args.warmup,
+            "steps": sorted(args.steps),
+            "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - stats.elapsed())),
+            **stats.to_dict(),
+        }
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"✓ Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
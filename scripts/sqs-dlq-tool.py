@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+"""
+Herramienta para inspeccionar y reenviar (redrive) los mensajes de una DLQ.
+
+  inspect  recibe los mensajes de la DLQ sin borrarlos y resume los fallos por
+           error y por tipo de evento.
+  redrive  reenvía a la cola de origen los mensajes que cumplen los filtros con
+           send_message_batch, a una tasa máxima configurable, y los borra de la DLQ.
+
+La DLQ se lee con varios threads en paralelo. Los mensajes ya leídos quedan
+invisibles hasta que termina la corrida, de modo que cada mensaje se procesa una
+sola vez; al terminar, los que no se reenviaron vuelven a quedar visibles.
+
+El redrive registra en un archivo de checkpoint (una línea JSON por mensaje) los
+mensajes ya enviados. Si se interrumpe, al repetir el comando con el mismo
+checkpoint, esos mensajes se borran de la DLQ sin enviarlos de nuevo.
+
+Ejemplos:
+  python scripts/sqs-dlq-tool.py inspect
+  python scripts/sqs-dlq-tool.py redrive --event-type PaymentCreated --rate 500
+  python scripts/sqs-dlq-tool.py redrive --checkpoint redrive.jsonl --dry-run
+"""
+
+import argparse
+import boto3
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+# Configuración
+SQS_ENDPOINT = os.getenv("SQS_ENDPOINT", "http://localhost:4566")  # LocalStack expuesto en el host
+REGION = os.getenv("AWS_REGION", "us-east-1")
+DLQ_NAME = "dev-payments-dlq"
+TARGET_QUEUE_NAME = "dev-payments-queue"
+RECEIVE_THREADS = 8  # receives en paralelo contra la DLQ
+RECEIVE_WAIT_SECONDS = 1  # long polling corto: la DLQ no recibe mensajes nuevos durante la corrida
+EMPTY_RECEIVES_TO_STOP = 3  # receives vacíos seguidos (por thread) para dar la DLQ por vaciada
+HOLD_VISIBILITY_TIMEOUT = 900  # segundos que los mensajes leídos quedan invisibles durante la corrida
+REDRIVE_RATE = 200.0  # mensajes por segundo enviados a la cola de origen (0: sin límite)
+SQS_MAX_BATCH_ENTRIES = 10  # máximo de entradas por llamada batch de SQS
+SUMMARY_TOP = 20  # filas por tabla del resumen
+
+def create_sqs_client(endpoint=SQS_ENDPOINT):
+    """Cliente SQS con un pool de conexiones suficiente para los threads de receive y envío."""
+    return boto3.client(
+        "sqs",
+        endpoint_url=endpoint,
+        region_name=REGION,
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", "local"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", "local"),
+        config=Config(max_pool_connections=RECEIVE_THREADS * 2 + 4, retries={"max_attempts": 5, "mode": "standard"})
+    )
+
+def get_queue_url(sqs_client, queue_name):
+    """URL de una cola por nombre (acepta también una URL completa)."""
+    if queue_name.startswith("http"):
+        return queue_name
+    return sqs_client.get_queue_url(QueueName=queue_name)["QueueUrl"]
+
+def get_source_queue_name(sqs_client, dlq_url):
+    """Cola de origen de una DLQ según las colas que la declaran en su RedrivePolicy."""
+    dlq_arn = sqs_client.get_queue_attributes(QueueUrl=dlq_url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+    try:
+        sources = sqs_client.list_dead_letter_source_queues(QueueUrl=dlq_url).get("queueUrls", [])
+    except ClientError:
+        sources = []
+    if len(sources) == 1:
+        return sources[0]
+    print(f"⚠ Could not find a single source queue for {dlq_arn}, using {TARGET_QUEUE_NAME}")
+    return TARGET_QUEUE_NAME
+
+def chunks(items, size=SQS_MAX_BATCH_ENTRIES):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+# ---------------------------------------------------------------------------
+# Lectura y clasificación de mensajes
+# ---------------------------------------------------------------------------
+
+def parse_body(message):
+    """Body JSON del mensaje; si es una notificación SNS, el mensaje que contiene."""
+    try:
+        body = json.loads(message.get("Body") or "null")
+    except ValueError:
+        return None
+    if isinstance(body, dict) and body.get("Type") == "Notification":
+        try:
+            body = json.loads(body.get("Message") or "null")
+        except ValueError:
+            return None
+    return body if isinstance(body, dict) else None
+
+def get_event_type(message):
+    """Tipo de evento del mensaje (message attribute eventType o campo del body)."""
+    attribute = message.get("MessageAttributes", {}).get("eventType", {}).get("StringValue")
+    if attribute:
+        return attribute
+    body = parse_body(message) or {}
+    return body.get("eventType") or body.get("type") or "unknown"
+
+def get_error(message):
+    """Error registrado en el mensaje, si el productor o el handler lo incluyó."""
+    attributes = message.get("MessageAttributes", {})
+    for name in ("errorType", "error", "ErrorMessage", "errorMessage"):
+        if attributes.get(name, {}).get("StringValue"):
+            return attributes[name]["StringValue"]
+    body = parse_body(message) or {}
+    error = body.get("error") or body.get("errorMessage") or body.get("failureReason")
+    if isinstance(error, dict):
+        error = error.get("Error") or error.get("name") or error.get("message") or json.dumps(error, sort_keys=True)
+    return str(error)[:120] if error else "(no error recorded)"
+
+def message_age_seconds(message, now=None):
+    sent = message.get("Attributes", {}).get("SentTimestamp")
+    if not sent:
+        return None
+    return max(0.0, (now or time.time()) - int(sent) / 1000)
+
+class MessageFilter:
+    """Filtros de selección de mensajes para el redrive."""
+
+    def __init__(self, event_types=None, errors=None, contains=None, message_ids=None, min_age=None, max_age=None):
+        self.event_types = set(event_types or [])
+        self.errors = errors or []
+        self.contains = contains
+        self.message_ids = set(message_ids or [])
+        self.min_age = min_age
+        self.max_age = max_age
+
+    def matches(self, message):
+        if self.message_ids and message["MessageId"] not in self.message_ids:
+            return False
+        if self.event_types and get_event_type(message) not in self.event_types:
+            return False
+        if self.errors and not any(error in get_error(message) for error in self.errors):
+            return False
+        if self.contains and self.contains not in (message.get("Body") or ""):
+            return False
+        if self.min_age is not None or self.max_age is not None:
+            age = message_age_seconds(message)
+            if age is None:
+                return False
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+        return True
+
+class DLQReader:
+    """
+    Lee la DLQ con varios threads en paralelo y entrega cada batch a un callback.
+    Termina cuando cada thread recibe EMPTY_RECEIVES_TO_STOP respuestas vacías
+    seguidas, al alcanzar `limit` mensajes o al pedirse stop().
+    """
+
+    def __init__(self, sqs_client, queue_url, threads=RECEIVE_THREADS, limit=None,
+                 hold_visibility_timeout=HOLD_VISIBILITY_TIMEOUT):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.threads = max(1, threads)
+        self.limit = limit
+        self.hold_visibility_timeout = hold_visibility_timeout
+        self.received = 0
+        self._reserved = 0  # cupo de receives en curso, para no pasarse de `limit`
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self, on_batch):
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="dlq-receiver") as executor:
+            futures = [executor.submit(self._receive_loop, on_batch) for _ in range(self.threads)]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                # Detener los receptores antes de que el executor espere a que terminen:
+                # de lo contrario seguirían entregando batches hasta vaciar la DLQ
+                self._stopped.set()
+                raise
+
+    def _reserve(self):
+        """Reserva el cupo del próximo receive según `limit` (0: no recibir más)."""
+        with self._lock:
+            if self.limit is None:
+                wanted = SQS_MAX_BATCH_ENTRIES
+            else:
+                wanted = max(0, min(SQS_MAX_BATCH_ENTRIES, self.limit - self.received - self._reserved))
+            self._reserved += wanted
+            return wanted
+
+    def _receive_loop(self, on_batch):
+        empty = 0
+        while not self._stopped.is_set() and empty < EMPTY_RECEIVES_TO_STOP:
+            wanted = self._reserve()
+            if not wanted:
+                return
+            response = self.sqs_client.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=wanted,
+                WaitTimeSeconds=RECEIVE_WAIT_SECONDS,
+                VisibilityTimeout=self.hold_visibility_timeout,
+                MessageAttributeNames=["All"],
+                AttributeNames=["All"]
+            )
+            messages = response.get("Messages", [])
+            with self._lock:
+                self._reserved -= wanted
+                self.received += len(messages)
+            if not messages:
+                empty += 1
+                continue
+            empty = 0
+            if self._stopped.is_set():
+                # Interrumpido durante el receive: el batch no se entrega y vuelve a ser visible
+                release_messages(self.sqs_client, self.queue_url, messages)
+                return
+            on_batch(messages)
+
+def release_messages(sqs_client, queue_url, messages):
+    """Vuelve a hacer visibles en la DLQ los mensajes leídos que no se reenviaron."""
+    for chunk in chunks(messages):
+        try:
+            sqs_client.change_message_visibility_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(index), "ReceiptHandle": message["ReceiptHandle"], "VisibilityTimeout": 0}
+                    for index, message in enumerate(chunk)
+                ]
+            )
+        except ClientError as e:
+            print(f"⚠ Could not release {len(chunk)} message(s), they will be visible again after the hold timeout: {e}")
+
+# ---------------------------------------------------------------------------
+# inspect
+# ---------------------------------------------------------------------------
+
+class Summary:
+    """Conteos de los mensajes leídos por error, tipo de evento y cantidad de recepciones."""
+
+    def __init__(self):
+        self.total = 0
+        self.by_error = collections.Counter()
+        self.by_event_type = collections.Counter()
+        self.by_receive_count = collections.Counter()
+        self.oldest = 0.0
+        self.samples = {}  # error -> MessageId de ejemplo
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def add(self, messages):
+        now = time.time()
+        with self._lock:
+            for message in messages:
+                # SQS entrega al menos una vez: un mismo mensaje puede llegar a dos receivers
+                if message["MessageId"] in self._seen:
+                    continue
+                self._seen.add(message["MessageId"])
+                error = get_error(message)
+                self.total += 1
+                self.by_error[error] += 1
+                self.by_event_type[get_event_type(message)] += 1
+                self.by_receive_count[message.get("Attributes", {}).get("ApproximateReceiveCount", "?")] += 1
+                self.oldest = max(self.oldest, message_age_seconds(message, now) or 0.0)
+                self.samples.setdefault(error, message["MessageId"])
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "oldestAgeSeconds": round(self.oldest, 1),
+            "byError": [{"error": error, "count": count, "sampleMessageId": self.samples[error]}
+                        for error, count in self.by_error.most_common()],
+            "byEventType": dict(self.by_event_type.most_common()),
+            "byReceiveCount": dict(sorted(self.by_receive_count.items())),
+        }
+
+    def print(self):
+        print(f"\n{self.total} message(s) in the DLQ (oldest {self.oldest / 3600:.1f}h)")
+        for title, counter in (("Error", self.by_error), ("Event type", self.by_event_type)):
+            print(f"\n  {title:<60} {'Count':>8}")
+            for value, count in counter.most_common(SUMMARY_TOP):
+                print(f"  {value[:60]:<60} {count:>8}")
+            if len(counter) > SUMMARY_TOP:
+                print(f"  ... {len(counter) - SUMMARY_TOP} more")
+        receive_counts = ", ".join(f"{count}x{value}" for value, count in sorted(self.by_receive_count.items()))
+        print(f"\n  Receive counts: {receive_counts}")
+
+def inspect_command(args, sqs_client):
+    dlq_url = get_queue_url(sqs_client, args.dlq)
+    print(f"Inspecting {dlq_url} with {args.threads} receiver(s)...")
+    summary = Summary()
+    read = []
+    read_lock = threading.Lock()
+
+    def on_batch(messages):
+        summary.add(messages)
+        with read_lock:
+            read.extend(messages)
+
+    reader = DLQReader(sqs_client, dlq_url, args.threads, args.limit)
+    started = time.monotonic()
+    try:
+        reader.run(on_batch)
+    except KeyboardInterrupt:
+        reader.stop()
+        print("\n⚠ Interrupted, summarizing the messages read so far")
+    finally:
+        release_messages(sqs_client, dlq_url, read)
+
+    summary.print()
+    print(f"\n✓ Read {summary.total} message(s) in {time.monotonic() - started:.1f}s")
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summary.to_dict(), output, indent=2)
+        print(f"✓ Summary written to {args.json}")
+
+# ---------------------------------------------------------------------------
+# redrive
+# ---------------------------------------------------------------------------
+
+class RateLimiter:
+    """Token bucket compartido entre threads: como máximo `rate` mensajes por segundo."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(SQS_MAX_BATCH_ENTRIES, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                wait = (count - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Checkpoint:
+    """
+    Archivo append-only con los MessageId ya reenviados. Cada línea se escribe
+    tras confirmar el envío, antes de borrar el mensaje de la DLQ.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sent = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if path and os.path.exists(path):
+            with open(path) as existing:
+                for line in existing:
+                    try:
+                        self.sent.add(json.loads(line)["messageId"])
+                    except (ValueError, KeyError):
+                        continue
+        if path:
+            self._file = open(path, "a")
+
+    def __contains__(self, message_id):
+        return message_id in self.sent
+
+    def record(self, messages, target_ids):
+        if not self._file:
+            return
+        with self._lock:
+            for message, target_id in zip(messages, target_ids):
+                self.sent.add(message["MessageId"])
+                self._file.write(json.dumps({"messageId": message["MessageId"], "targetMessageId": target_id, "at": time.time()}) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+def build_send_entry(index, message):
+    """Entrada de send_message_batch que conserva el body y los message attributes."""
+    entry = {"Id": str(index), "MessageBody": message["Body"]}
+    attributes = {
+        name: {key: value for key, value in attribute.items() if key in ("DataType", "StringValue", "BinaryValue")}
+        for name, attribute in message.get("MessageAttributes", {}).items()
+    }
+    if attributes:
+        entry["MessageAttributes"] = attributes
+    group_id = message.get("Attributes", {}).get("MessageGroupId")
+    if group_id:
+        entry["MessageGroupId"] = group_id
+        entry["MessageDeduplicationId"] = message.get("Attributes", {}).get("MessageDeduplicationId") or message["MessageId"]
+    return entry
+
+class Redriver:
+    """Reenvía batches de la DLQ a la cola de origen y los borra de la DLQ una vez enviados."""
+
+    def __init__(self, sqs_client, dlq_url, target_url, message_filter, rate_limiter, checkpoint, dry_run=False):
+        self.sqs_client = sqs_client
+        self.dlq_url = dlq_url
+        self.target_url = target_url
+        self.filter = message_filter
+        self.rate_limiter = rate_limiter
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.counts = collections.Counter()
+        self.skipped = []  # mensajes leídos que no se reenvían y vuelven a la DLQ
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def handle_batch(self, messages):
+        selected, resumed, skipped = [], [], []
+        for message in messages:
+            with self._lock:
+                # Entrega duplicada de un mensaje que otro receiver ya está procesando
+                duplicate = message["MessageId"] in self._seen
+                self._seen.add(message["MessageId"])
+            if duplicate:
+                self._count(duplicates=1)
+            elif message["MessageId"] in self.checkpoint:
+                resumed.append(message)
+            elif self.filter.matches(message):
+                selected.append(message)
+            else:
+                skipped.append(message)
+
+        self._count(skipped=len(skipped), already_sent=len(resumed))
+        if self.dry_run:
+            skipped += selected + resumed
+            self._count(would_redrive=len(selected))
+        else:
+            # Enviados en una corrida anterior que no llegó a borrarlos: solo se borran
+            self._delete(resumed)
+            self._send(selected, skipped)
+        if skipped:
+            with self._lock:
+                self.skipped.extend(skipped)
+
+    def _send(self, messages, skipped):
+        for chunk in chunks(messages):
+            self.rate_limiter.acquire(len(chunk))
+            try:
+                response = self.sqs_client.send_message_batch(
+                    QueueUrl=self.target_url,
+                    Entries=[build_send_entry(index, message) for index, message in enumerate(chunk)]
+                )
+            except ClientError as e:
+                print(f"✗ Error sending {len(chunk)} message(s): {e}")
+                skipped.extend(chunk)
+                self._count(failed=len(chunk))
+                continue
+
+            sent = [(chunk[int(entry["Id"])], entry["MessageId"]) for entry in response.get("Successful", [])]
+            for entry in response.get("Failed", []):
+                print(f"✗ Could not send {chunk[int(entry['Id'])]['MessageId']}: {entry.get('Code')} {entry.get('Message', '')}")
+                skipped.append(chunk[int(entry["Id"])])
+            self._count(failed=len(response.get("Failed", [])))
+            if sent:
+                self.checkpoint.record([message for message, _ in sent], [target_id for _, target_id in sent])
+                self._delete([message for message, _ in sent])
+                self._count(redriven=len(sent))
+
+    def _delete(self, messages):
+        for chunk in chunks(messages):
+            try:
+                response = self.sqs_client.delete_message_batch(
+                    QueueUrl=self.dlq_url,
+                    Entries=[{"Id": str(index), "ReceiptHandle": message["ReceiptHandle"]} for index, message in enumerate(chunk)]
+                )
+                failed = response.get("Failed", [])
+            except ClientError as e:
+                print(f"⚠ Error deleting {len(chunk)} redriven message(s) from the DLQ: {e}")
+                failed = chunk
+            if failed:
+                # Quedan en el checkpoint: una nueva corrida los borra sin reenviarlos
+                self._count(delete_failed=len(failed))
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                if value:
+                    self.counts[name] += value
+
+def redrive_command(args, sqs_client):
+    dlq_url = get_queue_url(sqs_client, args.dlq)
+    target_url = get_queue_url(sqs_client, args.target or get_source_queue_name(sqs_client, dlq_url))
+    message_ids = set(args.message_id or [])
+    if args.message_ids_file:
+        with open(args.message_ids_file) as ids_file:
+            message_ids.update(line.strip() for line in ids_file if line.strip())
+    message_filter = MessageFilter(
+        event_types=args.event_type,
+        errors=args.error,
+        contains=args.contains,
+        message_ids=message_ids,
+        min_age=args.min_age,
+        max_age=args.max_age
+    )
+    checkpoint = Checkpoint(None if args.dry_run else args.checkpoint)
+    redriver = Redriver(sqs_client, dlq_url, target_url, message_filter, RateLimiter(args.rate), checkpoint, args.dry_run)
+
+    mode = "dry run" if args.dry_run else f"max {args.rate:g} msg/s" if args.rate > 0 else "no rate limit"
+    print(f"Redriving {dlq_url} -> {target_url} ({mode}, {args.threads} receiver(s))")
+    if checkpoint.sent:
+        print(f"  Resuming from {args.checkpoint}: {len(checkpoint.sent)} message(s) already sent")
+
+    reader = DLQReader(sqs_client, dlq_url, args.threads, args.limit)
+    started = time.monotonic()
+    progress = threading.Event()
+
+    def report():
+        while not progress.wait(5):
+            elapsed = time.monotonic() - started
+            counts = redriver.counts
+            print(f"  ... {reader.received} read, {counts['redriven']} redriven "
+                  f"({counts['redriven'] / elapsed:.0f} msg/s), {counts['skipped']} skipped, {counts['failed']} failed")
+
+    threading.Thread(target=report, daemon=True).start()
+    try:
+        reader.run(redriver.handle_batch)
+    except KeyboardInterrupt:
+        reader.stop()
+        print("\n⚠ Interrupted, the checkpoint keeps the progress")
+    finally:
+        progress.set()
+        release_messages(sqs_client, dlq_url, redriver.skipped)
+        checkpoint.close()
+
+    elapsed = time.monotonic() - started
+    counts = redriver.counts
+    print("=" * 60)
+    print(f"Read: {reader.received} message(s) in {elapsed:.1f}s")
+    if args.dry_run:
+        print(f"Would redrive: {counts['would_redrive']}")
+    else:
+        print(f"Redriven: {counts['redriven']} ({counts['redriven'] / max(elapsed, 0.001):.0f} msg/s)")
+        print(f"Already sent in a previous run: {counts['already_sent']}")
+    print(f"Not selected (left in the DLQ): {counts['skipped']}")
+    if counts["duplicates"]:
+        print(f"Duplicate deliveries ignored: {counts['duplicates']}")
+    if counts["failed"] or counts["delete_failed"]:
+        print(f"⚠ Send failures: {counts['failed']}, delete failures: {counts['delete_failed']} "
+              f"(run again with the same checkpoint)")
+    print("=" * 60)
+    return 1 if counts["failed"] or counts["delete_failed"] else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and redrive the messages of an SQS dead-letter queue")
+    parser.add_argument("--endpoint", default=SQS_ENDPOINT, help=f"SQS endpoint (default {SQS_ENDPOINT})")
+    parser.add_argument("--dlq", default=DLQ_NAME, help=f"DLQ name or URL (default {DLQ_NAME})")
+    parser.add_argument("--threads", type=int, default=RECEIVE_THREADS, help="parallel receivers")
+    parser.add_argument("--limit", type=int, help="stop after reading this many messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    inspect = commands.add_parser("inspect", help="summarize the DLQ by error and event type")
+    inspect.add_argument("--json", help="write the summary to this file")
+
+    redrive = commands.add_parser("redrive", help="send selected messages back to the source queue")
+    redrive.add_argument("--target", help="target queue name or URL (default: the DLQ's source queue)")
+    redrive.add_argument("--rate", type=float, default=REDRIVE_RATE, help="max messages per second (0: unlimited)")
+    redrive.add_argument("--checkpoint", default="dlq-redrive.checkpoint.jsonl", help="progress file used to resume")
+    redrive.add_argument("--event-type", action="append", help="only this event type (repeatable)")
+    redrive.add_argument("--error", action="append", help="only messages whose error contains this text (repeatable)")
+    redrive.add_argument("--contains", help="only messages whose body contains this text")
+    redrive.add_argument("--message-id", action="append", help="only this MessageId (repeatable)")
+    redrive.add_argument("--message-ids-file", help="file with one MessageId per line")
+    redrive.add_argument("--min-age", type=float, help="only messages older than this many seconds")
+    redrive.add_argument("--max-age", type=float, help="only messages newer than this many seconds")
+    redrive.add_argument("--dry-run", action="store_true", help="select without sending or deleting")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sqs_client = create_sqs_client(args.endpoint)
+    try:
+        if args.command == "inspect":
+            inspect_command(args, sqs_client)
+            return 0
+        return redrive_command(args, sqs_client)
+    except (EndpointConnectionError, ClientError) as e:
+        print(f"✗ Error: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
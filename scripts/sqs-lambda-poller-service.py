@@ -3,262 +3,4074 @@
 Servicio que hace polling automático de colas SQS e invoca lambdas.
 Este servicio se ejecuta de forma continua en Docker y simula el comportamiento
 de AWS Lambda con event sources SQS.
+
+Los handlers se ejecutan en un pool de workers Node.js de larga duración: cada
+worker carga el handler una sola vez y recibe eventos por stdin, de modo que el
+arranque de Node y el bootstrap de NestJS solo se pagan al crear el worker.
+
+Al recibir SIGTERM/SIGINT deja de recibir mensajes, espera hasta DRAIN_TIMEOUT
+segundos a los handlers en curso y devuelve a la cola los que no terminaron.
+
+Con RECORD_FILE graba los batches recibidos para reproducirlos después con
+scripts/sqs-replay.py.
+
+Con TRACE_FILE escribe la traza de cada mensaje (receive, espera, worker,
+handler, ack) en formato Chrome trace-event; con TRACE_SLOW_FILE guarda solo
+las de los mensajes que superan TRACE_SLOW_MS.
+
+Con POLLER_PROCESSES > 1 (o "auto", un proceso por core) actúa como supervisor:
+reparte las colas entre procesos hijos que ejecutan este mismo script, los
+reinicia si terminan y agrega sus métricas y su estado en METRICS_PORT.
+
+RATE_LIMITS limita los mensajes por segundo de cada función con un token
+bucket (p. ej. para no superar los límites del gateway de pagos); los batches
+sin tokens esperan en el buffer local con su visibilidad extendida.
+
+Cada función tiene un circuit breaker: si la mayoría de sus mensajes fallan o
+tardan demasiado (p. ej. con DynamoDB Local caído) deja de recibir hasta que
+un batch de prueba termina bien, y las invocaciones simultáneas de cada cola
+se reducen a la mitad tras cada batch fallido y vuelven a subir de a una.
+
+Los logs de procesamiento (batches, acks, salida de los handlers) se escriben
+desde un thread propio; LOG_FORMAT=json los emite como un objeto por línea y
+LOG_SAMPLE escribe solo 1 de cada N registros de los batches exitosos.
+"""
+
+import boto3
+import asyncio
+import urllib.parse
+import http.server
+import json
+import re
+import collections
+import mmap
+import struct
+import zlib
+import hashlib
+import sys
+import time
+import subprocess
+import os
+import signal
+import queue
+import threading
+import random
+import math
+import itertools
+import traceback
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError
+
+# Utilidades compartidas con sqs-lambda-poller.py (mismo directorio); también
+# cuando las herramientas cargan este script con importlib desde otra ruta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sqs_lambda_events import parse_batch_item_failures
+
+try:
+    import yaml
+except ImportError:  # sin PyYAML se usa el mapeo de colas por defecto
+    yaml = None
+
+# Configuración
+LOCALSTACK_ENDPOINT = os.getenv("SQS_ENDPOINT", "http://localstack:4566")
+REGION = os.getenv("AWS_REGION", "us-east-1")
+POLL_INTERVAL = 2  # pausa máxima entre polls vacíos si el endpoint no respeta el long polling
+LONG_POLL_WAIT_SECONDS = 20  # WaitTimeSeconds del receive (máximo de SQS)
+POLL_BACKOFF_BASE = float(os.getenv("POLL_BACKOFF_BASE", "0.2"))  # backoff inicial tras un error
+POLL_BACKOFF_MAX = float(os.getenv("POLL_BACKOFF_MAX", "20"))  # backoff máximo tras errores consecutivos
+POLL_EWMA_ALPHA = 0.2  # peso de cada poll en las tasas de llenado y de error
+STATUS_LOG_INTERVAL = 100  # segundos entre logs de estado de cada cola
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # puerto HTTP de /metrics (0 lo deshabilita)
+QUEUE_DEPTH_INTERVAL = float(os.getenv("QUEUE_DEPTH_INTERVAL", "15"))  # segundos entre lecturas de profundidad de colas
+MAX_MESSAGES = min(max(int(os.getenv("SQS_BATCH_SIZE", "1")), 1), 10)  # batch size (1-10, límite de SQS)
+BACKEND_DIR = "/app/packages/backend"
+SERVERLESS_CONFIG = os.getenv("SERVERLESS_CONFIG", os.path.join(BACKEND_DIR, "serverless.yml"))  # mapeo cola -> función
+SERVERLESS_STAGE = os.getenv("STAGE", "")  # equivalente a --stage al resolver ${opt:stage}
+HANDLER_TIMEOUT = int(os.getenv("HANDLER_TIMEOUT", "0"))  # segundos máximos por invocación (0: el VisibilityTimeout de la cola)
+DEFAULT_VISIBILITY_TIMEOUT = 30  # VisibilityTimeout por defecto de SQS, si no se puede leer el de la cola
+MAX_VISIBILITY_TIMEOUT = 12 * 60 * 60  # SQS no permite extender la visibilidad más allá de 12 horas
+VISIBILITY_HEARTBEAT_RATIO = 1 / 3  # fracción del VisibilityTimeout entre extensiones de visibilidad
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "2"))  # workers Node por función
+WORKER_MAX_INVOCATIONS = int(os.getenv("WORKER_MAX_INVOCATIONS", "500"))  # reciclar tras N invocaciones
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "512"))  # reciclar si la memoria supera este límite
+WORKER_STARTUP_TIMEOUT = 60  # segundos para que un worker cargue el handler
+WORKER_MAX_MESSAGE_BYTES = 64 * 1024 * 1024  # tamaño máximo de una respuesta de worker (motor asyncio)
+POLLER_ENGINE = os.getenv("POLLER_ENGINE", "threads")  # "threads" o "asyncio"
+POLLER_PROCESSES = os.getenv("POLLER_PROCESSES", "1")  # procesos consumidores ("auto": uno por core disponible; 1: sin supervisor)
+POLLER_PROCESS = os.getenv("POLLER_PROCESS", "")  # número de proceso hijo (lo asigna el supervisor; vacío: proceso principal)
+POLLER_QUEUES = os.getenv("POLLER_QUEUES", "")  # colas que consume este proceso, separadas por coma (vacío: todas)
+SUPERVISOR_RESTART_BACKOFF = 1  # segundos antes de reiniciar un proceso hijo que terminó (se duplica si vuelve a terminar pronto)
+SUPERVISOR_RESTART_BACKOFF_MAX = 60  # espera máxima antes de reiniciar un proceso hijo
+SUPERVISOR_STABLE_SECONDS = 60  # un hijo que corrió al menos esto vuelve a reiniciarse sin espera acumulada
+SUPERVISOR_SCRAPE_TIMEOUT = 2  # segundos máximos para leer las métricas de cada hijo
+QUEUE_CONCURRENCY = int(os.getenv("QUEUE_CONCURRENCY", "2"))  # invocaciones simultáneas por cola
+QUEUE_RECEIVERS = int(os.getenv("QUEUE_RECEIVERS", "1"))  # threads de receive por cola
+PREFETCH_MESSAGES = int(os.getenv("PREFETCH_MESSAGES", "10"))  # mensajes recibidos por adelantado, esperando un handler libre
+QUEUE_MIN_CONCURRENCY = int(os.getenv("QUEUE_MIN_CONCURRENCY", "1"))  # mínimo al que puede bajar el autoscaling
+QUEUE_MAX_CONCURRENCY = int(os.getenv("QUEUE_MAX_CONCURRENCY", "8"))  # máximo al que puede subir el autoscaling
+AUTOSCALE_INTERVAL = float(os.getenv("AUTOSCALE_INTERVAL", "5"))  # segundos entre evaluaciones del autoscaling
+AUTOSCALE_UP_THRESHOLD = 1.0  # batches de backlog por invocación simultánea a partir de los cuales se escala hacia arriba
+AUTOSCALE_DOWN_THRESHOLD = 0.25  # batches de backlog por invocación simultánea bajo los cuales se escala hacia abajo
+AUTOSCALE_DOWN_CYCLES = 3  # evaluaciones seguidas bajo el umbral antes de reducir (histéresis)
+ACK_FLUSH_INTERVAL = float(os.getenv("ACK_FLUSH_INTERVAL", "0.1"))  # segundos máximos antes de enviar acks pendientes
+PARTITION_KEY_FIELDS = os.getenv("PARTITION_KEY_FIELDS", "transactionId")  # campos con la clave de orden (vacío: sin carriles)
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", "10000"))  # mensajes completados que se recuerdan por cola
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "3600"))  # segundos que se recuerda un mensaje completado (0 deshabilita la deduplicación)
+DEDUP_KEY_FIELDS = os.getenv("DEDUP_KEY_FIELDS", "idempotencyKey")  # campos con la clave de idempotencia del body
+FAILURE_VISIBILITY_TIMEOUT = int(os.getenv("FAILURE_VISIBILITY_TIMEOUT", "5"))  # reintento de mensajes fallidos (-1: esperar el timeout de la cola)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))  # segundos para que terminen los handlers en curso al detener el servicio
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))  # fracción de mensajes fallidos o lentos que abre el circuito de una función (0 lo deshabilita)
+CIRCUIT_MIN_MESSAGES = int(os.getenv("CIRCUIT_MIN_MESSAGES", "20"))  # mensajes mínimos en la ventana para evaluar la tasa
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "30"))  # segundos de la ventana móvil de resultados
+CIRCUIT_SLOW_SECONDS = float(os.getenv("CIRCUIT_SLOW_SECONDS", "0"))  # duración de un batch a partir de la cual cuenta como fallido (0: la mitad del handler timeout)
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "10"))  # pausa antes del batch de prueba (se duplica si la prueba falla)
+CIRCUIT_OPEN_MAX_SECONDS = 120  # pausa máxima con el circuito abierto
+CIRCUIT_WAIT_INTERVAL = 0.25  # segundos entre consultas de un batch que espera a que el circuito lo deje pasar
+AIMD_DECREASE_FACTOR = float(os.getenv("AIMD_DECREASE_FACTOR", "0.5"))  # factor de la concurrencia tras un batch fallido o lento (1 deshabilita la concurrencia adaptativa)
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")  # mensajes por segundo por función, "función=tasa[:burst]" separados por coma (p. ej. "processPayment=5:10")
+SQS_MAX_BATCH_ENTRIES = 10  # máximo de entradas por llamada batch de SQS
+RECORD_FILE = os.getenv("RECORD_FILE", "")  # archivo donde se graban los batches recibidos (vacío lo deshabilita)
+RECORD_FLUSH_INTERVAL = 1.0  # segundos máximos que un batch grabado queda en el buffer antes de escribirse
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # traza de cada mensaje en formato Chrome trace-event (vacío la deshabilita)
+TRACE_SLOW_FILE = os.getenv("TRACE_SLOW_FILE", "")  # JSON lines con las trazas de los mensajes lentos (vacío lo deshabilita)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))  # milisegundos de receive a ack a partir de los cuales un mensaje es lento
+TRACE_SLOW_MAX_BYTES = int(os.getenv("TRACE_SLOW_MAX_BYTES", str(10 * 1024 * 1024)))  # tamaño al que TRACE_SLOW_FILE rota a .1
+TRACE_MAX_PENDING = 50000  # trazas de mensajes sin terminar que se conservan (las más viejas se descartan)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" (legible) o "json" (un objeto por línea)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "debug")  # nivel mínimo de los logs de procesamiento: debug, info, warning o error
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")  # muestreo de los logs por batch, 1 de cada N por nivel (p. ej. "debug=100,info=10")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # registros esperando escritura (si se llena se descartan)
+LOG_BODY_PREVIEW = 500  # caracteres del body del primer mensaje que se loguean por batch
+WORKER_OUTPUT_LINES = int(os.getenv("WORKER_OUTPUT_LINES", "50"))  # últimas líneas de salida del handler que se adjuntan a un fallo
+WORKER_OUTPUT_MAX_LINE = int(os.getenv("WORKER_OUTPUT_MAX_LINE", "2000"))  # caracteres máximos por línea de salida del handler
+RUNNING = True
+
+# Mapeo de colas a funciones y handlers. Se reemplaza por los eventos sqs de
+# serverless.yml si el archivo existe y declara alguno (ver load_serverless_queue_handlers).
+QUEUE_HANDLERS = {
+    "dev-payments-queue": {
+        "function": "api",
+        "handler": "dist/main.handler",
+        "batch_size": MAX_MESSAGES,
+        "timeout": HANDLER_TIMEOUT,
+        "concurrency": QUEUE_CONCURRENCY,
+        "receivers": QUEUE_RECEIVERS,
+        "min_concurrency": QUEUE_MIN_CONCURRENCY,
+        "max_concurrency": QUEUE_MAX_CONCURRENCY,
+        "prefetch": PREFETCH_MESSAGES,
+        "partition_key": PARTITION_KEY_FIELDS,
+        "dedup_key": DEDUP_KEY_FIELDS
+    }
+}
+
+# Script del worker Node.js. Carga el handler una vez, lee peticiones JSON
+# (una por línea) desde stdin y escribe las respuestas en un descriptor de
+# archivo dedicado, para que los logs del handler en stdout no se mezclen
+# con el protocolo.
+NODE_WORKER_SCRIPT = r"""
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const { performance } = require('perf_hooks');
+
+const resultFd = Number(process.env.SQS_WORKER_RESULT_FD);
+const handlerFile = process.env.SQS_WORKER_HANDLER_FILE;
+const handlerFunction = process.env.SQS_WORKER_HANDLER_FUNCTION;
+
+function send(message) {
+  const data = Buffer.from(JSON.stringify(message) + '\n');
+  let offset = 0;
+  while (offset < data.length) {
+    offset += fs.writeSync(resultFd, data, offset, data.length - offset);
+  }
+}
+
+// Cambiar al directorio del backend para que las rutas relativas funcionen
+process.chdir(process.env.SQS_WORKER_BACKEND_DIR);
+const handler = require(handlerFile)[handlerFunction];
+if (typeof handler !== 'function') {
+  console.error(`✗ Handler function not found: ${handlerFunction}`);
+  process.exit(1);
+}
+
+// Spans que el handler reporta al poller con context.trace(nombre, fn, args) o
+// global.sqsPollerTrace. Las invocaciones son secuenciales, así que basta con
+// los spans de la invocación en curso. Timestamps en milisegundos epoch.
+const now = () => performance.timeOrigin + performance.now();
+let spans = null;
+
+async function trace(name, fn, args) {
+  if (spans === null) {
+    return fn();
+  }
+  const current = spans;
+  const started = now();
+  try {
+    return await fn();
+  } finally {
+    current.push({ name, ts: started, dur: now() - started, args });
+  }
+}
+global.sqsPollerTrace = trace;
+
+// Las llamadas del AWS SDK v3 (DynamoDB, SNS, ...) se registran como spans si
+// el backend usa @smithy/smithy-client sin empaquetar
+try {
+  const smithy = require(require.resolve('@smithy/smithy-client', { paths: [path.dirname(handlerFile)] }));
+  const send = smithy.Client.prototype.send;
+  smithy.Client.prototype.send = function (command, ...rest) {
+    if (spans === null || typeof rest[rest.length - 1] === 'function') {
+      return send.call(this, command, ...rest);
+    }
+    return trace(`${this.constructor.name}.${command.constructor.name}`, () => send.call(this, command, ...rest));
+  };
+} catch (error) {
+  // Sin AWS SDK resoluble solo quedan los spans que reporte el handler
+}
+
+async function run(request) {
+  const started = Date.now();
+  const startedAt = now();
+  spans = request.trace ? [] : null;
+  const context = {
+    functionName: handlerFunction,
+    awsRequestId: String(request.id),
+    callbackWaitsForEmptyEventLoop: false,
+    getRemainingTimeInMillis: () => Math.max(0, request.deadline - Date.now()),
+    trace,
+  };
+  const response = { id: request.id, ok: true, result: null };
+  try {
+    const result = await handler(request.event, context);
+    response.result = result === undefined ? null : result;
+  } catch (error) {
+    console.error('✗ Handler error:', error);
+    if (error && error.stack) {
+      console.error(error.stack);
+    }
+    response.ok = false;
+    response.error = String((error && error.message) || error);
+    response.errorType = (error && error.name) || 'Error';
+  }
+  response.durationMs = Date.now() - started;
+  response.rss = process.memoryUsage().rss;
+  if (spans !== null) {
+    response.startedAt = startedAt;
+    response.endedAt = now();
+    response.spans = spans;
+    spans = null;
+  }
+  try {
+    send(response);
+  } catch (error) {
+    // El resultado no es serializable: se reporta solo el estado
+    send({ id: response.id, ok: response.ok, result: null, error: response.error,
+           errorType: response.errorType, durationMs: response.durationMs, rss: response.rss });
+  }
+}
+
+let pending = Promise.resolve();
+readline
+  .createInterface({ input: process.stdin })
+  .on('line', (line) => {
+    if (!line.trim()) {
+      return;
+    }
+    const request = JSON.parse(line);
+    pending = pending.then(() => run(request));
+  })
+  .on('close', () => pending.then(() => process.exit(0)));
+
+send({ type: 'ready', rss: process.memoryUsage().rss });
 """
 
-import boto3
-import json
-import sys
-import time
-import subprocess
-import os
-import signal
-from botocore.exceptions import ClientError
+def signal_handler(sig, frame):
+    """
+    Maneja señales para cerrar limpiamente: la primera deja de recibir mensajes y
+    drena los consumidores (ver QueueConsumer.drain); una segunda sale de inmediato.
+    """
+    global RUNNING
+    if not RUNNING:
+        print("\nReceived second shutdown signal, exiting without draining", flush=True)
+        os._exit(1)
+    print(f"\nReceived shutdown signal, draining in-flight messages (up to {DRAIN_TIMEOUT:g}s)...", flush=True)
+    RUNNING = False
+
+signal.signal(signal.SIGINT, signal_handler)
+signal.signal(signal.SIGTERM, signal_handler)
+
+def create_sqs_event(records):
+    """Crea un evento SQS compatible con AWS Lambda."""
+    sqs_records = []
+    for record in records:
+        sqs_record = {
+            "messageId": record["MessageId"],
+            "receiptHandle": record["ReceiptHandle"],
+            "body": record["Body"],
+            "attributes": record.get("Attributes", {}),
+            "messageAttributes": record.get("MessageAttributes", {}),
+            "md5OfBody": record.get("MD5OfBody", ""),
+            "eventSource": "aws:sqs",
+            "eventSourceARN": record.get("Attributes", {}).get("ApproximateReceiveCount", ""),
+            "awsRegion": REGION
+        }
+        sqs_records.append(sqs_record)
+
+    return {"Records": sqs_records}
+
+# ---------------------------------------------------------------------------
+# Grabación de los batches recibidos, para reproducir el tráfico más tarde
+# (ver scripts/sqs-replay.py)
+# ---------------------------------------------------------------------------
+
+# Formato del archivo: RECORD_MAGIC y luego, por cada batch, un encabezado
+# (timestamp de recepción, largo del payload, crc32 del payload) seguido del
+# payload: JSON comprimido con zlib con la cola, la función, el handler y el
+# evento de create_sqs_event.
+RECORD_MAGIC = b"SQSREC1\n"
+RECORD_HEADER = struct.Struct("<dII")
+
+class EventRecorder:
+    """Agrega los batches recibidos a un archivo de grabación append-only."""
+
+    def __init__(self, path=RECORD_FILE):
+        self.path = path
+        self.enabled = bool(path)
+        self.recorded = 0
+        self._file = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, queue_name, function_name, handler, messages, received_at=None):
+        """Graba un batch recibido como el evento que recibiría el handler."""
+        if not self.enabled:
+            return
+        payload = zlib.compress(json.dumps({
+            "queue": queue_name,
+            "function": function_name,
+            "handler": handler,
+            "event": create_sqs_event(messages)
+        }, separators=(",", ":")).encode())
+        header = RECORD_HEADER.pack(received_at or time.time(), len(payload), zlib.crc32(payload))
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._open()
+                self._file.write(header + payload)
+                self.recorded += 1
+                now = time.monotonic()
+                if now - self._last_flush >= RECORD_FLUSH_INTERVAL:
+                    self._file.flush()
+                    self._last_flush = now
+        except OSError as e:
+            self.enabled = False
+            print(f"✗ Error writing record file {self.path}, recording disabled: {e}")
+
+    def _open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "ab")
+        if new_file:
+            self._file.write(RECORD_MAGIC)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def read_recorded_events(path):
+    """
+    Itera (timestamp, registro) de un archivo de grabación leyéndolo con mmap.
+    Un registro incompleto o corrupto al final (p. ej. el servicio se detuvo a
+    mitad de una escritura) termina la lectura con un aviso.
+    """
+    with open(path, "rb") as record_file:
+        if os.fstat(record_file.fileno()).st_size <= len(RECORD_MAGIC):
+            return
+        with mmap.mmap(record_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(RECORD_MAGIC)] != RECORD_MAGIC:
+                raise ValueError(f"{path} is not an SQS record file")
+            offset = len(RECORD_MAGIC)
+            while offset + RECORD_HEADER.size <= len(data):
+                timestamp, length, checksum = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                payload = data[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    print(f"⚠ Truncated or corrupt record at byte {offset} of {path}, stopping there")
+                    return
+                yield timestamp, json.loads(zlib.decompress(payload))
+                offset = start + length
+
+EVENT_RECORDER = EventRecorder()
+
+# ---------------------------------------------------------------------------
+# Trazas por mensaje: receive, espera, armado del evento, despacho al worker,
+# handler (con los spans que reporte) y ack, para saber si una latencia alta
+# viene de SQS, del arranque de workers o de lo que hace el handler
+# ---------------------------------------------------------------------------
+
+class MessageTrace:
+    """Spans (nombre, inicio, fin, args) de un mensaje, con timestamps time.time()."""
+
+    __slots__ = ("queue_name", "message_id", "spans", "mark")
+
+    def __init__(self, queue_name, message_id, mark):
+        self.queue_name = queue_name
+        self.message_id = message_id
+        self.spans = []
+        self.mark = mark  # fin de la última etapa registrada
+
+    def add(self, name, start, end, args=None):
+        self.spans.append((name, start, end, args))
+        self.mark = max(self.mark, end)
+
+class BatchTrace:
+    """Spans de una invocación, compartidos por todos los mensajes del batch."""
+
+    def __init__(self, tracer, queue_name, messages):
+        self.tracer = tracer
+        self.queue_name = queue_name
+        self.messages = messages
+        self.started = time.time()
+        self.spans = []
+
+    def span(self, name, start, end, **args):
+        self.spans.append((name, start, end, args or None))
+
+    def worker_response(self, start, end, response, worker_id):
+        """Round trip al worker, ejecución del handler y los spans que reportó el handler."""
+        self.span("worker.invoke", start, end, worker=worker_id)
+        if "startedAt" not in response:
+            return
+        self.span("handler", response["startedAt"] / 1000, response["endedAt"] / 1000, ok=response.get("ok"))
+        for span in response.get("spans") or []:
+            try:
+                args = span.get("args") if isinstance(span.get("args"), dict) else None
+                self.span(str(span["name"]), span["ts"] / 1000, (span["ts"] + span["dur"]) / 1000, **(args or {}))
+            except (KeyError, TypeError):
+                continue
+
+    def finish(self, failed):
+        """Cierra la parte del batch: los fallidos terminan aquí y los exitosos esperan su ack."""
+        self.tracer.finish_batch(self, failed, time.time())
+
+class NullTrace:
+    """BatchTrace sin efecto cuando el tracing está deshabilitado."""
+
+    def span(self, name, start, end, **args):
+        pass
+
+    def worker_response(self, start, end, response, worker_id):
+        pass
+
+    def finish(self, failed):
+        pass
+
+NULL_TRACE = NullTrace()
+
+class Tracer:
+    """
+    Arma la traza de cada mensaje desde el receive hasta el ack y la escribe en
+    TRACE_FILE (Chrome trace-event JSON, para chrome://tracing o Perfetto) y, si
+    supera TRACE_SLOW_MS, en TRACE_SLOW_FILE (JSON lines, rota a .1 al llegar a
+    TRACE_SLOW_MAX_BYTES).
+    """
+
+    def __init__(self, path=TRACE_FILE, slow_path=TRACE_SLOW_FILE, slow_ms=TRACE_SLOW_MS, slow_max_bytes=TRACE_SLOW_MAX_BYTES):
+        self.path = path
+        self.slow_path = slow_path
+        self.slow_ms = slow_ms
+        self.slow_max_bytes = slow_max_bytes
+        self.enabled = bool(path or slow_path)
+        self.traced = 0
+        self.slow = 0
+        self._pending = collections.OrderedDict()  # receipt handle -> MessageTrace
+        self._file = None
+        self._slow_file = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def received(self, queue_name, messages, start, end, receiver=None):
+        """Registra el receive de un batch como primer span de cada mensaje."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for message in messages:
+                trace = MessageTrace(queue_name, message["MessageId"], end)
+                trace.add("sqs.receive", start, end, {"receiver": receiver, "messages": len(messages)})
+                self._pending[message["ReceiptHandle"]] = trace
+            while len(self._pending) > TRACE_MAX_PENDING:
+                self._pending.popitem(last=False)
+
+    def batch(self, queue_name, messages):
+        """Inicia la traza de una invocación (NULL_TRACE si el tracing está deshabilitado)."""
+        if not self.enabled:
+            return NULL_TRACE
+        return BatchTrace(self, queue_name, messages)
+
+    def finish_batch(self, batch, failed, end):
+        completed = []
+        with self._lock:
+            for message in batch.messages:
+                trace = self._pending.pop(message["ReceiptHandle"], None)
+                if trace is None:
+                    trace = MessageTrace(batch.queue_name, message["MessageId"], batch.started)
+                # Prefetch, carril de su clave o handler libre
+                trace.add("wait", trace.mark, batch.started)
+                for name, start, span_end, args in batch.spans:
+                    trace.add(name, start, span_end, args)
+                if message["MessageId"] in failed:
+                    completed.append((trace, "failure", end))
+                else:
+                    trace.mark = end
+                    self._pending[message["ReceiptHandle"]] = trace
+        for trace, outcome, trace_end in completed:
+            self._write(trace, outcome, trace_end)
+
+    def acked(self, queue_name, messages, start, end):
+        """Cierra la traza de los mensajes confirmados con DeleteMessage(Batch)."""
+        if not self.enabled:
+            return
+        completed = []
+        with self._lock:
+            for message in messages:
+                trace = self._pending.pop(message["ReceiptHandle"], None)
+                if trace is not None:
+                    # Tiempo en el buffer del acker antes del flush
+                    trace.add("ack.wait", trace.mark, start)
+                    trace.add("sqs.delete", start, end, {"messages": len(messages)})
+                    completed.append(trace)
+        for trace in completed:
+            self._write(trace, "success", end)
+
+    def _write(self, trace, outcome, end):
+        begin = trace.spans[0][1] if trace.spans else end
+        total_ms = (end - begin) * 1000
+        try:
+            with self._lock:
+                self.traced += 1
+                if self.path:
+                    self._write_chrome(trace, outcome, begin, end, total_ms)
+                if self.slow_path and total_ms >= self.slow_ms:
+                    self.slow += 1
+                    self._write_slow(trace, outcome, begin, total_ms)
+                now = time.monotonic()
+                if now - self._last_flush >= RECORD_FLUSH_INTERVAL:
+                    for output in (self._file, self._slow_file):
+                        if output is not None:
+                            output.flush()
+                    self._last_flush = now
+        except OSError as e:
+            self.enabled = False
+            print(f"✗ Error writing traces, tracing disabled: {e}")
+
+    def _write_chrome(self, trace, outcome, begin, end, total_ms):
+        """
+        Un evento asíncrono por mensaje (id = MessageId) con sus etapas anidadas.
+        El archivo es un array JSON sin cerrar, que chrome://tracing y Perfetto aceptan.
+        """
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, "a")
+            if new_file:
+                self._file.write("[\n")
+                self._file.write(json.dumps({"name": "process_name", "ph": "M", "pid": os.getpid(),
+                                             "args": {"name": "sqs-poller"}}) + ",\n")
+        common = {"cat": trace.queue_name, "id": trace.message_id, "pid": os.getpid(), "tid": 0}
+        events = [dict(common, name="message", ph="b", ts=int(begin * 1e6),
+                       args={"queue": trace.queue_name, "messageId": trace.message_id,
+                             "outcome": outcome, "totalMs": round(total_ms, 3)})]
+        for name, start, span_end, args in trace.spans:
+            events.append(dict(common, name=name, ph="b", ts=int(start * 1e6), args=args or {}))
+            events.append(dict(common, name=name, ph="e", ts=int(max(start, span_end) * 1e6)))
+        events.append(dict(common, name="message", ph="e", ts=int(end * 1e6)))
+        self._file.write("".join(json.dumps(event, separators=(",", ":")) + ",\n" for event in events))
+
+    def _write_slow(self, trace, outcome, begin, total_ms):
+        if self._slow_file is None:
+            self._slow_file = open(self.slow_path, "a")
+        elif self._slow_file.tell() >= self.slow_max_bytes:
+            self._slow_file.close()
+            os.replace(self.slow_path, self.slow_path + ".1")
+            self._slow_file = open(self.slow_path, "a")
+        self._slow_file.write(json.dumps({
+            "timestamp": begin,
+            "queue": trace.queue_name,
+            "messageId": trace.message_id,
+            "outcome": outcome,
+            "totalMs": round(total_ms, 3),
+            "spans": [
+                {"name": name, "offsetMs": round((start - begin) * 1000, 3),
+                 "durationMs": round((span_end - start) * 1000, 3), **({"args": args} if args else {})}
+                for name, start, span_end, args in trace.spans
+            ],
+        }, separators=(",", ":")) + "\n")
+
+    def close(self):
+        with self._lock:
+            for output in (self._file, self._slow_file):
+                if output is not None:
+                    output.close()
+            self._file = self._slow_file = None
+
+TRACER = Tracer()
+
+# ---------------------------------------------------------------------------
+# Logs de procesamiento: se escriben desde un thread propio para que los
+# consumidores no esperen a stdout, con muestreo por nivel y salida en JSON
+# ---------------------------------------------------------------------------
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_WRITE_BATCH = 1000  # registros máximos por escritura (un solo flush por escritura)
+
+def parse_log_sample(spec):
+    """Interpreta LOG_SAMPLE ("debug=100,info=10") como {nivel: N}."""
+    rates = {}
+    for item in spec.split(","):
+        level, _, rate = item.partition("=")
+        level = level.strip().lower()
+        if level in LOG_LEVELS and rate.strip().isdigit():
+            rates[level] = max(1, int(rate))
+    return rates
+
+def format_log_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}Z"
+
+class LogWriter:
+    """
+    Cola acotada de registros que un thread escribe en stdout por tandas. Quien
+    loguea nunca espera: si la cola está llena el registro se descarta y se
+    cuenta. Los registros con `sample=True` (los de cada batch exitoso) se
+    escriben 1 de cada N según LOG_SAMPLE; advertencias y errores se escriben
+    siempre salvo que LOG_SAMPLE los incluya.
+
+    Con LOG_FORMAT=text se escribe el mensaje tal cual (o `text`, si se pasa);
+    con json, un objeto por línea con time, level, message y los campos.
+    """
+
+    def __init__(self, fmt=LOG_FORMAT, level=LOG_LEVEL, sample=LOG_SAMPLE, queue_size=LOG_QUEUE_SIZE):
+        self.json = fmt.lower() == "json"
+        self.level = LOG_LEVELS.get(level.lower(), LOG_LEVELS["debug"])
+        self.sample_rates = parse_log_sample(sample)
+        self._sample_counters = {name: itertools.count() for name in LOG_LEVELS}
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._dropped = 0  # descartados desde el último aviso
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enabled(self, level):
+        return LOG_LEVELS[level] >= self.level
+
+    def sample(self, level):
+        """True si el próximo registro muestreado de `level` debe escribirse."""
+        if not self.enabled(level):
+            return False
+        rate = self.sample_rates.get(level, 1)
+        if rate == 1 or next(self._sample_counters[level]) % rate == 0:
+            return True
+        LOG_RECORDS_TOTAL.inc(level=level, result="sampled")
+        return False
+
+    def log(self, level, message, text=None, sample=False, **fields):
+        if not (self.sample(level) if sample else self.enabled(level)):
+            return
+        try:
+            self._queue.put_nowait((time.time(), level, message, text, fields))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            LOG_RECORDS_TOTAL.inc(level=level, result="dropped")
+            return
+        if self._thread is None:
+            self._start()
+
+    def debug(self, message, **kwargs):
+        self.log("debug", message, **kwargs)
+
+    def info(self, message, **kwargs):
+        self.log("info", message, **kwargs)
+
+    def warning(self, message, **kwargs):
+        self.log("warning", message, **kwargs)
+
+    def error(self, message, **kwargs):
+        self.log("error", message, **kwargs)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            while len(records) < LOG_WRITE_BATCH:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(records)
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+    def _write(self, records):
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            records.insert(0, (time.time(), "warning", f"⚠ {dropped} log record(s) dropped, the log queue is full",
+                               None, {"dropped": dropped}))
+        lines = [self._format(*record) for record in records]
+        for _, level, _, _, _ in records:
+            LOG_RECORDS_TOTAL.inc(level=level, result="written")
+        try:
+            # sys.stdout se resuelve en cada escritura (el benchmark lo redirige)
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+        except (OSError, ValueError):
+            pass
+
+    def _format(self, timestamp, level, message, text, fields):
+        if not self.json:
+            return message if text is None else text
+        return json.dumps({"time": format_log_time(timestamp), "level": level, "message": message.strip(), **fields},
+                          ensure_ascii=False, default=str)
+
+    def flush(self, timeout=5):
+        """Espera hasta `timeout` segundos a que se escriban los registros encolados."""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        self.flush()
+
+LOG = LogWriter()
+
+# ---------------------------------------------------------------------------
+# Mapeo de colas desde serverless.yml: eventos sqs de cada función (y los de
+# custom.sqsPoller, que solo usa el poller local y no se despliegan)
+# ---------------------------------------------------------------------------
+
+SERVERLESS_VARIABLE = re.compile(r"\$\{([^${}]+)\}")
+
+if yaml is not None:
+    class ServerlessLoader(yaml.SafeLoader):
+        """SafeLoader que acepta los tags de CloudFormation (!Ref, !GetAtt, !Sub...)."""
+
+    def construct_cloudformation_tag(loader, tag_suffix, node):
+        """Convierte `!Tag valor` a su forma larga {"Ref": ...} / {"Fn::Tag": ...}."""
+        if isinstance(node, yaml.ScalarNode):
+            value = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node, deep=True)
+        else:
+            value = loader.construct_mapping(node, deep=True)
+        if tag_suffix == "Ref":
+            return {"Ref": value}
+        if tag_suffix == "GetAtt" and isinstance(value, str):
+            value = value.split(".", 1)
+        return {f"Fn::{tag_suffix}": value}
+
+    ServerlessLoader.add_multi_constructor("!", construct_cloudformation_tag)
+
+def resolve_serverless_variables(value, document):
+    """
+    Resuelve las variables ${self:...}, ${opt:stage} y ${env:...} de un valor,
+    incluidas las anidadas y los valores por defecto (`${env:X, 'dev'}`).
+    """
+    if not isinstance(value, str):
+        return value
+
+    def resolve(match):
+        source, _, default = match.group(1).partition(",")
+        source = source.strip()
+        default = default.strip().strip("'\"")
+        if source.startswith("self:"):
+            node = document
+            for key in source[len("self:"):].split("."):
+                node = node.get(key) if isinstance(node, dict) else None
+            resolved = resolve_serverless_variables(node, document) if node is not None else None
+        elif source == "opt:stage":
+            resolved = SERVERLESS_STAGE or None
+        elif source.startswith("env:"):
+            resolved = os.getenv(source[len("env:"):])
+        else:
+            # Variables de CloudFormation (${AWS::Region}, ${Var} de Fn::Sub): se dejan intactas
+            return match.group(0)
+        return str(resolved) if resolved not in (None, "") else default
+
+    # Resolver de adentro hacia afuera hasta que no queden variables
+    while True:
+        resolved = SERVERLESS_VARIABLE.sub(resolve, value)
+        if resolved == value:
+            return resolved
+        value = resolved
+
+def resolve_queue_name(arn, document):
+    """Nombre de la cola de un evento sqs: ARN literal, !GetAtt Cola.Arn o !Sub."""
+    if isinstance(arn, dict) and "Fn::GetAtt" in arn:
+        logical_id = arn["Fn::GetAtt"][0]
+        resource = document.get("resources", {}).get("Resources", {}).get(logical_id, {})
+        queue_name = resource.get("Properties", {}).get("QueueName")
+        return resolve_serverless_variables(queue_name, document) if queue_name else None
+    if isinstance(arn, dict) and "Fn::Sub" in arn:
+        arn = arn["Fn::Sub"]
+    if isinstance(arn, str):
+        return resolve_serverless_variables(arn, document).split(":")[-1]
+    return None
+
+def get_sqs_events(events):
+    """Eventos sqs de una lista de eventos de serverless (`- sqs: arn` o `- sqs: {arn: ...}`)."""
+    for event in events or []:
+        if isinstance(event, dict) and "sqs" in event:
+            sqs = event["sqs"]
+            yield sqs if isinstance(sqs, dict) else {"arn": sqs}
+
+def read_serverless_config(path=SERVERLESS_CONFIG):
+    """Lee serverless.yml; retorna None si no existe o no se puede leer."""
+    if not os.path.exists(path):
+        return None
+    if yaml is None:
+        print(f"⚠ PyYAML is not installed, ignoring {path}", flush=True)
+        return None
+    try:
+        with open(path) as f:
+            return yaml.load(f, Loader=ServerlessLoader) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"✗ Error reading {path}: {e}", flush=True)
+        return None
+
+def load_serverless_queue_handlers(path=SERVERLESS_CONFIG):
+    """
+    Construye el mapeo cola -> función a partir de serverless.yml: batchSize,
+    maximumConcurrency y el timeout de cada función (o el del provider).
+    Retorna None si el archivo no existe, no se puede leer o no declara colas.
+    """
+    document = read_serverless_config(path)
+    if document is None:
+        return None
+
+    provider = document.get("provider", {})
+    functions = document.get("functions", {}) or {}
+    local_events = (document.get("custom", {}) or {}).get("sqsPoller", {}) or {}
+    queue_handlers = {}
+    for function_name, function in functions.items():
+        events = list(get_sqs_events(function.get("events"))) + list(get_sqs_events(local_events.get(function_name)))
+        for event in events:
+            queue_name = resolve_queue_name(event.get("arn"), document)
+            if not queue_name:
+                print(f"⚠ Could not resolve the queue of an sqs event of {function_name}, skipping", flush=True)
+                continue
+            if event.get("enabled") is False:
+                continue
+
+            max_concurrency = int(event.get("maximumConcurrency") or QUEUE_MAX_CONCURRENCY)
+            if function.get("reservedConcurrency"):
+                max_concurrency = min(max_concurrency, int(function["reservedConcurrency"]))
+            max_concurrency = max(1, max_concurrency)
+            queue_handlers[queue_name] = {
+                "function": function_name,
+                "handler": function["handler"],
+                "batch_size": int(event.get("batchSize") or MAX_MESSAGES),
+                "timeout": int(HANDLER_TIMEOUT or function.get("timeout") or provider.get("timeout") or 0),
+                "concurrency": min(QUEUE_CONCURRENCY, max_concurrency),
+                "receivers": QUEUE_RECEIVERS,
+                "min_concurrency": min(QUEUE_MIN_CONCURRENCY, max_concurrency),
+                "max_concurrency": max_concurrency,
+                "prefetch": PREFETCH_MESSAGES,
+                "partition_key": PARTITION_KEY_FIELDS,
+                "dedup_key": DEDUP_KEY_FIELDS
+            }
+            if function.get("reservedConcurrency"):
+                queue_handlers[queue_name]["reserved_concurrency"] = int(function["reservedConcurrency"])
+    return queue_handlers or None
+
+# ---------------------------------------------------------------------------
+# Métricas en formato de texto de Prometheus, servidas por HTTP en METRICS_PORT
+# ---------------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+AGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+def format_labels(labels):
+    """Formatea las etiquetas como {k="v",...} escapando los valores."""
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class Metric:
+    """Métrica con etiquetas; los valores se guardan por tupla de etiquetas ordenadas."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Registro de métricas. Los collectors se ejecutan antes de cada scrape para refrescar gauges."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                print(f"✗ Error collecting metrics: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+RECEIVE_DURATION = METRICS.histogram("sqs_poller_receive_duration_seconds", "Duration of ReceiveMessage calls")
+HANDLER_DURATION = METRICS.histogram("sqs_poller_handler_duration_seconds", "Duration of handler invocations per batch")
+MESSAGES_TOTAL = METRICS.counter("sqs_poller_messages_total", "Messages processed by result (success or failure)")
+BATCHES_TOTAL = METRICS.counter("sqs_poller_batches_total", "Batches dispatched to handlers")
+RECEIVE_ERRORS_TOTAL = METRICS.counter("sqs_poller_receive_errors_total", "Failed ReceiveMessage calls")
+MESSAGE_AGE = METRICS.histogram("sqs_poller_message_age_seconds", "Message age at receive time (now - SentTimestamp)", AGE_BUCKETS)
+MESSAGE_LAG = METRICS.histogram("sqs_poller_end_to_end_lag_seconds", "Time from SentTimestamp until the handler finished", AGE_BUCKETS)
+QUEUE_MESSAGES = METRICS.gauge("sqs_poller_queue_messages", "ApproximateNumberOfMessages per queue")
+QUEUE_MESSAGES_NOT_VISIBLE = METRICS.gauge("sqs_poller_queue_messages_not_visible", "ApproximateNumberOfMessagesNotVisible per queue")
+CONCURRENCY = METRICS.gauge("sqs_poller_concurrency", "Current concurrent handler invocations allowed per queue")
+IN_FLIGHT = METRICS.gauge("sqs_poller_in_flight_messages", "Messages received and not yet settled")
+SCHEDULER_STATE = METRICS.gauge("sqs_poller_scheduler", "Poll scheduler state (fill_rate, error_rate, consecutive_empty, consecutive_errors, last_delay)")
+VISIBILITY_EXTENSIONS_TOTAL = METRICS.counter("sqs_poller_visibility_extensions_total", "Visibility timeout extensions sent for messages still being processed")
+PARTITION_LANES = METRICS.gauge("sqs_poller_partition_lanes", "Partition keys with a batch running (active) and batches waiting behind them (waiting)")
+DEDUP_TOTAL = METRICS.counter("sqs_poller_dedup_total", "Deduplication cache lookups by result (hit: acked without invoking the handler)")
+DEDUP_CACHE_ENTRIES = METRICS.gauge("sqs_poller_dedup_cache_entries", "Completed message keys remembered by the deduplication cache")
+WORKERS_TOTAL = METRICS.gauge("sqs_poller_workers", "Node workers per function by state (alive, recycled, crashed)")
+CIRCUIT_STATE = METRICS.gauge("sqs_poller_circuit_state", "Circuit breaker state per function (0 closed, 1 half-open, 2 open)")
+CIRCUIT_TRANSITIONS_TOTAL = METRICS.counter("sqs_poller_circuit_transitions_total", "Circuit breaker state changes per function")
+PROCESS_UP = METRICS.gauge("sqs_poller_process_up", "Poller child processes running and answering metrics scrapes (multi-process mode)")
+PROCESS_RESTARTS_TOTAL = METRICS.counter("sqs_poller_process_restarts_total", "Poller child processes restarted by the supervisor")
+THROTTLE_DURATION = METRICS.histogram("sqs_poller_throttle_duration_seconds", "Time invocations waited for rate limit tokens per function (only throttled ones)")
+LOG_RECORDS_TOTAL = METRICS.counter("sqs_poller_log_records_total", "Log records by level and result (written, sampled out or dropped because the log queue was full)")
+
+def message_age_seconds(message, now=None):
+    """Edad del mensaje según el atributo SentTimestamp (milisegundos epoch)."""
+    sent = message.get("Attributes", {}).get("SentTimestamp")
+    if not sent:
+        return None
+    return max(0.0, (now or time.time()) - int(sent) / 1000)
+
+def observe_receive(queue_name, messages, duration):
+    """Registra la latencia del receive y la edad de los mensajes recibidos."""
+    RECEIVE_DURATION.observe(duration, queue=queue_name)
+    now = time.time()
+    for message in messages:
+        age = message_age_seconds(message, now)
+        if age is not None:
+            MESSAGE_AGE.observe(age, queue=queue_name)
+
+def observe_batch(queue_name, handler, messages, failed, duration):
+    """Registra la duración del handler, los resultados y el lag end-to-end de un batch."""
+    HANDLER_DURATION.observe(duration, queue=queue_name, handler=handler)
+    BATCHES_TOTAL.inc(queue=queue_name)
+    now = time.time()
+    for message in messages:
+        result = "failure" if message["MessageId"] in failed else "success"
+        MESSAGES_TOTAL.inc(queue=queue_name, result=result)
+        age = message_age_seconds(message, now)
+        if age is not None and result == "success":
+            MESSAGE_LAG.observe(age, queue=queue_name)
+
+def collect_consumer_metrics(consumer):
+    """Collector con el estado del scheduler y los mensajes en vuelo de un consumidor."""
+    def collect():
+        IN_FLIGHT.set(consumer.limiter.in_flight, queue=consumer.queue_name)
+        CONCURRENCY.set(consumer.effective_concurrency, queue=consumer.queue_name)
+        active, waiting = consumer.lanes.snapshot()
+        PARTITION_LANES.set(active, queue=consumer.queue_name, state="active")
+        PARTITION_LANES.set(waiting, queue=consumer.queue_name, state="waiting")
+        DEDUP_CACHE_ENTRIES.set(len(consumer.dedup), queue=consumer.queue_name)
+        for field, value in consumer.scheduler.snapshot().items():
+            if field in ("fill_rate", "error_rate", "consecutive_empty", "consecutive_errors", "last_delay"):
+                SCHEDULER_STATE.set(value, queue=consumer.queue_name, field=field)
+    return collect
+
+def collect_pool_metrics(pool):
+    """Collector con el estado de los workers de un pool."""
+    def collect():
+        alive = sum(1 for worker in list(pool._workers) if worker.alive)
+        WORKERS_TOTAL.set(alive, function=pool.function_name, handler=pool.handler_path, state="alive")
+        WORKERS_TOTAL.set(pool.recycled, function=pool.function_name, handler=pool.handler_path, state="recycled")
+        WORKERS_TOTAL.set(pool.crashed, function=pool.function_name, handler=pool.handler_path, state="crashed")
+    return collect
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Sirve /metrics en formato de texto de Prometheus y /health."""
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, "text/plain; version=0.0.4; charset=utf-8", self.render_metrics())
+        elif path == "/health":
+            healthy, status = self.health()
+            self._send(200 if healthy else 503, "application/json", json.dumps(status))
+        else:
+            self.send_error(404)
+
+    def render_metrics(self):
+        return METRICS.render()
+
+    def health(self):
+        return RUNNING, {"status": "ok" if RUNNING else "draining"}
+
+    def _send(self, status, content_type, text):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Los scrapes no deben ensuciar el log del servicio
+        pass
+
+def start_metrics_server(port=METRICS_PORT, handler=MetricsRequestHandler):
+    """Inicia el servidor de métricas en un thread; port 0 lo deshabilita."""
+    if not port:
+        return None
+    try:
+        server = http.server.ThreadingHTTPServer(("0.0.0.0", port), handler)
+    except OSError as e:
+        print(f"⚠ Metrics server could not listen on port {port}: {e}", flush=True)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"✓ Metrics available at http://0.0.0.0:{port}/metrics", flush=True)
+    return server
+
+class QueueDepthMonitor:
+    """Consulta periódicamente la profundidad de cada cola (ApproximateNumberOfMessages[NotVisible])."""
+
+    def __init__(self, sqs_client, queue_urls, interval=QUEUE_DEPTH_INTERVAL):
+        self.sqs_client = sqs_client
+        self.queue_urls = queue_urls
+        self.interval = interval
+        self.depths = {}
+        self.listeners = []
+
+    def start(self):
+        threading.Thread(target=self._loop, name="queue-depth-monitor", daemon=True).start()
+
+    def add_listener(self, listener):
+        """Registra una función que recibe las profundidades tras cada lectura."""
+        self.listeners.append(listener)
+
+    def refresh(self):
+        for queue_name, queue_url in self.queue_urls.items():
+            try:
+                attributes = self.sqs_client.get_queue_attributes(
+                    QueueUrl=queue_url,
+                    AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"]
+                )["Attributes"]
+            except ClientError as e:
+                print(f"✗ Error reading attributes of {queue_name}: {e}")
+                continue
+            visible = int(attributes.get("ApproximateNumberOfMessages", 0))
+            not_visible = int(attributes.get("ApproximateNumberOfMessagesNotVisible", 0))
+            QUEUE_MESSAGES.set(visible, queue=queue_name)
+            QUEUE_MESSAGES_NOT_VISIBLE.set(not_visible, queue=queue_name)
+            self.depths[queue_name] = (visible, not_visible)
+        for listener in self.listeners:
+            listener(dict(self.depths))
+
+    def _loop(self):
+        while RUNNING:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"✗ Error monitoring queue depth: {e}")
+            time.sleep(self.interval)
+
+def write_worker_script():
+    """
+    Escribe el script del worker Node.js en /tmp (escribible) y retorna su ruta.
+    El nombre lleva un hash del contenido: un /tmp que sobrevive a una
+    actualización de la imagen nunca reutiliza un script de otra versión.
+    """
+    digest = hashlib.sha256(NODE_WORKER_SCRIPT.encode()).hexdigest()[:16]
+    script_path = os.path.join("/tmp", f"sqs_worker_{digest}.js")
+    if not os.path.exists(script_path):
+        # Escritura atómica: otro proceso del supervisor puede estar lanzando workers
+        temp_path = f"{script_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(NODE_WORKER_SCRIPT)
+        os.replace(temp_path, script_path)
+    return script_path
+
+def resolve_handler_file(backend_dir, handler_path):
+    """Separa el handler en archivo y función y verifica que el archivo exista."""
+    handler_file, handler_function = handler_path.rsplit(".", 1)
+    handler_file_path = os.path.join(backend_dir, handler_file + ".js")
+
+    if not os.path.exists(handler_file_path):
+        print(f"✗ Error: Handler file not found: {handler_file_path}")
+        # Listar archivos en el directorio para debugging
+        handler_dir = os.path.dirname(handler_file_path)
+        if os.path.exists(handler_dir):
+            print(f"    Directory exists: {handler_dir}")
+            try:
+                files = os.listdir(handler_dir)
+                print(f"    Files in directory: {files[:10]}")  # Primeros 10
+            except:
+                pass
+        return None, None
+
+    # Usar la ruta absoluta del handler directamente, normalizada para Windows/Linux
+    return handler_file_path.replace("\\", "/"), handler_function
+
+def build_node_command(backend_dir, script_path):
+    """Construye el comando Node.js pre-cargando reflect-metadata si está disponible."""
+    reflect_metadata_candidates = [
+        "/app/node_modules/reflect-metadata",
+        f"{backend_dir}/node_modules/reflect-metadata",
+        "/app/packages/backend/node_modules/reflect-metadata",
+    ]
+    cmd = ["node"]
+    for candidate in reflect_metadata_candidates:
+        if os.path.exists(candidate):
+            cmd += ["-r", candidate]
+            break
+    cmd.append(script_path)
+    return cmd
+
+def build_node_env(backend_dir):
+    """Pasa TODAS las variables de entorno del contenedor al proceso Node.js."""
+    env = os.environ.copy()
+    env["NODE_ENV"] = "development"
+    # NODE_PATH debe incluir TODAS las ubicaciones posibles de node_modules
+    env["NODE_PATH"] = f"/app/node_modules:/app/packages/backend/node_modules:{backend_dir}/node_modules:{backend_dir}:/app/packages/backend/dist"
+    return env
+
+def build_worker_env(backend_dir, handler_file, handler_function, result_fd):
+    """Entorno del worker: el de Node más el handler a cargar y el fd por el que responde."""
+    env = build_node_env(backend_dir)
+    env["SQS_WORKER_RESULT_FD"] = str(result_fd)
+    env["SQS_WORKER_HANDLER_FILE"] = handler_file
+    env["SQS_WORKER_HANDLER_FUNCTION"] = handler_function
+    env["SQS_WORKER_BACKEND_DIR"] = backend_dir
+    return env
+
+class NodeWorker:
+    """Proceso Node.js de larga duración que ejecuta un handler de Lambda."""
+
+    def __init__(self, worker_id, backend_dir, handler_path):
+        self.worker_id = worker_id
+        self.backend_dir = backend_dir
+        self.handler_path = handler_path
+        self.invocations = 0
+        self.rss = 0
+        self.process = None
+        self.killed = False
+        self.output = collections.deque(maxlen=WORKER_OUTPUT_LINES)  # últimas líneas de la invocación en curso
+        self.log_output = True  # si la salida de la invocación en curso se loguea (LOG_SAMPLE)
+        self._responses = queue.Queue()
+        self._next_request_id = 0
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Lanza el proceso y espera a que el handler esté cargado."""
+        handler_file, handler_function = resolve_handler_file(self.backend_dir, self.handler_path)
+        if handler_file is None:
+            return False
+
+        read_fd, write_fd = os.pipe()
+        env = build_worker_env(self.backend_dir, handler_file, handler_function, write_fd)
+
+        try:
+            self.process = subprocess.Popen(
+                build_node_command(self.backend_dir, write_worker_script()),
+                cwd=self.backend_dir,  # Working directory del backend
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=env,
+                pass_fds=(write_fd,),
+                text=True,
+                bufsize=1
+            )
+        finally:
+            os.close(write_fd)
+
+        threading.Thread(target=self._read_responses, args=(os.fdopen(read_fd, "rb"),), daemon=True).start()
+        threading.Thread(target=self._forward_output, daemon=True).start()
+
+        try:
+            ready = self._responses.get(timeout=WORKER_STARTUP_TIMEOUT)
+        except queue.Empty:
+            ready = None
+        if not self._loaded(ready):
+            self.stop()
+            return False
+        return True
+
+    def _loaded(self, ready):
+        """Verifica el mensaje "ready" con el que el worker confirma que cargó el handler."""
+        if not ready or ready.get("type") != "ready":
+            print(f"✗ Worker {self.worker_id} failed to load {self.handler_path}")
+            return False
+        self.rss = ready.get("rss", 0)
+        print(f"  ✓ Worker {self.worker_id} ready (pid {self.process.pid}, {self.handler_path})")
+        return True
+
+    def _read_responses(self, results):
+        """Lee las respuestas del worker; None indica que el proceso terminó."""
+        with results:
+            for line in results:
+                try:
+                    self._responses.put(json.loads(line))
+                except ValueError:
+                    continue
+        self._responses.put(None)
+
+    def _forward_output(self):
+        """Reenvía stdout/stderr del handler al log del servicio y guarda las últimas líneas."""
+        for line in self.process.stdout:
+            self._capture_output(line.rstrip())
+
+    def _capture_output(self, text):
+        text = text[:WORKER_OUTPUT_MAX_LINE]
+        if text.strip():
+            self.output.append(text)
+            if self.log_output:
+                LOG.debug(f"  [worker {self.worker_id}] {text}", worker=self.worker_id, handler=self.handler_path)
+
+    def invoke(self, event, timeout, trace=False):
+        """Envía un evento al worker y espera su respuesta (con los spans del handler si `trace`)."""
+        request_id, request = self._new_request(event, timeout, trace)
+        try:
+            self.process.stdin.write(request)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            return {"ok": False, "error": f"worker {self.worker_id} is not accepting requests: {e}"}
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                response = self._responses.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                # Node no puede cancelar la promesa del handler: se descarta el worker
+                self.kill()
+                return {"ok": False, "error": f"handler execution timed out (>{timeout}s)", "timedOut": True}
+            if response is None:
+                try:
+                    exit_code = self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    exit_code = None
+                return {"ok": False, "error": f"worker {self.worker_id} exited with code {exit_code}"}
+            if response.get("id") == request_id:
+                self.rss = response.get("rss", self.rss)
+                return response
+
+    def _new_request(self, event, timeout, trace):
+        """Prepara la siguiente invocación y retorna (id, línea JSON del request)."""
+        self.invocations += 1
+        self.output.clear()
+        self.log_output = LOG.sample("debug")
+        self._next_request_id += 1
+        request = {
+            "id": self._next_request_id,
+            "event": event,
+            "deadline": int((time.time() + timeout) * 1000),
+            "trace": trace
+        }
+        return self._next_request_id, json.dumps(request) + "\n"
+
+    def kill(self):
+        """Termina el proceso inmediatamente (p. ej. tras un timeout)."""
+        self.killed = True
+        if self.alive:
+            self.process.kill()
+            self.process.wait()
+
+    def stop(self):
+        """Detiene el proceso del worker."""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+class WorkerPool:
+    """
+    Pool de workers Node.js para una función. Los workers se crean bajo demanda
+    hasta `size`, se reciclan tras `max_invocations` invocaciones o cuando su RSS
+    supera `max_rss_mb`, y se reemplazan si el proceso termina inesperadamente.
+    """
+
+    def __init__(self, handler_path, backend_dir=BACKEND_DIR, size=WORKER_POOL_SIZE,
+                 max_invocations=WORKER_MAX_INVOCATIONS, max_rss_mb=WORKER_MAX_RSS_MB, function_name=None):
+        self.handler_path = handler_path
+        self.function_name = function_name or handler_path
+        self.backend_dir = backend_dir
+        self.size = max(1, size)
+        self.max_invocations = max_invocations
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._busy = set()
+        self._spawned = 0
+        self.recycled = 0
+        self.crashed = 0
+        self.closed = False
+        METRICS.add_collector(collect_pool_metrics(self))
+
+    def start(self):
+        """Pre-carga todos los workers para no pagar el arranque en el primer mensaje."""
+        for _ in range(self.size):
+            worker = self._spawn()
+            if worker is None:
+                return False
+            self._idle.put(worker)
+        return True
+
+    def resize(self, size):
+        """Ajusta el tamaño del pool; los workers sobrantes se detienen al quedar libres."""
+        self.size = max(1, size)
+        while True:
+            with self._lock:
+                if len(self._workers) <= self.size:
+                    return
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker is None:
+                self._idle.put(None)
+                return
+            self._retire(worker)
+
+    def _spawn(self):
+        with self._lock:
+            self._spawned += 1
+            worker = NodeWorker(self._spawned, self.backend_dir, self.handler_path)
+            self._workers.add(worker)
+        if worker.start():
+            return worker
+        with self._lock:
+            self._workers.discard(worker)
+        return None
+
+    def _acquire(self):
+        while True:
+            if self.closed:
+                return None
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_spawn = len(self._workers) < self.size
+                if can_spawn:
+                    return self._spawn()
+                worker = self._idle.get()
+            if worker is None:
+                # Pool detenido: se despierta también al siguiente que espera un worker
+                self._idle.put(None)
+                return None
+            if worker.alive:
+                return worker
+            # El worker murió estando inactivo: se reemplaza
+            self._retire(worker, crashed=True)
+
+    def _retire(self, worker, crashed=False):
+        worker.stop()
+        with self._lock:
+            self._workers.discard(worker)
+        self._count_retired(worker, crashed)
+
+    def _count_retired(self, worker, crashed):
+        if crashed:
+            self.crashed += 1
+            LOG.warning(f"⚠ Worker {worker.worker_id} for {self.handler_path} crashed, it will be restarted",
+                        worker=worker.worker_id, handler=self.handler_path)
+        else:
+            self.recycled += 1
+
+    def _release_action(self, worker):
+        """
+        Qué hacer con un worker que terminó una invocación: "idle" si vuelve a
+        quedar libre, "crashed" si el proceso terminó inesperadamente o "retire"
+        si se detiene (terminado a propósito, reciclado o sobrante del pool).
+        """
+        if not worker.alive:
+            return "retire" if worker.killed or self.closed else "crashed"
+        if worker.invocations >= self.max_invocations or worker.rss > self.max_rss_bytes:
+            LOG.info(f"  ↻ Recycling worker {worker.worker_id} ({worker.invocations} invocations, {worker.rss // (1024 * 1024)} MB)",
+                     worker=worker.worker_id, handler=self.handler_path, invocations=worker.invocations, rss=worker.rss)
+            return "retire"
+        if len(self._workers) > self.size:
+            # El pool se redujo mientras el worker estaba ocupado
+            return "retire"
+        return "idle"
+
+    def _release(self, worker):
+        action = self._release_action(worker)
+        if action == "idle":
+            self._idle.put(worker)
+        else:
+            self._retire(worker, crashed=action == "crashed")
+
+    def invoke(self, event, timeout, trace=NULL_TRACE):
+        """Ejecuta el handler con el evento en un worker libre."""
+        acquire_started = time.time()
+        worker = self._acquire()
+        if worker is None:
+            return {"ok": False, "error": f"could not start a worker for {self.handler_path}"}
+        with self._lock:
+            self._busy.add(worker)
+        try:
+            # Incluye el arranque del worker si no había uno libre y el pool podía crecer
+            trace.span("worker.acquire", acquire_started, time.time(), worker=worker.worker_id)
+            invoke_started = time.time()
+            response = worker.invoke(event, timeout, trace is not NULL_TRACE)
+            trace.worker_response(invoke_started, time.time(), response, worker.worker_id)
+            return dict(response, output=list(worker.output), outputLogged=worker.log_output)
+        finally:
+            with self._lock:
+                self._busy.discard(worker)
+            self._release(worker)
+
+    def kill_busy(self):
+        """
+        Termina los workers que están ejecutando un handler (al vencer el plazo del
+        drenaje, antes de devolver sus mensajes a la cola). Retorna cuántos terminó.
+        """
+        with self._lock:
+            busy = list(self._busy)
+        for worker in busy:
+            worker.kill()
+        return len(busy)
+
+    def shutdown(self):
+        """Detiene todos los workers del pool; las invocaciones que esperan un worker fallan."""
+        with self._lock:
+            self.closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        self._idle.put(None)
+        for worker in workers:
+            worker.stop()
+
+def get_batch_size(config):
+    """Batch size de la cola, acotado al máximo de 10 mensajes que permite SQS."""
+    return min(max(int(config.get("batch_size", MAX_MESSAGES)), 1), 10)
+
+def log_handler_failure(level, message, response, failed):
+    """
+    Log de un batch con fallos, con las últimas líneas de salida del handler
+    (en texto, solo si no se escribieron ya línea a línea).
+    """
+    output = response.get("output") or []
+    text = message
+    if output and not (response.get("outputLogged") and LOG.enabled("debug")):
+        text += "".join(f"\n  | {line}" for line in output)
+    LOG.log(level, message, text=text, failedMessageIds=sorted(failed),
+            durationMs=response.get("durationMs"), handlerOutput=output)
+
+def get_failed_message_ids(event, response):
+    """Interpreta la respuesta de un worker y retorna los messageId que fallaron."""
+    message_ids = {record["messageId"] for record in event["Records"]}
+    if not response.get("ok"):
+        log_handler_failure("error", f"✗ Handler execution failed: {response.get('error', 'unknown error')}", response, message_ids)
+        return message_ids
+
+    failed = parse_batch_item_failures(event, response.get("result"))
+    if failed:
+        log_handler_failure("warning", f"⚠ Handler reported {len(failed)}/{len(message_ids)} failed message(s) "
+                                       f"({response.get('durationMs', 0)} ms)", response, failed)
+    else:
+        LOG.info(f"✓ Handler executed successfully ({response.get('durationMs', 0)} ms)", sample=True,
+                 messages=len(message_ids), durationMs=response.get("durationMs"))
+    return failed
+
+def invoke_lambda_handler(pool, event, timeout, trace=NULL_TRACE):
+    """
+    Ejecuta el handler de Lambda en un worker Node.js del pool.
+    Retorna el conjunto de messageId que fallaron (vacío si todo el batch fue exitoso).
+    """
+    message_ids = {record["messageId"] for record in event["Records"]}
+    try:
+        return get_failed_message_ids(event, pool.invoke(event, timeout, trace))
+
+    except Exception as e:
+        details = traceback.format_exc().rstrip()
+        LOG.error(f"✗ Error invoking handler: {e}", text=f"✗ Error invoking handler: {e}\n{details}",
+                  failedMessageIds=sorted(message_ids), traceback=details)
+        return message_ids
+
+def log_batch(messages, handler):
+    """Log del primer mensaje del batch para debugging (muestreado según LOG_SAMPLE)."""
+    if not LOG.sample("debug"):
+        return
+    body = messages[0].get("Body", "")[:LOG_BODY_PREVIEW]
+    message_id = messages[0].get("MessageId", "N/A")
+    LOG.debug(
+        f"Invoking handler {handler}",
+        text=(f"  First message body (first {LOG_BODY_PREVIEW} chars): {body}\n"
+              f"  Message ID: {message_id}\n"
+              f"  Invoking handler: {handler}"),
+        handler=handler, messages=len(messages), messageId=message_id, bodyPreview=body
+    )
+
+def settle_batch(messages, failed, acker, failure_visibility_timeout):
+    """Confirma (ack) los mensajes exitosos y programa el reintento de los fallidos."""
+    for message in messages:
+        if message["MessageId"] not in failed:
+            acker.delete(message)
+        elif failure_visibility_timeout >= 0:
+            # Reintentar pronto en lugar de esperar el visibility timeout completo
+            acker.change_visibility(message, failure_visibility_timeout)
+
+    if failed:
+        if failure_visibility_timeout >= 0:
+            LOG.warning(f"⚠ {len(failed)} message(s) failed and will be retried in {failure_visibility_timeout}s",
+                        failed=len(failed), retryIn=failure_visibility_timeout)
+        else:
+            LOG.warning(f"⚠ {len(failed)} message(s) failed and will be retried after visibility timeout",
+                        failed=len(failed))
+
+def parse_message_body(message):
+    """Retorna (notificación SNS o None, payload JSON o None) del body de un mensaje."""
+    try:
+        body = json.loads(message.get("Body") or "null")
+    except ValueError:
+        return None, None
+    if isinstance(body, dict) and body.get("Type") == "Notification":
+        try:
+            payload = json.loads(body.get("Message") or "null")
+        except ValueError:
+            payload = None
+        return body, payload if isinstance(payload, dict) else None
+    return None, body if isinstance(body, dict) else None
+
+def find_message_field(message, fields):
+    """
+    Primer valor de `fields` presente en los message attributes, en los de la
+    notificación SNS o en el body JSON (incluido el mensaje dentro de la notificación).
+    """
+    attributes = message.get("MessageAttributes", {})
+    for field in fields:
+        if attributes.get(field, {}).get("StringValue"):
+            return attributes[field]["StringValue"]
+
+    envelope, payload = parse_message_body(message)
+    sns_attributes = (envelope or {}).get("MessageAttributes") or {}
+    for field in fields:
+        if isinstance(sns_attributes.get(field), dict) and sns_attributes[field].get("Value"):
+            return sns_attributes[field]["Value"]
+    for field in fields:
+        if payload and payload.get(field) not in (None, ""):
+            return str(payload[field])
+    return None
+
+def get_partition_key(message, key_fields):
+    """
+    Clave de orden de un mensaje: el MessageGroupId (SQS/SNS FIFO) o el primero de
+    `key_fields` presente en el mensaje. None si el mensaje no tiene clave.
+    """
+    group_id = message.get("Attributes", {}).get("MessageGroupId")
+    if group_id:
+        return group_id
+    return find_message_field(message, key_fields) if key_fields else None
+
+def split_fields(fields):
+    """Lista de campos de la configuración (lista o string separado por comas)."""
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [field.strip() for field in fields or [] if field.strip()]
+
+def get_partition_key_fields(config):
+    """Campos de la clave de orden de una cola (`partition_key`: lista o separados por comas)."""
+    return split_fields(config.get("partition_key", PARTITION_KEY_FIELDS))
+
+def fail_after_first_failure(messages, failed):
+    """Dentro de una clave, los mensajes posteriores al primero que falló también fallan (orden)."""
+    for index, message in enumerate(messages):
+        if message["MessageId"] in failed:
+            return failed | {later["MessageId"] for later in messages[index:]}
+    return failed
+
+def coalesce_groups(groups, batch_size):
+    """
+    Junta grupos listos de claves distintas en invocaciones de hasta `batch_size`
+    mensajes, para que los carriles no partan un batch recibido en invocaciones
+    de un mensaje. Cada clave sigue teniendo un solo grupo en curso.
+    """
+    invocations = []
+    current, size = [], 0
+    for key, batch in groups:
+        if current and size + len(batch[0]) > batch_size:
+            invocations.append(current)
+            current, size = [], 0
+        current.append((key, batch))
+        size += len(batch[0])
+    if current:
+        invocations.append(current)
+    return invocations
+
+def get_group_failures(groups, failed):
+    """Fallidos de cada grupo de una invocación, aplicando el orden dentro de cada clave."""
+    failures = []
+    for key, (messages, _) in groups:
+        group_failed = failed & {message["MessageId"] for message in messages}
+        if key is not None:
+            group_failed = fail_after_first_failure(messages, group_failed)
+        failures.append(group_failed)
+    return failures
+
+class PartitionLanes:
+    """
+    Carriles seriales por clave de partición: los batches de una misma clave se
+    procesan de a uno y en orden de llegada, mientras que claves distintas (y los
+    mensajes sin clave) se procesan en paralelo dentro del límite de concurrencia.
+    """
+
+    def __init__(self, key_fields):
+        self.key_fields = key_fields
+        self._lanes = {}  # clave -> batches esperando detrás del que está en curso
+        self._lock = threading.Lock()
+
+    def partition(self, messages):
+        """Agrupa un batch recibido en [(clave, mensajes)], respetando el orden de llegada."""
+        groups = {}
+        for message in messages:
+            groups.setdefault(get_partition_key(message, self.key_fields), []).append(message)
+        return list(groups.items())
+
+    def enqueue(self, key, item):
+        """Registra un batch de la clave; retorna True si puede ejecutarse ya."""
+        if key is None:
+            return True
+        with self._lock:
+            if key in self._lanes:
+                self._lanes[key].append(item)
+                return False
+            self._lanes[key] = collections.deque()
+            return True
+
+    def complete(self, key, failed=False):
+        """
+        Marca terminado el batch en curso de la clave. Retorna (siguiente, descartados):
+        el próximo batch a ejecutar, o si el batch falló, los que esperaban detrás
+        (se reintentan en orden más tarde en vez de adelantarse al que falló).
+        """
+        if key is None:
+            return None, []
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                return None, []
+            if failed or not lane:
+                del self._lanes[key]
+                return None, list(lane)
+            return lane.popleft(), []
+
+    def snapshot(self):
+        """(claves con un batch en curso, batches esperando)."""
+        with self._lock:
+            return len(self._lanes), sum(len(lane) for lane in self._lanes.values())
+
+def release_batch(messages, acker, failure_visibility_timeout):
+    """Devuelve a la cola, sin procesarlos, los mensajes que esperaban tras un fallo de su clave."""
+    if failure_visibility_timeout >= 0:
+        for message in messages:
+            acker.change_visibility(message, failure_visibility_timeout)
+    LOG.warning(f"⚠ {len(messages)} message(s) returned to the queue to keep their order after a failure",
+                returned=len(messages))
+
+def return_messages(messages, acker):
+    """Devuelve mensajes a la cola con visibilidad 0 para que otro consumidor los tome de inmediato."""
+    for message in messages:
+        acker.change_visibility(message, 0)
+
+def get_dedup_keys(message, key_fields):
+    """
+    Claves con las que se reconoce un mensaje ya completado: su MessageId, el
+    MessageId de la notificación SNS (el mismo publish entregado más de una vez)
+    y la clave de idempotencia del body, acotada al eventType para que eventos
+    distintos de una misma operación no se descarten entre sí.
+    """
+    keys = [f"message:{message['MessageId']}"]
+    envelope, _ = parse_message_body(message)
+    if envelope and envelope.get("MessageId"):
+        keys.append(f"sns:{envelope['MessageId']}")
+    if key_fields:
+        idempotency_key = find_message_field(message, key_fields)
+        if idempotency_key:
+            keys.append(f"idempotency:{find_message_field(message, ['eventType']) or ''}:{idempotency_key}")
+    return keys
+
+class DedupCache:
+    """
+    Cache LRU con TTL de los mensajes completados de una cola. Los mensajes que
+    llegan de nuevo (redelivery tras perder un ack, publish duplicado o reintento
+    del productor con la misma clave de idempotencia) se confirman sin invocar
+    el handler.
+    """
+
+    def __init__(self, key_fields, size=DEDUP_CACHE_SIZE, ttl=DEDUP_TTL):
+        self.key_fields = key_fields
+        self.size = max(0, size)
+        self.ttl = ttl
+        self.enabled = self.size > 0 and self.ttl > 0
+        self._entries = collections.OrderedDict()  # clave -> expiración (monotonic)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def completed(self, message):
+        """True si alguna clave del mensaje corresponde a un mensaje ya completado."""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            for key in get_dedup_keys(message, self.key_fields):
+                expires = self._entries.get(key)
+                if expires is None:
+                    continue
+                if expires <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                return True
+        return False
+
+    def add(self, messages):
+        """Recuerda los mensajes completados, descartando los más antiguos si se supera el tamaño."""
+        if not self.enabled or not messages:
+            return
+        keys = [key for message in messages for key in get_dedup_keys(message, self.key_fields)]
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key in keys:
+                self._entries[key] = expires
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+def drop_completed_messages(messages, dedup, acker, queue_name):
+    """Confirma sin procesar los mensajes ya completados y retorna el resto."""
+    if not dedup.enabled:
+        return messages
+    pending = []
+    for message in messages:
+        if dedup.completed(message):
+            DEDUP_TOTAL.inc(queue=queue_name, result="hit")
+            acker.delete(message)
+        else:
+            DEDUP_TOTAL.inc(queue=queue_name, result="miss")
+            pending.append(message)
+    if len(pending) < len(messages):
+        LOG.info(f"↻ {len(messages) - len(pending)} duplicate message(s) already completed, acked without invoking the handler",
+                 queue=queue_name, duplicates=len(messages) - len(pending))
+    return pending
+
+class InFlightLimiter:
+    """Limita la cantidad de mensajes recibidos que aún no han sido procesados y confirmados."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def reserve(self, wanted, timeout=None):
+        """
+        Reserva hasta `wanted` cupos, esperando a que haya al menos uno libre.
+        Retorna la cantidad reservada (0 si se agotó el timeout).
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout):
+                return 0
+            granted = min(wanted, self.limit - self.in_flight)
+            self.in_flight += granted
+            return granted
+
+    def release(self, count):
+        """Libera cupos reservados."""
+        if count <= 0:
+            return
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - count)
+            self._cond.notify_all()
+
+    def set_limit(self, limit):
+        """Cambia el límite; si baja, los cupos ya reservados se respetan hasta liberarse."""
+        with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+def coalesce_visibility_changes(deletes, changes):
+    """
+    Descarta los cambios de visibilidad de mensajes que se borran en el mismo flush
+    y deja solo el último cambio de cada mensaje (p. ej. un heartbeat seguido del
+    reintento de un mensaje fallido).
+    """
+    deleted = {message["ReceiptHandle"] for message in deletes}
+    latest = {}
+    for message, visibility_timeout in changes:
+        receipt_handle = message["ReceiptHandle"]
+        if receipt_handle not in deleted:
+            latest.pop(receipt_handle, None)
+            latest[receipt_handle] = (message, visibility_timeout)
+    return list(latest.values())
+
+def chunks(items, size=SQS_MAX_BATCH_ENTRIES):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+def delete_entries(messages):
+    """Entradas de DeleteMessageBatch: el Id es la posición del mensaje en el chunk."""
+    return [{"Id": str(index), "ReceiptHandle": message["ReceiptHandle"]} for index, message in enumerate(messages)]
+
+def visibility_entries(changes):
+    """Entradas de ChangeMessageVisibilityBatch para [(mensaje, visibility timeout)]."""
+    return [
+        {"Id": str(index), "ReceiptHandle": message["ReceiptHandle"], "VisibilityTimeout": visibility_timeout}
+        for index, (message, visibility_timeout) in enumerate(changes)
+    ]
+
+def get_failed_entries(chunk, response):
+    """Elementos del chunk que la respuesta de un batch de SQS lista en Failed."""
+    return [chunk[int(entry["Id"])] for entry in response.get("Failed", [])]
+
+def log_deleted(queue_name, chunk, failed, started):
+    """Traza y log de los mensajes de un chunk que DeleteMessageBatch borró."""
+    deleted = [message for message in chunk if message not in failed]
+    TRACER.acked(queue_name, deleted, started, time.time())
+    if deleted:
+        LOG.info(f"✓ {len(deleted)} message(s) deleted from {queue_name}", sample=True, queue=queue_name, deleted=len(deleted))
+
+def log_message_deleted(queue_name, message, started):
+    """Traza y log de un mensaje borrado individualmente tras fallar en el batch."""
+    TRACER.acked(queue_name, [message], started, time.time())
+    LOG.info(f"✓ Message {message['MessageId'][:8]}... deleted", queue=queue_name, messageId=message["MessageId"])
+
+class AckBatcher:
+    """
+    Agrupa las confirmaciones (DeleteMessage) y los cambios de visibilidad de una
+    cola para enviarlos con DeleteMessageBatch / ChangeMessageVisibilityBatch.
+    Un batch se envía al llegar a 10 entradas (límite de SQS) o tras `flush_interval`
+    segundos; las entradas que fallan en el batch se reintentan individualmente.
+    """
+
+    def __init__(self, sqs_client, queue_url, queue_name, flush_interval=ACK_FLUSH_INTERVAL):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.queue_name = queue_name
+        self.flush_interval = flush_interval
+        self._deletes = []
+        self._visibility = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name=f"{queue_name}-acker", daemon=True)
+        self._thread.start()
+
+    def delete(self, message):
+        """Encola la confirmación (borrado) de un mensaje."""
+        with self._cond:
+            self._deletes.append(message)
+            if len(self._deletes) >= SQS_MAX_BATCH_ENTRIES:
+                self._cond.notify()
+
+    def change_visibility(self, message, visibility_timeout):
+        """Encola un cambio de visibilidad (p. ej. 0 para reintentar de inmediato)."""
+        with self._cond:
+            self._visibility.append((message, visibility_timeout))
+            if len(self._visibility) >= SQS_MAX_BATCH_ENTRIES:
+                self._cond.notify()
+
+    def pending(self):
+        """Confirmaciones y cambios de visibilidad encolados que aún no se enviaron."""
+        with self._cond:
+            return len(self._deletes) + len(self._visibility)
+
+    def close(self):
+        """Envía lo pendiente y detiene el thread de flush."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed
+                    or len(self._deletes) >= SQS_MAX_BATCH_ENTRIES
+                    or len(self._visibility) >= SQS_MAX_BATCH_ENTRIES,
+                    timeout=self.flush_interval
+                )
+                deletes, self._deletes = self._deletes, []
+                visibility, self._visibility = self._visibility, []
+                closed = self._closed
+            try:
+                self._flush_deletes(deletes)
+                self._flush_visibility(coalesce_visibility_changes(deletes, visibility))
+            except Exception as e:
+                LOG.error(f"✗ Error flushing acks for {self.queue_name}: {e}", queue=self.queue_name)
+            if closed:
+                return
+
+    def _flush_deletes(self, messages):
+        for chunk in chunks(messages):
+            started = time.time()
+            try:
+                response = self.sqs_client.delete_message_batch(QueueUrl=self.queue_url, Entries=delete_entries(chunk))
+                failed = get_failed_entries(chunk, response)
+            except ClientError as e:
+                LOG.error(f"✗ Error deleting batch from {self.queue_name}: {e}", queue=self.queue_name)
+                failed = chunk
+
+            log_deleted(self.queue_name, chunk, failed, started)
+            # Reintentar individualmente las entradas que fallaron
+            for message in failed:
+                try:
+                    started = time.time()
+                    self.sqs_client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"])
+                    log_message_deleted(self.queue_name, message, started)
+                except ClientError as e:
+                    LOG.error(f"✗ Error deleting message: {e}", queue=self.queue_name, messageId=message["MessageId"])
+
+    def _flush_visibility(self, changes):
+        for chunk in chunks(changes):
+            try:
+                response = self.sqs_client.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=visibility_entries(chunk))
+                failed = get_failed_entries(chunk, response)
+            except ClientError as e:
+                LOG.error(f"✗ Error changing visibility in {self.queue_name}: {e}", queue=self.queue_name)
+                failed = chunk
+
+            # Reintentar individualmente las entradas que fallaron
+            for message, visibility_timeout in failed:
+                try:
+                    self.sqs_client.change_message_visibility(
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=message["ReceiptHandle"],
+                        VisibilityTimeout=visibility_timeout
+                    )
+                except ClientError as e:
+                    LOG.error(f"✗ Error changing visibility of message {message['MessageId'][:8]}...: {e}",
+                              queue=self.queue_name, messageId=message["MessageId"])
+
+class VisibilityHeartbeat:
+    """
+    Extiende la visibilidad de los mensajes mientras su batch sigue pendiente
+    (esperando un handler libre o ejecutándose), para que SQS no los entregue de
+    nuevo a otro consumidor. Cada `interval` segundos encola en el acker un cambio
+    de visibilidad a `visibility_timeout` segundos para cada mensaje del batch.
+    """
+
+    def __init__(self, acker, queue_name, visibility_timeout):
+        self.acker = acker
+        self.queue_name = queue_name
+        self.visibility_timeout = visibility_timeout
+        self.interval = max(1.0, visibility_timeout * VISIBILITY_HEARTBEAT_RATIO)
+        self._batches = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+
+    def track(self, messages):
+        """Registra un batch recibido y retorna el token para dejar de extenderlo."""
+        now = time.monotonic()
+        with self._lock:
+            self._next_token += 1
+            self._batches[self._next_token] = [messages, now, now + self.interval]
+            return self._next_token
+
+    def untrack(self, token):
+        """
+        Deja de extender la visibilidad de un batch (ya terminado o abandonado).
+        Retorna False si el batch ya no estaba registrado.
+        """
+        with self._lock:
+            return self._batches.pop(token, None) is not None
+
+    def untrack_all(self):
+        """Deja de extender todos los batches pendientes y retorna sus mensajes."""
+        with self._lock:
+            batches, self._batches = self._batches, {}
+        return [messages for messages, _, _ in batches.values()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._batches)
+
+    def tick(self):
+        """Extiende los batches cuyo turno llegó y retorna los segundos hasta el próximo."""
+        now = time.monotonic()
+        with self._lock:
+            for entry in self._batches.values():
+                messages, received, due = entry
+                if due > now:
+                    continue
+                # SQS no permite superar 12 horas de invisibilidad desde la recepción
+                visibility_timeout = int(min(self.visibility_timeout, MAX_VISIBILITY_TIMEOUT - (now - received)))
+                if visibility_timeout > 0:
+                    for message in messages:
+                        self.acker.change_visibility(message, visibility_timeout)
+                    VISIBILITY_EXTENSIONS_TOTAL.inc(len(messages), queue=self.queue_name)
+                entry[2] = now + self.interval
+            next_due = min((entry[2] for entry in self._batches.values()), default=now + self.interval)
+        return max(0.0, next_due - now)
+
+class PollScheduler:
+    """
+    Decide el WaitTimeSeconds de cada receive y la pausa entre receives a partir
+    de los resultados recientes. Tras un poll vacío se vuelve a hacer long polling
+    de inmediato; solo se espera si el endpoint no respeta el long polling
+    (responde vacío antes de tiempo) o tras errores, con backoff exponencial y jitter.
+    """
+
+    def __init__(self, max_wait=LONG_POLL_WAIT_SECONDS, backoff_base=POLL_BACKOFF_BASE,
+                 backoff_max=POLL_BACKOFF_MAX, idle_delay_max=POLL_INTERVAL):
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_delay_max = idle_delay_max
+        self.wait_time = max_wait
+        self.polls = 0
+        self.empty_polls = 0
+        self.errors = 0
+        self.consecutive_empty = 0
+        self.consecutive_errors = 0
+        self.early_empty = 0  # polls vacíos seguidos que retornaron antes del WaitTimeSeconds
+        self.fill_rate = 0.0  # EWMA de mensajes recibidos / solicitados
+        self.error_rate = 0.0  # EWMA de polls con error
+        self.last_delay = 0.0
+        self._lock = threading.Lock()
+
+    def next_wait_time(self):
+        """WaitTimeSeconds para el próximo receive."""
+        with self._lock:
+            return self.wait_time
+
+    def record_result(self, requested, received, elapsed, wait_time):
+        """Registra un receive exitoso y retorna los segundos a esperar antes del siguiente."""
+        with self._lock:
+            self.polls += 1
+            self.consecutive_errors = 0
+            self.error_rate *= 1 - POLL_EWMA_ALPHA
+            self.fill_rate += POLL_EWMA_ALPHA * (received / max(requested, 1) - self.fill_rate)
+
+            delay = 0.0
+            if received:
+                self.consecutive_empty = 0
+                self.early_empty = 0
+            else:
+                self.empty_polls += 1
+                self.consecutive_empty += 1
+                if wait_time > 0 and elapsed < wait_time / 2:
+                    # El endpoint no respetó el long polling: evitar un bucle activo
+                    self.early_empty += 1
+                    delay = self._jitter(min(self.idle_delay_max, self.backoff_base * 2 ** min(self.early_empty - 1, 16)))
+                else:
+                    self.early_empty = 0
+            self.last_delay = delay
+            return delay
+
+    def record_error(self):
+        """Registra un receive fallido y retorna el backoff antes de reintentar."""
+        with self._lock:
+            self.polls += 1
+            self.errors += 1
+            self.consecutive_errors += 1
+            self.error_rate += POLL_EWMA_ALPHA * (1 - self.error_rate)
+            delay = self._jitter(min(self.backoff_max, self.backoff_base * 2 ** min(self.consecutive_errors - 1, 16)))
+            self.last_delay = delay
+            return delay
+
+    @staticmethod
+    def _jitter(delay):
+        """Equal jitter: la mitad fija y la otra mitad aleatoria."""
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def snapshot(self):
+        """Estado actual del scheduler."""
+        with self._lock:
+            return {
+                "wait_time": self.wait_time,
+                "polls": self.polls,
+                "empty_polls": self.empty_polls,
+                "errors": self.errors,
+                "consecutive_empty": self.consecutive_empty,
+                "consecutive_errors": self.consecutive_errors,
+                "fill_rate": round(self.fill_rate, 3),
+                "error_rate": round(self.error_rate, 3),
+                "last_delay": round(self.last_delay, 3),
+            }
+
+def get_handler_timeout(config):
+    """Timeout del handler de una cola: `timeout` si se configuró, si no el VisibilityTimeout de la cola."""
+    timeout = int(config.get("timeout") or config.get("visibility_timeout") or DEFAULT_VISIBILITY_TIMEOUT)
+    return min(max(1, timeout), MAX_VISIBILITY_TIMEOUT)
+
+def get_function_name(config):
+    """Función de serverless.yml que consume la cola (el handler si no se indicó)."""
+    return config.get("function") or config["handler"]
+
+def get_concurrency_bounds(config):
+    """Retorna (mínimo, inicial, máximo) de invocaciones simultáneas de una cola."""
+    concurrency = max(1, int(config.get("concurrency", QUEUE_CONCURRENCY)))
+    min_concurrency = max(1, min(int(config.get("min_concurrency", concurrency)), concurrency))
+    max_concurrency = max(int(config.get("max_concurrency", concurrency)), concurrency)
+    return min_concurrency, concurrency, max_concurrency
+
+CIRCUIT_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+class CircuitBreaker:
+    """
+    Circuito de una función según la fracción de mensajes fallidos o lentos en
+    los últimos `window` segundos. Abierto, los consumidores de la función dejan
+    de recibir y sus batches pendientes esperan (con la visibilidad extendida)
+    sin sumar recepciones hacia el maxReceiveCount de la DLQ. Pasados
+    `open_seconds` queda half-open y deja pasar un solo batch de prueba: si
+    termina bien el circuito se cierra y si no se vuelve a abrir con el doble
+    de espera, hasta `max_open_seconds`.
+    """
+
+    def __init__(self, function_name, failure_rate=CIRCUIT_FAILURE_RATE, min_messages=CIRCUIT_MIN_MESSAGES,
+                 window=CIRCUIT_WINDOW, open_seconds=CIRCUIT_OPEN_SECONDS, max_open_seconds=CIRCUIT_OPEN_MAX_SECONDS):
+        self.function_name = function_name
+        self.failure_rate = failure_rate
+        self.min_messages = max(1, min_messages)
+        self.window = window
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max(open_seconds, max_open_seconds)
+        self.enabled = failure_rate > 0
+        self.state = "closed"
+        self._results = collections.deque()  # (monotonic, mensajes, fallidos)
+        self._messages = 0
+        self._failures = 0
+        self._pause = open_seconds
+        self._reopen_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, function=function_name)
+
+    @property
+    def blocked(self):
+        """True mientras el circuito está abierto y todavía no toca probar."""
+        return self.state == "open" and time.monotonic() < self._reopen_at
+
+    def allow(self):
+        """
+        Permiso para invocar el handler: True con el circuito cerrado, "probe"
+        para el único batch de prueba en half-open y False si debe esperar.
+        """
+        if self.state == "closed":
+            return True
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() < self._reopen_at:
+                    return False
+                self._transition("half-open", f"◐ Circuit for {self.function_name} half-open, probing with one batch")
+            if self.state == "closed":
+                return True
+            if self._probing:
+                return False
+            self._probing = True
+            return "probe"
+
+    def cancel(self, permit):
+        """Libera un permiso que no llegó a usarse (p. ej. al drenar)."""
+        if permit == "probe":
+            with self._lock:
+                self._probing = False
+
+    def record(self, messages, failures, permit):
+        """Registra el resultado de un batch; los lentos se registran con todos sus mensajes fallidos."""
+        if not self.enabled or not messages:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if permit == "probe":
+                self._probing = False
+                if failures / messages >= self.failure_rate:
+                    self._pause = min(self._pause * 2, self.max_open_seconds)
+                    self._open(now, f"⛔ Circuit for {self.function_name} reopened after a failed probe, "
+                                    f"probing again in {self._pause:.0f}s")
+                else:
+                    self._pause = self.open_seconds
+                    self._reset()
+                    self._transition("closed", f"✓ Circuit for {self.function_name} closed, resuming")
+                return
+            if self.state != "closed":
+                # Batches que empezaron antes de abrir el circuito
+                return
+            self._results.append((now, messages, failures))
+            self._messages += messages
+            self._failures += failures
+            while self._results and self._results[0][0] < now - self.window:
+                _, old_messages, old_failures = self._results.popleft()
+                self._messages -= old_messages
+                self._failures -= old_failures
+            if self._messages >= self.min_messages and self._failures / self._messages >= self.failure_rate:
+                self._open(now, f"⛔ Circuit for {self.function_name} opened: {self._failures}/{self._messages} message(s) "
+                                f"failed or were slow in the last {self.window:g}s, probing again in {self._pause:.0f}s")
+
+    def _open(self, now, message):
+        self._reset()
+        self._reopen_at = now + self._pause
+        self._transition("open", message)
+
+    def _reset(self):
+        self._results.clear()
+        self._messages = self._failures = 0
+
+    def _transition(self, state, message):
+        self.state = state
+        CIRCUIT_STATE.set(CIRCUIT_STATES[state], function=self.function_name)
+        CIRCUIT_TRANSITIONS_TOTAL.inc(function=self.function_name, state=state)
+        LOG.log("info" if state == "closed" else "warning", message, function=self.function_name, circuit=state)
+
+CIRCUIT_BREAKERS = {}
+CIRCUIT_BREAKERS_LOCK = threading.Lock()
+
+def get_circuit_breaker(function_name):
+    """Circuito compartido por todas las colas que invocan la misma función."""
+    with CIRCUIT_BREAKERS_LOCK:
+        if function_name not in CIRCUIT_BREAKERS:
+            CIRCUIT_BREAKERS[function_name] = CircuitBreaker(function_name)
+        return CIRCUIT_BREAKERS[function_name]
+
+def parse_rate_limits(spec):
+    """Interpreta RATE_LIMITS ("processPayment=5:10,api=50") como {función: (tasa, burst)}."""
+    limits = {}
+    for item in split_fields(spec):
+        function_name, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        try:
+            rate = float(rate)
+            burst = float(burst) if burst else max(1.0, rate)
+        except ValueError:
+            print(f"⚠ Invalid rate limit '{item}' (use function=rate[:burst]), ignoring it", flush=True)
+            continue
+        if rate > 0:
+            limits[function_name.strip()] = (rate, burst)
+    return limits
+
+class TokenBucket:
+    """
+    Token bucket de una función: se recarga a `rate` tokens por segundo hasta
+    `burst`, y cada mensaje de un batch (o cada Task de step-functions-local.py) consume
+    uno. Un batch más grande que el burst pasa con el bucket lleno y deja saldo
+    negativo, para que la tasa promedio se respete igual. Lo que no consigue
+    tokens espera en el buffer local en lugar de invocar el handler.
+    """
+
+    def __init__(self, function_name, rate, burst):
+        self.function_name = function_name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.enabled = rate > 0
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, count):
+        """Toma `count` tokens si hay suficientes; si no, retorna los segundos hasta que los haya."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            needed = min(count, self.burst)
+            if self.tokens >= needed:
+                self.tokens -= count
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+    def wait(self, count, stop=None):
+        """
+        Espera bloqueando el thread hasta obtener `count` tokens. Retorna False si
+        antes se detiene el servicio o se activa el Event `stop`.
+        """
+        if not self.enabled:
+            return True
+        throttled = None
+        while True:
+            delay = self.reserve(count)
+            if not delay:
+                self._observe(throttled)
+                return True
+            throttled = throttled or time.monotonic()
+            if stop is not None:
+                if stop.wait(min(delay, 1.0)):
+                    return False
+            else:
+                time.sleep(min(delay, 1.0))
+            if not RUNNING:
+                return False
+
+    async def wait_async(self, count):
+        """Versión asyncio de wait."""
+        if not self.enabled:
+            return True
+        throttled = None
+        while True:
+            delay = self.reserve(count)
+            if not delay:
+                self._observe(throttled)
+                return True
+            throttled = throttled or time.monotonic()
+            await asyncio.sleep(min(delay, 1.0))
+            if not RUNNING:
+                return False
+
+    def _observe(self, throttled):
+        if throttled is not None:
+            THROTTLE_DURATION.observe(time.monotonic() - throttled, function=self.function_name)
+
+RATE_LIMIT_CONFIG = parse_rate_limits(RATE_LIMITS)
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+def get_rate_limiter(function_name):
+    """Token bucket compartido por las colas que invocan la misma función."""
+    with RATE_LIMITERS_LOCK:
+        if function_name not in RATE_LIMITERS:
+            rate, burst = RATE_LIMIT_CONFIG.get(function_name, (0, 0))
+            RATE_LIMITERS[function_name] = TokenBucket(function_name, rate, burst)
+        return RATE_LIMITERS[function_name]
+
+def describe_rate_limits(limits):
+    return ", ".join(f"{function_name} {rate:g}/s (burst {burst:g})" for function_name, (rate, burst) in limits.items())
+
+class ConsumerScaling:
+    """
+    Estado de escalado compartido por los consumidores con threads y asyncio:
+    la concurrencia configurada (o la del autoscaling), acotada por AIMD según
+    el resultado de cada batch, y el circuito de la función. También reúne el
+    manejo de batches que no depende del motor (carriles, resultado y acks);
+    cada consumidor solo agrega las esperas y el lanzamiento de invocaciones.
+    """
+
+    def _init_scaling(self, config):
+        self.min_concurrency, self.concurrency, self.max_concurrency = get_concurrency_bounds(config)
+        self.max_receivers = max(1, int(config.get("receivers", QUEUE_RECEIVERS)))
+        self.receivers = self._receivers_for(self.concurrency)
+        self.fixed_in_flight = config.get("max_in_flight")
+        self.prefetch = max(0, int(config.get("prefetch", PREFETCH_MESSAGES)))
+        self.breaker = get_circuit_breaker(self.function)
+        self.rate_limiter = get_rate_limiter(self.function)
+        self.slow_seconds = CIRCUIT_SLOW_SECONDS or self.timeout / 2
+        self.adaptive_limit = float(self.concurrency)
+        self._last_decrease = 0.0
+        self._adaptive_lock = threading.Lock()
+
+    @property
+    def effective_concurrency(self):
+        """Invocaciones simultáneas permitidas: la concurrencia acotada por el límite AIMD."""
+        return max(1, min(self.concurrency, int(self.adaptive_limit)))
+
+    @property
+    def scalable(self):
+        return self.min_concurrency < self.max_concurrency
+
+    def _receivers_for(self, concurrency):
+        """Receptores activos, proporcionales a la concurrencia actual."""
+        return max(1, math.ceil(self.max_receivers * concurrency / self.max_concurrency))
+
+    def _in_flight_limit(self):
+        """
+        max_in_flight explícito o, si no se configuró, un batch por invocación
+        simultánea más `prefetch` mensajes: mientras los handlers corren, los
+        receptores ya traen los siguientes y no queda un hueco de long polling
+        entre que un handler termina y recibe su próximo batch.
+        """
+        if self.fixed_in_flight:
+            return int(self.fixed_in_flight)
+        return self.effective_concurrency * self.batch_size + self.prefetch
+
+    def _describe_in_flight(self):
+        if self.fixed_in_flight:
+            return f"max {self.limiter.limit} message(s) in flight"
+        return f"max {self.limiter.limit} message(s) in flight ({self.prefetch} prefetched)"
+
+    def _clamp_concurrency(self, concurrency):
+        return min(max(concurrency, self.min_concurrency), self.max_concurrency)
+
+    def _set_concurrency(self, concurrency):
+        """
+        Concurrencia que decide el autoscaler. El límite AIMD la sigue si no hubo
+        una reducción dentro de la ventana del circuito; si la hubo, el downstream
+        sigue con problemas y el límite solo se recorta al nuevo máximo.
+        """
+        with self._adaptive_lock:
+            self.concurrency = self._clamp_concurrency(concurrency)
+            self.receivers = self._receivers_for(self.concurrency)
+            if time.monotonic() - self._last_decrease > self.breaker.window:
+                self.adaptive_limit = float(self.concurrency)
+            else:
+                self.adaptive_limit = min(self.adaptive_limit, float(self.concurrency))
+
+    def _record_outcome(self, permit, messages, failed, duration):
+        """
+        Registra el resultado de una invocación en el circuito y en el límite
+        AIMD. Retorna True si cambió la concurrencia efectiva.
+        """
+        slow = duration >= self.slow_seconds
+        self.breaker.record(len(messages), len(messages) if slow else len(failed), permit)
+        # Un mensaje que falla solo no indica un downstream caído: solo cuentan los batches completos
+        return self._adapt_concurrency(slow or len(failed) >= len(messages), duration)
+
+    def _adapt_concurrency(self, failed, duration):
+        """
+        AIMD: un batch fallido o lento multiplica el límite por AIMD_DECREASE_FACTOR
+        (a lo sumo una vez por duración de batch, para que los fallos simultáneos
+        de una misma caída cuenten una vez) y cada batch exitoso lo sube en
+        1/límite, es decir +1 cada `límite` batches, hasta la concurrencia.
+        """
+        if AIMD_DECREASE_FACTOR >= 1:
+            return False
+        with self._adaptive_lock:
+            before = self.effective_concurrency
+            now = time.monotonic()
+            if not failed:
+                self.adaptive_limit = min(float(self.concurrency), self.adaptive_limit + 1 / self.adaptive_limit)
+            elif now - self._last_decrease >= duration:
+                self.adaptive_limit = max(1.0, self.adaptive_limit * AIMD_DECREASE_FACTOR)
+                self._last_decrease = now
+            return self.effective_concurrency != before
+
+    def _enqueue_batches(self, messages):
+        """
+        Confirma los duplicados de mensajes ya completados y reparte el resto en
+        carriles por clave. Retorna (mensajes que no se ejecutan, invocaciones
+        [(clave, (grupo, token del heartbeat))] que pueden lanzarse ya).
+        """
+        EVENT_RECORDER.record(self.queue_name, self.function, self.handler, messages)
+        pending = drop_completed_messages(messages, self.dedup, self.acker, self.queue_name)
+        ready = []
+        for key, group in self.lanes.partition(pending):
+            # La visibilidad se extiende también mientras el grupo espera en su carril
+            batch = (group, self.heartbeat.track(group))
+            if self.lanes.enqueue(key, batch):
+                ready.append((key, batch))
+        return len(messages) - len(pending), coalesce_groups(ready, self.batch_size)
+
+    def _return_unstarted(self, groups):
+        """Devuelve a la cola los grupos de un batch que no llegó a ejecutarse (drenaje)."""
+        for _, (group, heartbeat) in groups:
+            if self.heartbeat.untrack(heartbeat):
+                self._return_messages(group)
+
+    def _start_batch(self, messages):
+        """Log, traza y evento SQS de un batch que va a invocar el handler."""
+        log_batch(messages, self.handler)
+        trace = TRACER.batch(self.queue_name, messages)
+        build_started = time.time()
+        event = create_sqs_event(messages)
+        trace.span("event.build", build_started, time.time(), messages=len(messages))
+        return trace, event
+
+    def _finish_batch(self, groups, messages, failed, permit, started, trace):
+        """
+        Registra el resultado de la invocación y confirma los mensajes exitosos.
+        Retorna (fallos por grupo, si cambió la concurrencia efectiva), o None si
+        el drenaje ya devolvió los mensajes a la cola (y terminó su worker): ese
+        resultado no cuenta para el circuito ni para la concurrencia adaptativa.
+        """
+        if not any([self.heartbeat.untrack(heartbeat) for _, (_, heartbeat) in groups]):
+            return None
+        changed = self._record_outcome(permit, messages, failed, time.monotonic() - started)
+        failures = get_group_failures(groups, failed)
+        failed = set().union(*failures)
+        observe_batch(self.queue_name, self.handler, messages, failed, time.monotonic() - started)
+        trace.finish(failed)
+        settle_batch(messages, failed, self.acker, self.failure_visibility_timeout)
+        self.dedup.add([message for message in messages if message["MessageId"] not in failed])
+        if not RUNNING:
+            self._count_drain("finished", len(messages))
+        return failures, changed
+
+    def _complete_lanes(self, groups, failures):
+        """
+        Cierra las claves que terminaron y devuelve a la cola los batches que
+        esperaban detrás de una clave que falló. Retorna (mensajes liberados,
+        siguientes invocaciones de las claves que terminaron).
+        """
+        released = 0
+        ready = []
+        for (key, _), failed in zip(groups, failures):
+            next_batch, dropped = self.lanes.complete(key, bool(failed))
+            for messages, heartbeat in dropped:
+                # Si el drenaje ya los devolvió a la cola no se cambia su visibilidad
+                if self.heartbeat.untrack(heartbeat):
+                    release_batch(messages, self.acker, self.failure_visibility_timeout)
+                released += len(messages)
+            if next_batch is not None:
+                ready.append((key, next_batch))
+        return released, coalesce_groups(ready, self.batch_size)
+
+    def _describe_resilience(self):
+        lines = []
+        if self.breaker.enabled:
+            lines.append(f"   Circuit breaker: opens at {self.breaker.failure_rate:.0%} of messages failed or slow "
+                         f"(>= {self.slow_seconds:g}s) over {self.breaker.window:g}s, probes after {self.breaker.open_seconds:g}s")
+        if self.rate_limiter.enabled:
+            lines.append(f"   Rate limit: {self.rate_limiter.rate:g} message(s)/s for {self.function} "
+                         f"(burst {self.rate_limiter.burst:g}, shared by its queues)")
+        if AIMD_DECREASE_FACTOR < 1:
+            lines.append(f"   Adaptive concurrency: x{AIMD_DECREASE_FACTOR:g} after a failed or slow batch, "
+                         f"+1 every {self.concurrency} successful ones")
+        return lines
+
+class QueueConsumer(ConsumerScaling):
+    """
+    Consumidor de una cola SQS. Uno o más threads reciben mensajes y los
+    despachan a un executor acotado por `concurrency`; el total de mensajes
+    recibidos y aún no confirmados nunca supera `max_in_flight`. La concurrencia
+    puede ajustarse en caliente con scale_to() entre min y max_concurrency.
+    """
+
+    def __init__(self, sqs_client, queue_url, queue_name, config, pool):
+        self.sqs_client = sqs_client
+        self.acker = AckBatcher(sqs_client, queue_url, queue_name)
+        self.failure_visibility_timeout = int(config.get("failure_visibility_timeout", FAILURE_VISIBILITY_TIMEOUT))
+        self.timeout = get_handler_timeout(config)
+        self.heartbeat = VisibilityHeartbeat(
+            self.acker, queue_name, int(config.get("visibility_timeout") or DEFAULT_VISIBILITY_TIMEOUT)
+        )
+        self.queue_url = queue_url
+        self.queue_name = queue_name
+        self.handler = config["handler"]
+        self.function = get_function_name(config)
+        self.reserved_concurrency = config.get("reserved_concurrency")
+        self.pool = pool
+        self.batch_size = get_batch_size(config)
+        self.lanes = PartitionLanes(get_partition_key_fields(config))
+        self.dedup = DedupCache(
+            split_fields(config.get("dedup_key", DEDUP_KEY_FIELDS)),
+            int(config.get("dedup_cache_size", DEDUP_CACHE_SIZE)),
+            float(config.get("dedup_ttl", DEDUP_TTL))
+        )
+        self._init_scaling(config)
+        self.limiter = InFlightLimiter(self._in_flight_limit())
+        self.slots = InFlightLimiter(self.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f"{queue_name}-handler")
+        self.scheduler = PollScheduler()
+        self._last_status_log = time.monotonic()
+        self._drain_counts = collections.Counter()
+        self._drain_lock = threading.Lock()
+        self._receivers = []
+        self._drained = False
+        METRICS.add_collector(collect_consumer_metrics(self))
+
+    def start(self):
+        """Inicia los threads receptores y retorna la lista de threads."""
+        print(f"📡 Polling {self.queue_name} -> {self.handler} (batch size {self.batch_size})")
+        print(f"   Queue URL: {self.queue_url}")
+        print(f"   Backend dir: {BACKEND_DIR}")
+        print(f"   Concurrency: {self.concurrency} handler(s), {self.receivers} receiver(s), {self._describe_in_flight()}")
+        if self.scalable:
+            print(f"   Autoscaling: {self.min_concurrency}-{self.max_concurrency} handler(s)")
+        print(f"   Handler timeout: {self.timeout}s (visibility {self.heartbeat.visibility_timeout}s, "
+              f"extended every {self.heartbeat.interval:.0f}s while pending)")
+        if self.lanes.key_fields:
+            print(f"   Ordering: serial per MessageGroupId/{', '.join(self.lanes.key_fields)}, parallel across keys")
+        if self.dedup.enabled:
+            print(f"   Deduplication: last {self.dedup.size} completed message(s) for {self.dedup.ttl:.0f}s "
+                  f"(MessageId{''.join(', ' + field for field in self.dedup.key_fields)})")
+        for line in self._describe_resilience():
+            print(line)
+
+        # Se crean todos los receptores posibles; los que exceden los activos quedan en espera
+        threads = []
+        for index in range(self.max_receivers):
+            thread = threading.Thread(
+                target=self._receive_loop,
+                args=(index,),
+                name=f"{self.queue_name}-receiver-{index + 1}",
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+        threading.Thread(target=self._heartbeat_loop, name=f"{self.queue_name}-heartbeat", daemon=True).start()
+        self._receivers = threads
+        return threads
+
+    def drain(self, deadline):
+        """
+        Drena la cola al detener el servicio (RUNNING ya es False): espera a los
+        receptores y a los handlers en curso hasta `deadline` (time.monotonic()),
+        devuelve con visibilidad 0 los mensajes que no terminaron para que otro
+        consumidor los tome sin esperar el VisibilityTimeout y envía los acks
+        pendientes. Retorna el resumen para el log de salida.
+
+        Antes de devolverlos termina los workers ocupados del pool de la función:
+        un handler que siguiera corriendo procesaría en paralelo con el consumidor
+        que recibe de nuevo esos mensajes. Si el pool es compartido también corta
+        los batches de las otras colas de la función, que drenan con el mismo plazo.
+        """
+        for thread in self._receivers:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        while len(self.heartbeat) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        unfinished = self.heartbeat.untrack_all()
+        killed = self.pool.kill_busy() if unfinished else 0
+        for messages in unfinished:
+            self._return_messages(messages)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        acks = self.acker.pending()
+        self.acker.close()
+        self._drained = True
+        return {
+            "queue": self.queue_name,
+            "finished": self._drain_counts["finished"],
+            "returned": self._drain_counts["returned"],
+            "unfinished": len(unfinished),
+            "killed": killed,
+            "receivers": sum(thread.is_alive() for thread in self._receivers),
+            "acks": acks,
+        }
+
+    def _count_drain(self, name, count):
+        with self._drain_lock:
+            self._drain_counts[name] += count
+
+    def _return_messages(self, messages):
+        """Devuelve a la cola mensajes que no se van a procesar por el drenaje."""
+        return_messages(messages, self.acker)
+        self._count_drain("returned", len(messages))
+
+    def scale_to(self, concurrency):
+        """Ajusta invocaciones simultáneas, receptores activos y mensajes en vuelo."""
+        self._set_concurrency(concurrency)
+        self._apply_limits()
+
+    def _apply_limits(self):
+        self.slots.set_limit(self.effective_concurrency)
+        self.limiter.set_limit(self._in_flight_limit())
+
+    def _heartbeat_loop(self):
+        """Extiende la visibilidad de los batches pendientes hasta terminar el drenaje."""
+        while not self._drained:
+            try:
+                delay = self.heartbeat.tick()
+            except Exception as e:
+                LOG.error(f"✗ Error extending visibility in {self.queue_name}: {e}", queue=self.queue_name)
+                delay = self.heartbeat.interval
+            time.sleep(min(delay, 1.0))
+
+    def _receive_loop(self, index):
+        """Hace polling de la cola y despacha los batches recibidos al executor."""
+        while RUNNING:
+            if index >= self.receivers or self.breaker.blocked:
+                # Receptor en espera hasta que el autoscaling lo active o el circuito deje probar
+                time.sleep(0.5)
+                continue
+            reserved = 0
+            try:
+                # Esperar cupo antes de recibir para no retener mensajes que no se pueden procesar
+                reserved = self.limiter.reserve(self.batch_size, timeout=1)
+                if not reserved:
+                    continue
+
+                self._log_status()
+
+                # Recibir mensajes (long polling: retorna apenas llega un mensaje)
+                wait_time = self.scheduler.next_wait_time()
+                started = time.monotonic()
+                response = self.sqs_client.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=reserved,
+                    WaitTimeSeconds=wait_time,
+                    MessageAttributeNames=["All"],
+                    AttributeNames=["All"]
+                )
 
-# Configuración
-LOCALSTACK_ENDPOINT = os.getenv("SQS_ENDPOINT", "http://localstack:4566")
-REGION = os.getenv("AWS_REGION", "us-east-1")
-POLL_INTERVAL = 2  # segundos entre polling
-MAX_MESSAGES = 1  # batch size
-BACKEND_DIR = "/app/packages/backend"
-RUNNING = True
+                messages = response.get("Messages", [])
+                elapsed = time.monotonic() - started
+                observe_receive(self.queue_name, messages, elapsed)
+                TRACER.received(self.queue_name, messages, time.time() - elapsed, time.time(), f"receiver-{index + 1}")
+                delay = self.scheduler.record_result(reserved, len(messages), elapsed, wait_time)
+                # Devolver los cupos que no se usaron
+                self.limiter.release(reserved - len(messages))
+                reserved = 0
 
-# Mapeo de servicios a colas y handlers
-QUEUE_HANDLERS = {
-    "dev-payments-queue": {
-        "handler": "dist/main.handler"
-    }
-}
+                if messages and not RUNNING:
+                    # Llegaron con el drenaje en curso: devolverlos en vez de procesarlos
+                    self._return_messages(messages)
+                    self.limiter.release(len(messages))
+                elif messages:
+                    LOG.info(f"\n📨 [{self.queue_name}] Received {len(messages)} message(s)", sample=True,
+                             queue=self.queue_name, messages=len(messages))
+                    self._dispatch(messages)
+                if delay:
+                    time.sleep(delay)
 
-def signal_handler(sig, frame):
-    """Maneja señales para cerrar limpiamente."""
-    global RUNNING
-    print("\nReceived shutdown signal, stopping pollers...")
-    RUNNING = False
-    sys.exit(0)
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                self.limiter.release(reserved)
+                RECEIVE_ERRORS_TOTAL.inc(queue=self.queue_name)
+                delay = self.scheduler.record_error()
+                LOG.error(f"✗ Error polling {self.queue_name}: {e} (retrying in {delay:.1f}s)", queue=self.queue_name, retryIn=delay)
+                time.sleep(delay)
 
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+    def _log_status(self):
+        """Log periódico del estado del scheduler para no saturar la salida."""
+        now = time.monotonic()
+        if now - self._last_status_log < STATUS_LOG_INTERVAL:
+            return
+        self._last_status_log = now
+        state = self.scheduler.snapshot()
+        LOG.info(
+            f"  [{self.queue_name}] Still polling... (poll #{state['polls']}, "
+            f"empty {state['consecutive_empty']} in a row, fill {state['fill_rate']:.0%}, "
+            f"errors {state['error_rate']:.0%}, {self.limiter.in_flight} in flight)",
+            queue=self.queue_name, polls=state["polls"], inFlight=self.limiter.in_flight
+        )
 
-def create_sqs_event(records):
-    """Crea un evento SQS compatible con AWS Lambda."""
-    sqs_records = []
-    for record in records:
-        sqs_record = {
-            "messageId": record["MessageId"],
-            "receiptHandle": record["ReceiptHandle"],
-            "body": record["Body"],
-            "attributes": record.get("Attributes", {}),
-            "messageAttributes": record.get("MessageAttributes", {}),
-            "md5OfBody": record.get("MD5OfBody", ""),
-            "eventSource": "aws:sqs",
-            "eventSourceARN": record.get("Attributes", {}).get("ApproximateReceiveCount", ""),
-            "awsRegion": REGION
-        }
-        sqs_records.append(sqs_record)
-    
-    return {"Records": sqs_records}
+    def _dispatch(self, messages):
+        """
+        Lanza las invocaciones que pueden ejecutarse. Las que no tienen un handler
+        libre esperan en el executor (prefetch) con su visibilidad extendida.
+        """
+        skipped, batches = self._enqueue_batches(messages)
+        self.limiter.release(skipped)
+        for groups in batches:
+            self.executor.submit(self._process_batch, groups)
 
-def invoke_lambda_handler(backend_dir, handler_path, event):
-    """Ejecuta el handler de Lambda usando Node.js directamente."""
-    try:
-        handler_file, handler_function = handler_path.rsplit(".", 1)
-        handler_file_path = os.path.join(backend_dir, handler_file + ".js")
-        
-        print(f"    Handler file path: {handler_file_path}")
-        print(f"    Handler function: {handler_function}")
-        
-        if not os.path.exists(handler_file_path):
-            print(f"✗ Error: Handler file not found: {handler_file_path}")
-            # Listar archivos en el directorio para debugging
-            handler_dir = os.path.dirname(handler_file_path)
-            if os.path.exists(handler_dir):
-                print(f"    Directory exists: {handler_dir}")
-                try:
-                    files = os.listdir(handler_dir)
-                    print(f"    Files in directory: {files[:10]}")  # Primeros 10
-                except:
-                    pass
+    def _process_batch(self, groups):
+        """
+        Ejecuta el handler en una sola invocación para uno o más grupos [(clave,
+        (mensajes, token del heartbeat))] y confirma los mensajes exitosos.
+        """
+        messages = [message for _, (group, _) in groups for message in group]
+        failures = [{message["MessageId"] for message in group} for _, (group, _) in groups]
+        slot = 0
+        permit = False
+        try:
+            # Sin tokens del rate limit de la función el batch espera aquí, con su visibilidad
+            # extendida y sin ocupar una invocación ni el batch de prueba del circuito
+            ready = self.rate_limiter.wait(len(messages))
+            while ready and RUNNING and not slot:
+                slot = self.slots.reserve(1, timeout=1)
+            # Con el circuito abierto el batch espera con su visibilidad extendida
+            while ready and RUNNING and not permit:
+                permit = self.breaker.allow()
+                if not permit:
+                    time.sleep(CIRCUIT_WAIT_INTERVAL)
+            if not ready or not RUNNING:
+                # Drenando: no se inician handlers nuevos
+                self._return_unstarted(groups)
+                failures = [set() for _ in groups]
+                return
+            started = time.monotonic()
+            trace, event = self._start_batch(messages)
+            failed = invoke_lambda_handler(self.pool, event, self.timeout, trace)
+            result = self._finish_batch(groups, messages, failed, permit, started, trace)
+            if result is None:
+                return
+            permit = False
+            failures, changed = result
+            if changed:
+                self._apply_limits()
+        except Exception as e:
+            LOG.error(f"✗ Error processing batch from {self.queue_name}: {e}", queue=self.queue_name)
+        finally:
+            self.breaker.cancel(permit)
+            for _, (_, heartbeat) in groups:
+                self.heartbeat.untrack(heartbeat)
+            self.slots.release(slot)
+            self.limiter.release(len(messages))
+            self._advance_lanes(groups, failures)
+
+    def _advance_lanes(self, groups, failures):
+        """Lanza juntos los siguientes batches de las claves que terminaron."""
+        released, batches = self._complete_lanes(groups, failures)
+        self.limiter.release(released)
+        for next_groups in batches:
+            self.executor.submit(self._process_batch, next_groups)
+
+def print_drain_summary(summaries, elapsed):
+    """Resumen de salida: qué terminó durante el drenaje y qué se devolvió a las colas."""
+    LOG.flush()
+    print("=" * 60, flush=True)
+    print(f"Drain summary ({elapsed:.1f}s)", flush=True)
+    for summary in summaries:
+        print(f"  {summary['queue']}: {summary['finished']} message(s) finished, "
+              f"{summary['returned']} returned to the queue, {summary['acks']} pending ack(s)/visibility change(s) flushed", flush=True)
+        if summary["unfinished"]:
+            print(f"  ⚠ {summary['queue']}: {summary['unfinished']} batch(es) did not finish before the deadline, "
+                  f"their messages were returned ({summary['killed']} running handler(s) stopped)", flush=True)
+        if summary["receivers"]:
+            print(f"  ⚠ {summary['queue']}: {summary['receivers']} receiver(s) still polling at the deadline, "
+                  f"messages they receive reappear after the visibility timeout", flush=True)
+    print("=" * 60, flush=True)
+
+class Autoscaler:
+    """
+    Escala las invocaciones simultáneas de cada cola (y con ellas los receptores
+    activos, los mensajes en vuelo y los workers Node) según su backlog:
+    ApproximateNumberOfMessages + ApproximateNumberOfMessagesNotVisible.
+    Sube apenas el backlog por invocación supera AUTOSCALE_UP_THRESHOLD batches y
+    baja de a un paso solo tras AUTOSCALE_DOWN_CYCLES lecturas seguidas bajo
+    AUTOSCALE_DOWN_THRESHOLD (histéresis), siempre entre min y max_concurrency.
+    """
+
+    def __init__(self, consumers, pools, resize_pool):
+        self.consumers = consumers
+        self.pools = pools
+        self.resize_pool = resize_pool
+        self._low_readings = {consumer.queue_name: 0 for consumer in consumers}
+
+    def target_concurrency(self, consumer, backlog):
+        """Concurrencia deseada para una cola con el backlog dado."""
+        load = backlog / (consumer.concurrency * consumer.batch_size)
+        if load > AUTOSCALE_UP_THRESHOLD:
+            self._low_readings[consumer.queue_name] = 0
+            wanted = math.ceil(backlog / (consumer.batch_size * AUTOSCALE_UP_THRESHOLD))
+            return consumer._clamp_concurrency(max(consumer.concurrency + 1, wanted))
+        if load < AUTOSCALE_DOWN_THRESHOLD:
+            self._low_readings[consumer.queue_name] += 1
+            if self._low_readings[consumer.queue_name] >= AUTOSCALE_DOWN_CYCLES:
+                self._low_readings[consumer.queue_name] = 0
+                return consumer._clamp_concurrency(consumer.concurrency - 1)
+        else:
+            self._low_readings[consumer.queue_name] = 0
+        return consumer.concurrency
+
+    def __call__(self, depths):
+        """Listener de QueueDepthMonitor."""
+        changed = False
+        totals = {}
+        for consumer in self.consumers:
+            target = consumer.concurrency
+            if consumer.scalable and consumer.queue_name in depths:
+                visible, not_visible = depths[consumer.queue_name]
+                target = self.target_concurrency(consumer, visible + not_visible)
+                if target != consumer.concurrency:
+                    LOG.info(f"  ⇅ [{consumer.queue_name}] Scaling handlers {consumer.concurrency} -> {target} "
+                             f"(backlog: {visible} visible, {not_visible} not visible)",
+                             queue=consumer.queue_name, concurrency=target, visible=visible, notVisible=not_visible)
+                    consumer.scale_to(target)
+                    changed = True
+            totals[consumer.function] = totals.get(consumer.function, 0) + target
+            if consumer.reserved_concurrency:
+                totals[consumer.function] = min(totals[consumer.function], int(consumer.reserved_concurrency))
+
+        if changed:
+            # Un worker Node por cada invocación simultánea de las colas que consumen la función
+            for function_name, size in totals.items():
+                self.resize_pool(self.pools[function_name], size)
+
+def start_autoscaler(monitor, consumers, pools, resize_pool):
+    """Registra el autoscaler en el monitor de colas si alguna cola permite escalar."""
+    if not any(consumer.scalable for consumer in consumers):
+        return None
+    autoscaler = Autoscaler(consumers, pools, resize_pool)
+    monitor.interval = min(monitor.interval, AUTOSCALE_INTERVAL)
+    monitor.add_listener(autoscaler)
+    return autoscaler
+
+# ---------------------------------------------------------------------------
+# Motor asyncio: todas las colas comparten un único event loop. Los receives y
+# acks usan el protocolo JSON de SQS sobre conexiones HTTP keep-alive, y los
+# workers Node se manejan como subprocesos asyncio, sin un thread por cola.
+# ---------------------------------------------------------------------------
+
+class AsyncSQSClient:
+    """Cliente SQS mínimo para asyncio (protocolo JSON de SQS, firmado con SigV4 de botocore)."""
+
+    def __init__(self, endpoint_url=LOCALSTACK_ENDPOINT, region=REGION,
+                 access_key="local", secret_key="local", request_timeout=LONG_POLL_WAIT_SECONDS + 40):
+        parsed = urllib.parse.urlsplit(endpoint_url)
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.region = region
+        self.host = parsed.hostname
+        self.use_ssl = parsed.scheme == "https"
+        self.port = parsed.port or (443 if self.use_ssl else 80)
+        self.request_timeout = request_timeout
+        self._credentials = Credentials(access_key, secret_key)
+        self._idle = []
+
+    async def receive_message(self, **params):
+        return await self.call("ReceiveMessage", params)
+
+    async def delete_message(self, **params):
+        return await self.call("DeleteMessage", params)
+
+    async def delete_message_batch(self, **params):
+        return await self.call("DeleteMessageBatch", params)
+
+    async def change_message_visibility(self, **params):
+        return await self.call("ChangeMessageVisibility", params)
+
+    async def change_message_visibility_batch(self, **params):
+        return await self.call("ChangeMessageVisibilityBatch", params)
+
+    async def call(self, action, params):
+        """Ejecuta una acción SQS y retorna la respuesta; los errores se lanzan como ClientError."""
+        request = AWSRequest(
+            method="POST",
+            url=self.endpoint_url + "/",
+            data=json.dumps(params).encode(),
+            headers={
+                "Content-Type": "application/x-amz-json-1.0",
+                "X-Amz-Target": f"AmazonSQS.{action}",
+            }
+        )
+        SigV4Auth(self._credentials, "sqs", self.region).add_auth(request)
+
+        # Una conexión keep-alive reutilizada puede haber sido cerrada por el servidor
+        for attempt in range(2):
+            reused = bool(self._idle)
+            connection = self._idle.pop() if reused else await self._connect()
+            try:
+                status, headers, payload = await asyncio.wait_for(
+                    self._send(connection, request), self.request_timeout
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection[1].close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                connection[1].close()
+            else:
+                self._idle.append(connection)
+            break
+
+        data = json.loads(payload) if payload else {}
+        if status >= 400:
+            # LocalStack/AWS exponen el código "query" clásico en x-amzn-query-error
+            code = headers.get("x-amzn-query-error", "").split(";")[0] or data.get("__type", "").split("#")[-1]
+            raise ClientError({"Error": {"Code": code, "Message": data.get("message", "")}}, action)
+        return data
+
+    async def _connect(self):
+        return await asyncio.open_connection(self.host, self.port, ssl=self.use_ssl or None)
+
+    async def _send(self, connection, request):
+        reader, writer = connection
+        body = request.body or b""
+        lines = [f"POST / HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in request.headers.items() if name.lower() != "host"]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by SQS endpoint")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in headers:
+            payload = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            payload = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                payload += await reader.readexactly(size)
+                await reader.readline()
+        else:
+            payload = await reader.read()
+            headers["connection"] = "close"
+        return status, headers, payload
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+class AsyncNodeWorker:
+    """Versión asyncio de NodeWorker: mismo script y protocolo, sin threads de lectura."""
+
+    def __init__(self, worker_id, backend_dir, handler_path):
+        self.worker_id = worker_id
+        self.backend_dir = backend_dir
+        self.handler_path = handler_path
+        self.invocations = 0
+        self.rss = 0
+        self.process = None
+        self.killed = False
+        self.output = collections.deque(maxlen=WORKER_OUTPUT_LINES)
+        self.log_output = True
+        self._results = None
+        self._output_task = None
+        self._next_request_id = 0
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """Lanza el proceso y espera a que el handler esté cargado."""
+        handler_file, handler_function = resolve_handler_file(self.backend_dir, self.handler_path)
+        if handler_file is None:
             return False
-        
-        # Usar la ruta absoluta del handler directamente
-        handler_path_without_ext = handler_file_path.replace(".js", "")
-        handler_path_normalized = handler_path_without_ext.replace("\\", "/")  # Normalizar para Windows/Linux
-        
-        # Crear script temporal en /tmp (escribible)
-        import uuid
-        script_id = uuid.uuid4().hex[:8]
-        script_path = os.path.join("/tmp", f"sqs_invoke_{script_id}.js")
-        
-        # Serializar el evento para el script
-        event_json = json.dumps(event)
-        
-        # El código compilado ya importa reflect-metadata, solo necesitamos requerir el handler
-        # Usar ruta absoluta directamente para evitar problemas con process.chdir()
-        script_content = f"""
-// Cambiar al directorio del backend para que las rutas relativas funcionen
-process.chdir('{backend_dir}');
-// Requerir el handler usando la ruta absoluta
-const handler = require('{handler_path_normalized}');
-const event = {event_json};
-(async () => {{
-  try {{
-    await handler.{handler_function}(event);
-    console.log("✓ Handler executed successfully");
-    process.exit(0);
-  }} catch (error) {{
-    console.error("✗ Handler error:", error);
-    if (error.stack) {{
-      console.error(error.stack);
-    }}
-    process.exit(1);
-  }}
-}})();
-"""
-        
-        # Escribir script temporal en /tmp
-        with open(script_path, "w") as f:
-            f.write(script_content)
-        
-        # Ejecutar usando Node.js con el entorno correcto
-        # Pasar TODAS las variables de entorno del contenedor al proceso Node.js
-        env = os.environ.copy()
-        env["NODE_ENV"] = "development"
-        # NODE_PATH debe incluir TODAS las ubicaciones posibles de node_modules
-        env["NODE_PATH"] = f"/app/node_modules:/app/packages/backend/node_modules:{backend_dir}/node_modules:{backend_dir}:/app/packages/backend/dist"
-        
-        # Construir comando Node.js con -r flag para pre-cargar reflect-metadata
-        reflect_metadata_candidates = [
-            "/app/node_modules/reflect-metadata",
-            f"{backend_dir}/node_modules/reflect-metadata",
-            "/app/packages/backend/node_modules/reflect-metadata",
-        ]
-        
-        # Usar -r flag para pre-cargar reflect-metadata desde node_modules de la raíz
-        cmd = ["node", "-r", "/app/node_modules/reflect-metadata", script_path]
-        
-        result = subprocess.run(
-            cmd,
-            cwd=backend_dir,  # Working directory del backend
-            capture_output=True,
-            text=True,
-            timeout=30,
-            env=env
+
+        read_fd, write_fd = os.pipe()
+        env = build_worker_env(self.backend_dir, handler_file, handler_function, write_fd)
+
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *build_node_command(self.backend_dir, write_worker_script()),
+                cwd=self.backend_dir,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                env=env,
+                pass_fds=(write_fd,)
+            )
+        finally:
+            os.close(write_fd)
+
+        loop = asyncio.get_running_loop()
+        self._results = asyncio.StreamReader(limit=WORKER_MAX_MESSAGE_BYTES)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self._results),
+            os.fdopen(read_fd, "rb", buffering=0)
         )
-        
-        # Limpiar script temporal
+        self._output_task = asyncio.create_task(self._forward_output())
+
         try:
-            os.remove(script_path)
-        except:
-            pass
-        
-        if result.returncode != 0:
-            print(f"✗ Handler execution failed:")
-            if result.stderr:
-                print(f"  {result.stderr}")
-            if result.stdout:
-                print(f"  {result.stdout}")
+            ready = await asyncio.wait_for(self._read_message(), WORKER_STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            ready = None
+        if not self._loaded(ready):
+            await self.stop()
             return False
-        
-        if result.stdout:
-            output_lines = result.stdout.strip().split('\n')
-            for line in output_lines:
-                if line.strip():
-                    print(f"  {line}")
         return True
-        
-    except subprocess.TimeoutExpired:
-        print("✗ Handler execution timed out (>30s)")
-        return False
+
+    async def _read_message(self):
+        """Lee la siguiente respuesta del worker; None indica que el proceso terminó."""
+        while True:
+            line = await self._results.readline()
+            if not line:
+                return None
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+
+    async def _forward_output(self):
+        """Reenvía stdout/stderr del handler al log del servicio y guarda las últimas líneas."""
+        async for line in self.process.stdout:
+            self._capture_output(line.decode(errors="replace").rstrip())
+
+    # Lógica sin I/O compartida con NodeWorker
+    _loaded = NodeWorker._loaded
+    _capture_output = NodeWorker._capture_output
+    _new_request = NodeWorker._new_request
+
+    async def invoke(self, event, timeout, trace=False):
+        """Envía un evento al worker y espera su respuesta (con los spans del handler si `trace`)."""
+        request_id, request = self._new_request(event, timeout, trace)
+        try:
+            self.process.stdin.write(request.encode())
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError, OSError) as e:
+            return {"ok": False, "error": f"worker {self.worker_id} is not accepting requests: {e}"}
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = await asyncio.wait_for(self._read_message(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                # Node no puede cancelar la promesa del handler: se descarta el worker
+                await self.kill()
+                return {"ok": False, "error": f"handler execution timed out (>{timeout}s)", "timedOut": True}
+            if response is None:
+                try:
+                    exit_code = await asyncio.wait_for(self.process.wait(), 5)
+                except asyncio.TimeoutError:
+                    exit_code = None
+                return {"ok": False, "error": f"worker {self.worker_id} exited with code {exit_code}"}
+            if response.get("id") == request_id:
+                self.rss = response.get("rss", self.rss)
+                return response
+
+    async def kill(self):
+        """Termina el proceso inmediatamente (p. ej. tras un timeout)."""
+        self.killed = True
+        if self.alive:
+            self.process.kill()
+            await self.process.wait()
+
+    async def stop(self):
+        """Detiene el proceso del worker."""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(self.process.wait(), 2)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+class AsyncWorkerPool:
+    """Versión asyncio de WorkerPool, con las mismas reglas de reciclaje y reinicio."""
+
+    def __init__(self, handler_path, backend_dir=BACKEND_DIR, size=WORKER_POOL_SIZE,
+                 max_invocations=WORKER_MAX_INVOCATIONS, max_rss_mb=WORKER_MAX_RSS_MB, function_name=None):
+        self.handler_path = handler_path
+        self.function_name = function_name or handler_path
+        self.backend_dir = backend_dir
+        self.size = max(1, size)
+        self.max_invocations = max_invocations
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self._idle = asyncio.Queue()
+        self._workers = set()
+        self._busy = set()
+        self._spawned = 0
+        self.recycled = 0
+        self.crashed = 0
+        self.closed = False
+        METRICS.add_collector(collect_pool_metrics(self))
+
+    async def start(self):
+        """Pre-carga todos los workers para no pagar el arranque en el primer mensaje."""
+        for _ in range(self.size):
+            worker = await self._spawn()
+            if worker is None:
+                return False
+            self._idle.put_nowait(worker)
+        return True
+
+    async def resize(self, size):
+        """Ajusta el tamaño del pool; los workers sobrantes se detienen al quedar libres."""
+        self.size = max(1, size)
+        while len(self._workers) > self.size and not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is None:
+                self._idle.put_nowait(None)
+                return
+            await self._retire(worker)
+
+    async def _spawn(self):
+        self._spawned += 1
+        worker = AsyncNodeWorker(self._spawned, self.backend_dir, self.handler_path)
+        self._workers.add(worker)
+        if await worker.start():
+            return worker
+        self._workers.discard(worker)
+        return None
+
+    async def _acquire(self):
+        while True:
+            if self.closed:
+                return None
+            if self._idle.empty() and len(self._workers) < self.size:
+                return await self._spawn()
+            worker = await self._idle.get()
+            if worker is None:
+                # Pool detenido: se despierta también al siguiente que espera un worker
+                self._idle.put_nowait(None)
+                return None
+            if worker.alive:
+                return worker
+            # El worker murió estando inactivo: se reemplaza
+            await self._retire(worker, crashed=True)
+
+    async def _retire(self, worker, crashed=False):
+        self._workers.discard(worker)
+        await worker.stop()
+        self._count_retired(worker, crashed)
+
+    async def _release(self, worker):
+        action = self._release_action(worker)
+        if action == "idle":
+            self._idle.put_nowait(worker)
+        else:
+            await self._retire(worker, crashed=action == "crashed")
+
+    # Reglas de reciclaje compartidas con WorkerPool
+    _count_retired = WorkerPool._count_retired
+    _release_action = WorkerPool._release_action
+
+    async def invoke(self, event, timeout, trace=NULL_TRACE):
+        """Ejecuta el handler con el evento en un worker libre."""
+        acquire_started = time.time()
+        worker = await self._acquire()
+        if worker is None:
+            return {"ok": False, "error": f"could not start a worker for {self.handler_path}"}
+        self._busy.add(worker)
+        try:
+            trace.span("worker.acquire", acquire_started, time.time(), worker=worker.worker_id)
+            invoke_started = time.time()
+            response = await worker.invoke(event, timeout, trace is not NULL_TRACE)
+            trace.worker_response(invoke_started, time.time(), response, worker.worker_id)
+            return dict(response, output=list(worker.output), outputLogged=worker.log_output)
+        finally:
+            self._busy.discard(worker)
+            await self._release(worker)
+
+    async def kill_busy(self):
+        """Versión asyncio de WorkerPool.kill_busy."""
+        busy = list(self._busy)
+        await asyncio.gather(*(worker.kill() for worker in busy), return_exceptions=True)
+        return len(busy)
+
+    async def shutdown(self):
+        """Detiene todos los workers del pool; las invocaciones que esperan un worker fallan."""
+        self.closed = True
+        workers = list(self._workers)
+        self._workers.clear()
+        self._idle.put_nowait(None)
+        await asyncio.gather(*(worker.stop() for worker in workers), return_exceptions=True)
+
+async def invoke_lambda_handler_async(pool, event, timeout, trace=NULL_TRACE):
+    """Versión asyncio de invoke_lambda_handler."""
+    message_ids = {record["messageId"] for record in event["Records"]}
+    try:
+        return get_failed_message_ids(event, await pool.invoke(event, timeout, trace))
+
     except Exception as e:
-        print(f"✗ Error invoking handler: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+        details = traceback.format_exc().rstrip()
+        LOG.error(f"✗ Error invoking handler: {e}", text=f"✗ Error invoking handler: {e}\n{details}",
+                  failedMessageIds=sorted(message_ids), traceback=details)
+        return message_ids
 
-def poll_queue(sqs_client, queue_url, queue_name, config):
-    """Hace polling de una cola SQS y ejecuta el handler cuando hay mensajes."""
-    handler = config["handler"]
-    
-    if not os.path.exists(BACKEND_DIR):
-        print(f"⚠ Warning: Backend directory not found: {BACKEND_DIR}")
-        return
-    
-    print(f"📡 Polling {queue_name} -> {handler}")
-    print(f"   Queue URL: {queue_url}")
-    print(f"   Backend dir: {BACKEND_DIR}")
-    
-    poll_count = 0
-    while RUNNING:
+class AsyncInFlightLimiter:
+    """Versión asyncio de InFlightLimiter."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def reserve(self, wanted, timeout=None):
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.in_flight < self.limit), timeout)
+            except asyncio.TimeoutError:
+                return 0
+            granted = min(wanted, self.limit - self.in_flight)
+            self.in_flight += granted
+            return granted
+
+    async def release(self, count):
+        if count <= 0:
+            return
+        async with self._cond:
+            self.in_flight = max(0, self.in_flight - count)
+            self._cond.notify_all()
+
+    async def set_limit(self, limit):
+        async with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+class AsyncAckBatcher:
+    """Versión asyncio de AckBatcher: delete/change_visibility encolan sin bloquear el loop."""
+
+    def __init__(self, sqs_client, queue_url, queue_name, flush_interval=ACK_FLUSH_INTERVAL):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.queue_name = queue_name
+        self.flush_interval = flush_interval
+        self._deletes = []
+        self._visibility = []
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.create_task(self._flush_loop())
+
+    def delete(self, message):
+        self._deletes.append(message)
+        if len(self._deletes) >= SQS_MAX_BATCH_ENTRIES:
+            self._wake.set()
+
+    def change_visibility(self, message, visibility_timeout):
+        self._visibility.append((message, visibility_timeout))
+        if len(self._visibility) >= SQS_MAX_BATCH_ENTRIES:
+            self._wake.set()
+
+    def pending(self):
+        return len(self._deletes) + len(self._visibility)
+
+    async def close(self):
+        """Envía lo pendiente y detiene la tarea de flush."""
+        self._closed = True
+        self._wake.set()
+        await self._task
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            deletes, self._deletes = self._deletes, []
+            visibility, self._visibility = self._visibility, []
+            closed = self._closed
+            try:
+                await self._flush_deletes(deletes)
+                await self._flush_visibility(coalesce_visibility_changes(deletes, visibility))
+            except Exception as e:
+                LOG.error(f"✗ Error flushing acks for {self.queue_name}: {e}", queue=self.queue_name)
+            if closed:
+                return
+
+    async def _flush_deletes(self, messages):
+        for chunk in chunks(messages):
+            started = time.time()
+            try:
+                response = await self.sqs_client.delete_message_batch(QueueUrl=self.queue_url, Entries=delete_entries(chunk))
+                failed = get_failed_entries(chunk, response)
+            except ClientError as e:
+                LOG.error(f"✗ Error deleting batch from {self.queue_name}: {e}", queue=self.queue_name)
+                failed = chunk
+
+            log_deleted(self.queue_name, chunk, failed, started)
+            for message in failed:
+                try:
+                    started = time.time()
+                    await self.sqs_client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"])
+                    log_message_deleted(self.queue_name, message, started)
+                except ClientError as e:
+                    LOG.error(f"✗ Error deleting message: {e}", queue=self.queue_name, messageId=message["MessageId"])
+
+    async def _flush_visibility(self, changes):
+        for chunk in chunks(changes):
+            try:
+                response = await self.sqs_client.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=visibility_entries(chunk))
+                failed = get_failed_entries(chunk, response)
+            except ClientError as e:
+                LOG.error(f"✗ Error changing visibility in {self.queue_name}: {e}", queue=self.queue_name)
+                failed = chunk
+
+            for message, visibility_timeout in failed:
+                try:
+                    await self.sqs_client.change_message_visibility(
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=message["ReceiptHandle"],
+                        VisibilityTimeout=visibility_timeout
+                    )
+                except ClientError as e:
+                    LOG.error(f"✗ Error changing visibility of message {message['MessageId'][:8]}...: {e}",
+                              queue=self.queue_name, messageId=message["MessageId"])
+
+class AsyncQueueConsumer(ConsumerScaling):
+    """
+    Versión asyncio de QueueConsumer con la misma semántica: receptores como
+    tareas, invocaciones acotadas por `concurrency` y mensajes en vuelo por
+    `max_in_flight`.
+    """
+
+    def __init__(self, sqs_client, queue_url, queue_name, config, pool):
+        self.sqs_client = sqs_client
+        self.acker = AsyncAckBatcher(sqs_client, queue_url, queue_name)
+        self.failure_visibility_timeout = int(config.get("failure_visibility_timeout", FAILURE_VISIBILITY_TIMEOUT))
+        self.timeout = get_handler_timeout(config)
+        self.heartbeat = VisibilityHeartbeat(
+            self.acker, queue_name, int(config.get("visibility_timeout") or DEFAULT_VISIBILITY_TIMEOUT)
+        )
+        self.queue_url = queue_url
+        self.queue_name = queue_name
+        self.handler = config["handler"]
+        self.function = get_function_name(config)
+        self.reserved_concurrency = config.get("reserved_concurrency")
+        self.pool = pool
+        self.batch_size = get_batch_size(config)
+        self.lanes = PartitionLanes(get_partition_key_fields(config))
+        self.dedup = DedupCache(
+            split_fields(config.get("dedup_key", DEDUP_KEY_FIELDS)),
+            int(config.get("dedup_cache_size", DEDUP_CACHE_SIZE)),
+            float(config.get("dedup_ttl", DEDUP_TTL))
+        )
+        self._init_scaling(config)
+        self.limiter = AsyncInFlightLimiter(self._in_flight_limit())
+        self.slots = AsyncInFlightLimiter(self.concurrency)
+        self.scheduler = PollScheduler()
+        METRICS.add_collector(collect_consumer_metrics(self))
+        self._tasks = set()
+        self._receivers = []
+        self._heartbeat_task = None
+        self._loop = None
+        self._last_status_log = time.monotonic()
+        self._drain_counts = collections.Counter()
+        self._drained = False
+
+    def start(self):
+        """Crea las tareas receptoras."""
+        print(f"📡 Polling {self.queue_name} -> {self.handler} (batch size {self.batch_size}, asyncio)")
+        print(f"   Queue URL: {self.queue_url}")
+        print(f"   Backend dir: {BACKEND_DIR}")
+        print(f"   Concurrency: {self.concurrency} handler(s), {self.receivers} receiver(s), {self._describe_in_flight()}")
+        if self.scalable:
+            print(f"   Autoscaling: {self.min_concurrency}-{self.max_concurrency} handler(s)")
+        print(f"   Handler timeout: {self.timeout}s (visibility {self.heartbeat.visibility_timeout}s, "
+              f"extended every {self.heartbeat.interval:.0f}s while pending)")
+        if self.lanes.key_fields:
+            print(f"   Ordering: serial per MessageGroupId/{', '.join(self.lanes.key_fields)}, parallel across keys")
+        if self.dedup.enabled:
+            print(f"   Deduplication: last {self.dedup.size} completed message(s) for {self.dedup.ttl:.0f}s "
+                  f"(MessageId{''.join(', ' + field for field in self.dedup.key_fields)})")
+        for line in self._describe_resilience():
+            print(line)
+        self._loop = asyncio.get_running_loop()
+        self._receivers = [asyncio.create_task(self._receive_loop(index)) for index in range(self.max_receivers)]
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def drain(self, deadline):
+        """
+        Igual que QueueConsumer.drain: espera receptores y handlers hasta `deadline`,
+        termina los workers que siguen ejecutando un handler, devuelve con
+        visibilidad 0 lo que no terminó y envía los acks pendientes. Cancelar la
+        tarea de un batch no detiene su handler en Node: sin terminar el worker,
+        el handler seguiría corriendo con los mensajes ya devueltos.
+        """
+        if self._receivers:
+            await asyncio.wait(self._receivers, timeout=max(0.0, deadline - time.monotonic()))
+        polling = [task for task in self._receivers if not task.done()]
+        for task in polling:
+            task.cancel()
+        while len(self.heartbeat) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        unfinished = self.heartbeat.untrack_all()
+        killed = await self.pool.kill_busy() if unfinished else 0
+        for messages in unfinished:
+            self._return_messages(messages)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*polling, return_exceptions=True)
+        # Los batches cancelados pueden lanzar el siguiente de su carril, que termina sin ejecutarse
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        acks = self.acker.pending()
+        await self.acker.close()
+        self._drained = True
+        await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+        return {
+            "queue": self.queue_name,
+            "finished": self._drain_counts["finished"],
+            "returned": self._drain_counts["returned"],
+            "unfinished": len(unfinished),
+            "killed": killed,
+            "receivers": len(polling),
+            "acks": acks,
+        }
+
+    def _count_drain(self, name, count):
+        self._drain_counts[name] += count
+
+    def _return_messages(self, messages):
+        return_messages(messages, self.acker)
+        self._count_drain("returned", len(messages))
+
+    def scale_to(self, concurrency):
+        """Ajusta la concurrencia; puede llamarse desde otro thread (p. ej. el autoscaler)."""
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._apply_scale(concurrency)))
+
+    async def _apply_scale(self, concurrency):
+        self._set_concurrency(concurrency)
+        await self._apply_limits()
+
+    async def _apply_limits(self):
+        await self.slots.set_limit(self.effective_concurrency)
+        await self.limiter.set_limit(self._in_flight_limit())
+
+    async def _heartbeat_loop(self):
+        while not self._drained:
+            try:
+                delay = self.heartbeat.tick()
+            except Exception as e:
+                LOG.error(f"✗ Error extending visibility in {self.queue_name}: {e}", queue=self.queue_name)
+                delay = self.heartbeat.interval
+            await asyncio.sleep(min(delay, 1.0))
+
+    async def _receive_loop(self, index):
+        while RUNNING:
+            if index >= self.receivers or self.breaker.blocked:
+                # Receptor en espera hasta que el autoscaling lo active o el circuito deje probar
+                await asyncio.sleep(0.5)
+                continue
+            reserved = 0
+            try:
+                # Esperar cupo antes de recibir para no retener mensajes que no se pueden procesar
+                reserved = await self.limiter.reserve(self.batch_size, timeout=1)
+                if not reserved:
+                    continue
+
+                self._log_status()
+
+                # Recibir mensajes (long polling: retorna apenas llega un mensaje)
+                wait_time = self.scheduler.next_wait_time()
+                started = time.monotonic()
+                response = await self.sqs_client.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=reserved,
+                    WaitTimeSeconds=wait_time,
+                    MessageAttributeNames=["All"],
+                    AttributeNames=["All"]
+                )
+
+                messages = response.get("Messages", [])
+                elapsed = time.monotonic() - started
+                observe_receive(self.queue_name, messages, elapsed)
+                TRACER.received(self.queue_name, messages, time.time() - elapsed, time.time(), f"receiver-{index + 1}")
+                delay = self.scheduler.record_result(reserved, len(messages), elapsed, wait_time)
+                # Devolver los cupos que no se usaron
+                await self.limiter.release(reserved - len(messages))
+                reserved = 0
+
+                if messages and not RUNNING:
+                    # Llegaron con el drenaje en curso: devolverlos en vez de procesarlos
+                    self._return_messages(messages)
+                    await self.limiter.release(len(messages))
+                elif messages:
+                    LOG.info(f"\n📨 [{self.queue_name}] Received {len(messages)} message(s)", sample=True,
+                             queue=self.queue_name, messages=len(messages))
+                    self._dispatch(messages)
+                if delay:
+                    await asyncio.sleep(delay)
+
+            except asyncio.CancelledError:
+                await self.limiter.release(reserved)
+                raise
+            except Exception as e:
+                await self.limiter.release(reserved)
+                RECEIVE_ERRORS_TOTAL.inc(queue=self.queue_name)
+                delay = self.scheduler.record_error()
+                LOG.error(f"✗ Error polling {self.queue_name}: {e} (retrying in {delay:.1f}s)", queue=self.queue_name, retryIn=delay)
+                await asyncio.sleep(delay)
+
+    _log_status = QueueConsumer._log_status
+
+    def _dispatch(self, messages):
+        skipped, batches = self._enqueue_batches(messages)
+        if skipped:
+            self._spawn(self.limiter.release(skipped))
+        for groups in batches:
+            self._spawn(self._process_batch(groups))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process_batch(self, groups):
+        """Ejecuta el handler en una sola invocación para uno o más grupos y confirma los mensajes exitosos."""
+        messages = [message for _, (group, _) in groups for message in group]
+        failures = [{message["MessageId"] for message in group} for _, (group, _) in groups]
+        slot = 0
+        permit = False
         try:
-            poll_count += 1
-            # Log cada 50 polls para no saturar (cada ~100 segundos)
-            if poll_count % 50 == 0:
-                print(f"  [{queue_name}] Still polling... (poll #{poll_count})")
-            
-            # Recibir mensajes (usar long polling para ser más eficiente)
-            response = sqs_client.receive_message(
-                QueueUrl=queue_url,
-                MaxNumberOfMessages=MAX_MESSAGES,
-                WaitTimeSeconds=20,  # Long polling (más eficiente y rápido)
-                MessageAttributeNames=["All"],
-                AttributeNames=["All"]
-            )
-            
-            messages = response.get("Messages", [])
-            
-            if messages:
-                print(f"\n📨 [{queue_name}] Received {len(messages)} message(s)", flush=True)
-                
-                # Log del primer mensaje para debugging
-                if messages:
-                    first_msg_body = messages[0].get("Body", "")
-                    print(f"  First message body (first 500 chars): {first_msg_body[:500]}", flush=True)
-                    print(f"  Message ID: {messages[0].get('MessageId', 'N/A')}", flush=True)
-                
-                # Crear evento SQS
-                sqs_event = create_sqs_event(messages)
-                
-                # Ejecutar handler
-                print(f"  Invoking handler: {handler}")
-                print(f"  Backend dir: {BACKEND_DIR}")
-                success = invoke_lambda_handler(BACKEND_DIR, handler, sqs_event)
-                
-                if success:
-                    # Eliminar mensajes de la cola (ack)
-                    for message in messages:
-                        try:
-                            sqs_client.delete_message(
-                                QueueUrl=queue_url,
-                                ReceiptHandle=message["ReceiptHandle"]
-                            )
-                            print(f"✓ Message {message['MessageId'][:8]}... deleted")
-                        except ClientError as e:
-                            print(f"✗ Error deleting message: {e}")
-                else:
-                    # Si el handler falla, el mensaje quedará visible después del timeout
-                    print(f"⚠ Handler failed, message will be retried after visibility timeout")
-            else:
-                # No hay mensajes, esperar un poco
-                time.sleep(POLL_INTERVAL)
-                
-        except KeyboardInterrupt:
-            break
+            ready = await self.rate_limiter.wait_async(len(messages))
+            while ready and RUNNING and not slot:
+                slot = await self.slots.reserve(1, timeout=1)
+            while ready and RUNNING and not permit:
+                permit = self.breaker.allow()
+                if not permit:
+                    await asyncio.sleep(CIRCUIT_WAIT_INTERVAL)
+            if not ready or not RUNNING:
+                # Drenando: no se inician handlers nuevos
+                self._return_unstarted(groups)
+                failures = [set() for _ in groups]
+                return
+            started = time.monotonic()
+            trace, event = self._start_batch(messages)
+            failed = await invoke_lambda_handler_async(self.pool, event, self.timeout, trace)
+            result = self._finish_batch(groups, messages, failed, permit, started, trace)
+            if result is None:
+                return
+            permit = False
+            failures, changed = result
+            if changed:
+                await self._apply_limits()
         except Exception as e:
-            print(f"✗ Error polling {queue_name}: {e}")
-            time.sleep(POLL_INTERVAL)
+            LOG.error(f"✗ Error processing batch from {self.queue_name}: {e}", queue=self.queue_name)
+        finally:
+            self.breaker.cancel(permit)
+            for _, (_, heartbeat) in groups:
+                self.heartbeat.untrack(heartbeat)
+            await self.slots.release(slot)
+            await self.limiter.release(len(messages))
+            await self._advance_lanes(groups, failures)
+
+    async def _advance_lanes(self, groups, failures):
+        released, batches = self._complete_lanes(groups, failures)
+        await self.limiter.release(released)
+        for next_groups in batches:
+            self._spawn(self._process_batch(next_groups))
+
+async def run_async_engine(queue_urls, monitor):
+    """Ejecuta todas las colas en un único event loop hasta que se pida detener el servicio."""
+    sqs_client = AsyncSQSClient()
+
+    # Pre-cargar un pool de workers por función, como en el modo con threads
+    print("Starting worker pools...", flush=True)
+    pools = {}
+    for function_name, (handler, size) in get_pool_sizes(queue_urls).items():
+        pool = AsyncWorkerPool(handler, size=size, function_name=function_name)
+        if not await pool.start():
+            print(f"⚠ Worker pool for {function_name} ({handler}) could not be preloaded, workers will be started on demand", flush=True)
+        pools[function_name] = pool
+
+    print(flush=True)
+    print("Starting pollers...", flush=True)
+    print(flush=True)
+
+    consumers = []
+    for queue_name, queue_url in queue_urls.items():
+        config = QUEUE_HANDLERS[queue_name]
+        consumer = AsyncQueueConsumer(sqs_client, queue_url, queue_name, config, pools[get_function_name(config)])
+        consumer.start()
+        consumers.append(consumer)
+
+    loop = asyncio.get_running_loop()
+    start_autoscaler(monitor, consumers, pools, lambda pool, size: asyncio.run_coroutine_threadsafe(pool.resize(size), loop))
+    monitor.start()
+
+    print(f"✓ {len(consumers)} poller(s) started (asyncio engine)", flush=True)
+    print("Press Ctrl+C to stop\n", flush=True)
+
+    global RUNNING
+    try:
+        while RUNNING:
+            await asyncio.sleep(0.5)
+    finally:
+        RUNNING = False
+        started = time.monotonic()
+        summaries = await asyncio.gather(*(consumer.drain(started + DRAIN_TIMEOUT) for consumer in consumers))
+        print_drain_summary(summaries, time.monotonic() - started)
+        for pool in pools.values():
+            await pool.shutdown()
+        await sqs_client.close()
+
+# ---------------------------------------------------------------------------
+# Modo multi-proceso: un supervisor reparte las colas entre procesos hijos que
+# ejecutan este mismo script, para usar más de un core (cada hijo tiene su GIL,
+# su cliente boto3, sus consumidores y sus pools de workers Node)
+# ---------------------------------------------------------------------------
+
+METRIC_SAMPLE = re.compile(r"([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$")
+
+def get_available_cpus():
+    """Cores disponibles: la afinidad de CPU del proceso, acotada por la cuota de cgroup (--cpus de Docker)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def get_process_count(value=POLLER_PROCESSES):
+    """Procesos consumidores a lanzar (1 en los hijos: no hay supervisores anidados)."""
+    if POLLER_PROCESS:
+        return 1
+    if value.strip().lower() == "auto":
+        return get_available_cpus()
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"⚠ Invalid POLLER_PROCESSES '{value}' (use a number or 'auto'), using 1", flush=True)
+        return 1
+
+def assign_queues(queue_names, processes):
+    """
+    Reparte las colas entre los procesos: en round-robin si hay más colas que
+    procesos, o una cola por proceso (repitiendo colas) si hay más procesos.
+    Varios procesos sobre una misma cola compiten por sus mensajes como
+    consumidores independientes, cada uno con la concurrencia configurada.
+    """
+    if processes <= len(queue_names):
+        return [queue_names[index::processes] for index in range(processes)]
+    return [[queue_names[index % len(queue_names)]] for index in range(processes)]
+
+def split_rate_limits(limits, assignments):
+    """
+    RATE_LIMITS de cada proceso hijo: el límite de una función se reparte entre
+    los procesos que consumen sus colas para que el total no cambie, y cada hijo
+    recibe solo las funciones que invoca. Las Task de las state machines corren
+    en step-functions-local.py, con su propio RATE_LIMITS.
+    """
+    functions = [{get_function_name(QUEUE_HANDLERS[queue_name]) for queue_name in queues} for queues in assignments]
+    consumers = collections.Counter(function_name for names in functions for function_name in names)
+    return [
+        ",".join(f"{function_name}={rate / consumers[function_name]:g}:{burst / consumers[function_name]:g}"
+                 for function_name, (rate, burst) in limits.items() if function_name in names)
+        for names in functions
+    ]
+
+def get_process_path(path, number):
+    """Archivo propio de un proceso hijo (trace.json -> trace.2.json) para no mezclar escrituras."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{number}{extension}"
+
+def merge_process_metrics(outputs):
+    """
+    Une las salidas de /metrics de varios procesos [(número de proceso o None,
+    texto)]: un HELP/TYPE por métrica y las muestras de cada proceso con la
+    etiqueta process.
+    """
+    families = {}  # nombre -> (líneas HELP/TYPE, muestras)
+    for process, text in outputs:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                family = families.setdefault(line.split(" ", 3)[2], ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+                continue
+            match = METRIC_SAMPLE.match(line)
+            if family is None or not match:
+                continue
+            name, labels, value = match.groups()
+            if process is not None:
+                labels = f'process="{process}"' + (f",{labels}" if labels else "")
+            family[1].append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    lines = []
+    for meta, samples in families.values():
+        lines.extend(meta)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+class PollerProcess:
+    """Proceso hijo del supervisor y su estado de reinicios."""
+
+    def __init__(self, number, queues, metrics_port, rate_limits):
+        self.number = number
+        self.queues = queues
+        self.metrics_port = metrics_port
+        self.rate_limits = rate_limits
+        self.process = None
+        self.started = 0.0
+        self.restarts = 0
+        self.backoff = SUPERVISOR_RESTART_BACKOFF
+        self.restart_at = None
+        self.scraped = False
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+class Supervisor:
+    """
+    Lanza un proceso hijo por grupo de colas, lo reinicia si termina (con una
+    espera que se duplica si vuelve a terminar antes de SUPERVISOR_STABLE_SECONDS)
+    y al detenerse les reenvía SIGTERM para que cada uno drene sus mensajes.
+    Cada hijo sirve sus métricas en METRICS_PORT + número; el supervisor las
+    agrega en METRICS_PORT con la etiqueta process, junto a un /health global.
+    """
+
+    def __init__(self, assignments, metrics_port=METRICS_PORT):
+        self.children = [
+            PollerProcess(number, queues, metrics_port + number if metrics_port else 0, rate_limits)
+            for number, (queues, rate_limits) in enumerate(zip(assignments, split_rate_limits(RATE_LIMIT_CONFIG, assignments)), start=1)
+        ]
+        METRICS.add_collector(self._collect)
+
+    def start(self):
+        for child in self.children:
+            self._spawn(child)
+
+    def _spawn(self, child):
+        env = dict(os.environ, POLLER_PROCESS=str(child.number), POLLER_QUEUES=",".join(child.queues),
+                   METRICS_PORT=str(child.metrics_port), RATE_LIMITS=child.rate_limits)
+        for name in ("RECORD_FILE", "TRACE_FILE", "TRACE_SLOW_FILE"):
+            if env.get(name):
+                env[name] = get_process_path(env[name], child.number)
+        # En su propia sesión, para que un Ctrl+C en la terminal no les llegue dos veces
+        child.process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env, start_new_session=True)
+        child.started = time.monotonic()
+        print(f"  ▶ Process {child.number} (pid {child.process.pid}): {', '.join(child.queues)}", flush=True)
+
+    def supervise(self):
+        """Reinicia los hijos que terminan mientras el servicio sigue activo."""
+        while RUNNING:
+            now = time.monotonic()
+            for child in self.children:
+                if child.restart_at is not None:
+                    if now >= child.restart_at:
+                        child.restart_at = None
+                        child.restarts += 1
+                        PROCESS_RESTARTS_TOTAL.inc(process=child.number)
+                        self._spawn(child)
+                    continue
+                code = child.process.poll()
+                if code is None:
+                    continue
+                if now - child.started >= SUPERVISOR_STABLE_SECONDS:
+                    child.backoff = SUPERVISOR_RESTART_BACKOFF
+                delay = child.backoff
+                child.backoff = min(child.backoff * 2, SUPERVISOR_RESTART_BACKOFF_MAX)
+                child.restart_at = now + delay
+                print(f"✗ Process {child.number} (pid {child.process.pid}) exited with code {code}, "
+                      f"restarting in {delay:g}s", flush=True)
+            time.sleep(0.5)
+
+    def stop(self, timeout):
+        """Reenvía SIGTERM a los hijos, espera hasta `timeout` a que drenen y mata a los que sigan."""
+        for child in self.children:
+            if child.alive:
+                child.process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for child in self.children:
+            if child.process is None:
+                continue
+            try:
+                child.process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"⚠ Process {child.number} did not finish draining, killing it", flush=True)
+                child.process.kill()
+                child.process.wait()
+
+    def kill(self):
+        for child in self.children:
+            if child.alive:
+                child.process.kill()
+
+    def render_metrics(self):
+        outputs = []
+        for child in self.children:
+            child.scraped = False
+            if not child.alive or not child.metrics_port:
+                continue
+            try:
+                url = f"http://127.0.0.1:{child.metrics_port}/metrics"
+                with urllib.request.urlopen(url, timeout=SUPERVISOR_SCRAPE_TIMEOUT) as response:
+                    outputs.append((child.number, response.read().decode()))
+                child.scraped = True
+            except OSError:
+                continue
+        # Las métricas propias (process_up, restarts) sin etiqueta process
+        return merge_process_metrics([(None, METRICS.render())] + outputs)
+
+    def _collect(self):
+        for child in self.children:
+            PROCESS_UP.set(1 if child.alive and (child.scraped or not child.metrics_port) else 0, process=child.number)
+
+    def health(self):
+        processes = [
+            {"process": child.number, "pid": child.process.pid if child.process else None, "queues": child.queues,
+             "alive": child.alive, "restarts": child.restarts,
+             "uptime": round(time.monotonic() - child.started, 1) if child.alive else 0}
+            for child in self.children
+        ]
+        healthy = RUNNING and all(process["alive"] for process in processes)
+        return healthy, {"status": "ok" if healthy else ("degraded" if RUNNING else "draining"), "processes": processes}
+
+class SupervisorRequestHandler(MetricsRequestHandler):
+    """/metrics y /health agregados de los procesos hijos."""
+
+    def render_metrics(self):
+        return self.server.supervisor.render_metrics()
+
+    def health(self):
+        return self.server.supervisor.health()
+
+def run_supervisor(queue_names, processes):
+    """Modo multi-proceso: lanza y supervisa los hijos hasta recibir SIGTERM/SIGINT."""
+    global RUNNING
+    supervisor = Supervisor(assign_queues(queue_names, processes))
+
+    def handle_signal(sig, frame):
+        # Los hijos están en otra sesión: una segunda señal también debe terminarlos
+        if not RUNNING:
+            supervisor.kill()
+        signal_handler(sig, frame)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    print(f"Starting {len(supervisor.children)} poller process(es)...", flush=True)
+    supervisor.start()
+    server = start_metrics_server(handler=SupervisorRequestHandler)
+    if server:
+        server.supervisor = supervisor
+    print(f"✓ {len(supervisor.children)} poller process(es) started", flush=True)
+    print("Press Ctrl+C to stop\n", flush=True)
+    try:
+        supervisor.supervise()
+    finally:
+        RUNNING = False
+        # Los hijos drenan en DRAIN_TIMEOUT; el margen cubre el resumen y el cierre de workers
+        supervisor.stop(DRAIN_TIMEOUT + 5)
+
+def get_queue_visibility_timeout(sqs_client, queue_url):
+    """Lee el VisibilityTimeout de una cola (el valor por defecto de SQS si no se puede leer)."""
+    try:
+        response = sqs_client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["VisibilityTimeout"])
+        return int(response["Attributes"]["VisibilityTimeout"])
+    except (ClientError, KeyError, ValueError) as e:
+        print(f"⚠ Could not read VisibilityTimeout of {queue_url}, using {DEFAULT_VISIBILITY_TIMEOUT}s: {e}", flush=True)
+        return DEFAULT_VISIBILITY_TIMEOUT
+
+def get_pool_sizes(queue_urls):
+    """
+    Retorna {función: (handler, workers)}: un worker por cada invocación simultánea
+    que permitan las colas de la función (al menos WORKER_POOL_SIZE), sin superar
+    su reservedConcurrency.
+    """
+    handlers = {}
+    sizes = {}
+    limits = {}
+    for queue_name in queue_urls:
+        config = QUEUE_HANDLERS[queue_name]
+        function_name = get_function_name(config)
+        handlers[function_name] = config["handler"]
+        sizes[function_name] = sizes.get(function_name, 0) + int(config.get("concurrency", QUEUE_CONCURRENCY))
+        if config.get("reserved_concurrency"):
+            limits[function_name] = int(config["reserved_concurrency"])
+
+    return {
+        function_name: (handler, min(max(WORKER_POOL_SIZE, sizes[function_name]), limits.get(function_name, math.inf)))
+        for function_name, handler in handlers.items()
+    }
 
 def main():
     """Función principal."""
+    global RUNNING
+    processes = get_process_count()
     print("=" * 60, flush=True)
     print("SQS Lambda Poller Service", flush=True)
     print("=" * 60, flush=True)
     print(f"SQS Endpoint: {LOCALSTACK_ENDPOINT}", flush=True)
     print(f"Region: {REGION}", flush=True)
-    print(f"Poll interval: {POLL_INTERVAL}s", flush=True)
+    print(f"Long poll wait: {LONG_POLL_WAIT_SECONDS}s (error backoff {POLL_BACKOFF_BASE}s-{POLL_BACKOFF_MAX}s)", flush=True)
+    print(f"Batch size: {MAX_MESSAGES}", flush=True)
+    print(f"Handler timeout: {f'{HANDLER_TIMEOUT}s' if HANDLER_TIMEOUT else 'queue visibility timeout'}", flush=True)
     print(f"Backend dir: {BACKEND_DIR}", flush=True)
+    print(f"Engine: {POLLER_ENGINE}", flush=True)
+    if POLLER_PROCESS:
+        print(f"Process: {POLLER_PROCESS} (queues: {POLLER_QUEUES})", flush=True)
+    else:
+        print(f"Processes: {processes}{' (auto)' if POLLER_PROCESSES.strip().lower() == 'auto' else ''}", flush=True)
+    print(f"Drain timeout: {DRAIN_TIMEOUT:g}s", flush=True)
+    print(f"Recording: {RECORD_FILE or 'disabled'}", flush=True)
+    print(f"Logging: {LOG_FORMAT}, level {LOG_LEVEL}{f', sampled {LOG_SAMPLE}' if LOG_SAMPLE else ''}", flush=True)
+    print(f"Tracing: {', '.join(filter(None, [TRACE_FILE, TRACE_SLOW_FILE and f'{TRACE_SLOW_FILE} (>= {TRACE_SLOW_MS:g}ms)'])) or 'disabled'}", flush=True)
+    print(f"Rate limits: {describe_rate_limits(RATE_LIMIT_CONFIG) or 'disabled'}", flush=True)
+    print(f"Worker pool: {WORKER_POOL_SIZE} per handler (recycle after {WORKER_MAX_INVOCATIONS} invocations or {WORKER_MAX_RSS_MB} MB)", flush=True)
     print("=" * 60, flush=True)
     print(flush=True)
-    
+
     # Crear cliente SQS
     sqs_client = boto3.client(
         "sqs",
@@ -267,7 +4079,7 @@ def main():
         aws_access_key_id="local",
         aws_secret_access_key="local"
     )
-    
+
     # Esperar a que LocalStack esté disponible
     print("Waiting for LocalStack to be available...", flush=True)
     for i in range(30):
@@ -282,9 +4094,28 @@ def main():
             else:
                 print(f"✗ Error: LocalStack not available: {e}", flush=True)
                 sys.exit(1)
-    
+
     print()
-    
+
+    # Mapeo de colas a funciones desde serverless.yml (si declara eventos sqs)
+    queue_handlers = load_serverless_queue_handlers()
+    if queue_handlers:
+        QUEUE_HANDLERS.clear()
+        QUEUE_HANDLERS.update(queue_handlers)
+        print(f"✓ Loaded {len(queue_handlers)} queue mapping(s) from {SERVERLESS_CONFIG}", flush=True)
+    else:
+        print(f"⚠ No sqs events found in {SERVERLESS_CONFIG}, using default queue mapping", flush=True)
+    if POLLER_QUEUES:
+        # Proceso hijo: solo las colas que le asignó el supervisor
+        selected = split_fields(POLLER_QUEUES)
+        for queue_name in list(QUEUE_HANDLERS):
+            if queue_name not in selected:
+                del QUEUE_HANDLERS[queue_name]
+    for queue_name, config in QUEUE_HANDLERS.items():
+        min_concurrency, _, max_concurrency = get_concurrency_bounds(config)
+        print(f"  {queue_name} -> {get_function_name(config)} ({config['handler']}, batch size {get_batch_size(config)}, "
+              f"concurrency {min_concurrency}-{max_concurrency})", flush=True)
+
     # Obtener URLs de todas las colas
     print("\nLooking for queues...", flush=True)
     queue_urls = {}
@@ -298,7 +4129,7 @@ def main():
                 print(f"⚠ Queue not found: {queue_name}", flush=True)
             else:
                 print(f"✗ Error getting queue URL for {queue_name}: {e}", flush=True)
-    
+
     if not queue_urls:
         print("\n⚠ No queues found. Waiting for queues to be created...", flush=True)
         time.sleep(5)
@@ -311,38 +4142,91 @@ def main():
                     print(f"✓ Found queue (retry): {queue_name}", flush=True)
                 except:
                     pass
-    
+
+    if not os.path.exists(BACKEND_DIR):
+        print(f"⚠ Warning: Backend directory not found: {BACKEND_DIR}", flush=True)
+        queue_urls = {}
+
+    # El timeout de cada handler se alinea con el VisibilityTimeout de su cola
+    for queue_name, queue_url in queue_urls.items():
+        config = QUEUE_HANDLERS[queue_name]
+        if not config.get("visibility_timeout"):
+            config["visibility_timeout"] = get_queue_visibility_timeout(sqs_client, queue_url)
+        timeout = get_handler_timeout(config)
+        if timeout > config["visibility_timeout"]:
+            print(f"  {queue_name}: handler timeout {timeout}s exceeds visibility timeout "
+                  f"{config['visibility_timeout']}s, visibility will be extended while it runs", flush=True)
+
+    print(flush=True)
+    if POLLER_ENGINE not in ("threads", "asyncio"):
+        print(f"✗ Error: unknown POLLER_ENGINE '{POLLER_ENGINE}' (use 'threads' or 'asyncio')", flush=True)
+        sys.exit(1)
+    if processes > 1 and queue_urls:
+        run_supervisor(list(queue_urls), processes)
+        return
+    start_metrics_server()
+    monitor = QueueDepthMonitor(sqs_client, queue_urls)
+    if queue_urls and POLLER_ENGINE == "asyncio":
+        try:
+            asyncio.run(run_async_engine(queue_urls, monitor))
+        finally:
+            EVENT_RECORDER.close()
+            TRACER.close()
+            LOG.close()
+        return
+
+    # Pre-cargar un pool de workers por función (compartido entre sus colas), con
+    # al menos un worker por cada invocación simultánea que permitan las colas,
+    # para que una función lenta no acapare los workers de las demás
+    print("Starting worker pools...", flush=True)
+    pools = {}
+    for function_name, (handler, size) in get_pool_sizes(queue_urls).items():
+        pool = WorkerPool(handler, size=size, function_name=function_name)
+        if not pool.start():
+            print(f"⚠ Worker pool for {function_name} ({handler}) could not be preloaded, workers will be started on demand", flush=True)
+        pools[function_name] = pool
+
     print(flush=True)
     print("Starting pollers...", flush=True)
     print(flush=True)
-    
-    # Iniciar polling para cada cola en procesos separados o threads
-    import threading
-    
+
+    # Iniciar un consumidor por cola, cada uno con sus threads receptores y su executor
+    consumers = []
     threads = []
     for queue_name, queue_url in queue_urls.items():
         if queue_name in QUEUE_HANDLERS:
             config = QUEUE_HANDLERS[queue_name]
-            thread = threading.Thread(
-                target=poll_queue,
-                args=(sqs_client, queue_url, queue_name, config),
-                daemon=True
-            )
-            thread.start()
-            threads.append(thread)
-    
+            consumer = QueueConsumer(sqs_client, queue_url, queue_name, config, pools[get_function_name(config)])
+            threads.extend(consumer.start())
+            consumers.append(consumer)
+    start_autoscaler(monitor, consumers, pools, lambda pool, size: pool.resize(size))
+    monitor.start()
+
     if not threads:
         print("⚠ No pollers started. Make sure queues exist and backend is built.", flush=True)
         print("Waiting... (press Ctrl+C to stop)", flush=True)
         while RUNNING:
             time.sleep(1)
     else:
-        print(f"✓ {len(threads)} poller(s) started", flush=True)
+        print(f"✓ {len(consumers)} poller(s) started", flush=True)
         print("Press Ctrl+C to stop\n", flush=True)
-        
-        # Esperar a que todos los threads terminen
-        for thread in threads:
-            thread.join()
+
+        try:
+            while RUNNING:
+                time.sleep(0.5)
+        finally:
+            # Drenar todas las colas en paralelo con un mismo plazo
+            RUNNING = False
+            started = time.monotonic()
+            deadline = started + DRAIN_TIMEOUT
+            with ThreadPoolExecutor(max_workers=len(consumers), thread_name_prefix="drain") as executor:
+                summaries = list(executor.map(lambda consumer: consumer.drain(deadline), consumers))
+            print_drain_summary(summaries, time.monotonic() - started)
+            for pool in pools.values():
+                pool.shutdown()
+            EVENT_RECORDER.close()
+            TRACER.close()
+            LOG.close()
 
 if __name__ == "__main__":
     main()
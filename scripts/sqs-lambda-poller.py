@@ -5,6 +5,9 @@ Este script simula el comportamiento de AWS Lambda cuando hay event sources SQS.
 
 Uso: python scripts/sqs-lambda-poller.py <queue_name> <handler_path>
 
+El batch size se configura con SQS_BATCH_SIZE (1-10). Si el handler retorna
+`batchItemFailures`, solo se eliminan de la cola los mensajes exitosos.
+
 Ejemplo:
   python scripts/sqs-lambda-poller.py dev-payments-queue dist/main.handler
 """
@@ -16,12 +19,14 @@ import time
 import subprocess
 import os
 from botocore.exceptions import ClientError
+from sqs_lambda_events import parse_batch_item_failures
 
 # Configuración
 LOCALSTACK_ENDPOINT = os.getenv("SQS_ENDPOINT", "http://localstack:4566")
 REGION = os.getenv("AWS_REGION", "us-east-1")
 POLL_INTERVAL = 2  # segundos entre polling
-MAX_MESSAGES = 1  # batch size (similar a serverless.yml)
+MAX_MESSAGES = min(max(int(os.getenv("SQS_BATCH_SIZE", "1")), 1), 10)  # batch size (1-10, límite de SQS)
+RESULT_MARKER = "__SQS_HANDLER_RESULT__"
 
 def create_sqs_event(records):
     """Crea un evento SQS compatible con AWS Lambda a partir de los mensajes."""
@@ -45,7 +50,11 @@ def create_sqs_event(records):
     }
 
 def invoke_lambda_handler(backend_dir, handler_path, event):
-    """Ejecuta el handler de Lambda con el evento."""
+    """
+    Ejecuta el handler de Lambda con el evento.
+    Retorna el conjunto de messageId que fallaron (vacío si todo el batch fue exitoso).
+    """
+    message_ids = {record["messageId"] for record in event["Records"]}
     try:
         # Construir el comando para ejecutar el handler
         # El handler path debe ser algo como: dist/main.handler
@@ -57,8 +66,9 @@ const handler = require('./{handler_file}');
 const event = {json.dumps(event)};
 
 handler.{handler_function}(event)
-  .then(() => {{
+  .then((result) => {{
     console.log("Handler executed successfully");
+    console.log("{RESULT_MARKER}" + JSON.stringify(result === undefined ? null : result));
     process.exit(0);
   }})
   .catch((error) => {{
@@ -85,20 +95,26 @@ handler.{handler_function}(event)
         
         if result.returncode != 0:
             print(f"Error executing handler: {result.stderr}")
-            return False
+            return message_ids
         
-        print(result.stdout)
-        return True
+        handler_result = None
+        for line in result.stdout.splitlines():
+            if line.startswith(RESULT_MARKER):
+                handler_result = json.loads(line[len(RESULT_MARKER):])
+            else:
+                print(line)
+        return parse_batch_item_failures(event, handler_result)
         
     except Exception as e:
         print(f"Error invoking handler: {e}")
-        return False
+        return message_ids
 
 def poll_queue(sqs_client, queue_url, backend_dir, handler_path):
     """Hace polling de la cola SQS y ejecuta el handler cuando hay mensajes."""
     print(f"Starting to poll queue: {queue_url}")
     print(f"Handler: {handler_path}")
     print(f"Poll interval: {POLL_INTERVAL} seconds")
+    print(f"Batch size: {MAX_MESSAGES}")
     print("Press Ctrl+C to stop\n")
     
     while True:
@@ -121,23 +137,25 @@ def poll_queue(sqs_client, queue_url, backend_dir, handler_path):
                 sqs_event = create_sqs_event(messages)
                 
                 # Ejecutar handler
-                success = invoke_lambda_handler(backend_dir, handler_path, sqs_event)
+                failed = invoke_lambda_handler(backend_dir, handler_path, sqs_event)
+                
+                # Eliminar de la cola (ack) solo los mensajes que no fallaron
+                for message in messages:
+                    if message["MessageId"] in failed:
+                        continue
+                    try:
+                        sqs_client.delete_message(
+                            QueueUrl=queue_url,
+                            ReceiptHandle=message["ReceiptHandle"]
+                        )
+                        print(f"Message {message['MessageId']} deleted from queue")
+                    except ClientError as e:
+                        print(f"Error deleting message: {e}")
                 
-                if success:
-                    # Eliminar mensajes de la cola (ack)
-                    for message in messages:
-                        try:
-                            sqs_client.delete_message(
-                                QueueUrl=queue_url,
-                                ReceiptHandle=message["ReceiptHandle"]
-                            )
-                            print(f"Message {message['MessageId']} deleted from queue")
-                        except ClientError as e:
-                            print(f"Error deleting message: {e}")
-                else:
-                    # Si el handler falla, el mensaje quedará visible después del timeout
+                if failed:
+                    # Los mensajes fallidos quedarán visibles después del timeout
                     # (simulando el comportamiento de Lambda)
-                    print("Handler failed, message will be retried after visibility timeout")
+                    print(f"{len(failed)} message(s) failed, they will be retried after visibility timeout")
             else:
                 # No hay mensajes, esperar un poco
                 time.sleep(POLL_INTERVAL)
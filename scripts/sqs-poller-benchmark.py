@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Benchmark de punta a punta del poller (sqs-lambda-poller-service.py).
+
+Cada escenario carga una cola en memoria con N mensajes y la vacía con un
+consumidor real del poller (motor de threads o asyncio) que invoca un handler
+Node de prueba en workers reales. No necesita LocalStack ni red: la cola SQS es
+un reemplazo en proceso con long polling, visibility timeout y operaciones batch.
+
+Por escenario se mide:
+  - mensajes por segundo hasta vaciar la cola
+  - latencia por mensaje dentro del poller (de la primera recepción al delete)
+  - CPU y RSS del proceso del poller y de los workers Node
+
+La matriz de escenarios combina motores, despacho con o sin orden por clave
+(carriles por transactionId), batch sizes y niveles de concurrencia.
+Los resultados se guardan en JSON junto con el commit actual, y --compare
+muestra la diferencia contra una corrida anterior.
+
+Ejemplos:
+  python scripts/sqs-poller-benchmark.py
+  python scripts/sqs-poller-benchmark.py --engines threads --batch-sizes 1,10 --concurrency 1,8 --messages 5000
+  python scripts/sqs-poller-benchmark.py --handler-ms 5 --compare bench-results/20260101-120000-abc1234.json
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import heapq
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from sqs_poller_tools import load_poller_module, percentile, restore_default_signals
+
+# Configuración
+MESSAGES = 2000  # mensajes por escenario
+ENGINES = "threads,asyncio"
+BATCH_SIZES = "1,10"
+CONCURRENCY_LEVELS = "1,4,16"
+ORDERING = "unordered,ordered"  # sin carriles, o carriles por transactionId (PARTITION_KEY_FIELDS)
+HANDLER_MS = 0  # duración simulada de cada invocación del handler
+SCENARIO_TIMEOUT = 300  # segundos máximos por escenario
+DRAIN_TIMEOUT = 10  # segundos para drenar el consumidor al terminar cada escenario
+RESULTS_DIR = "bench-results"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = resource.getpagesize()
+
+# Handler Node de prueba: espera BENCH_HANDLER_MS y confirma todo el batch
+STUB_HANDLER = r"""
+const delay = Number(process.env.BENCH_HANDLER_MS || 0);
+exports.handler = async (event) => {
+  if (delay > 0) await new Promise((resolve) => setTimeout(resolve, delay));
+  return { batchItemFailures: [] };
+};
+"""
+
+poller = load_poller_module()
+restore_default_signals()
+
+# ---------------------------------------------------------------------------
+# Cola SQS en memoria
+# ---------------------------------------------------------------------------
+
+class InMemorySQS:
+    """
+    Una cola SQS en proceso con la API de boto3 que usa el poller: receive con
+    long polling, visibility timeout (los mensajes no confirmados vuelven a la
+    cola), delete y change visibility, individuales y en batch.
+    """
+
+    def __init__(self, visibility_timeout=poller.DEFAULT_VISIBILITY_TIMEOUT):
+        self.visibility_timeout = visibility_timeout
+        self.visible = collections.deque()
+        self.in_flight = {}  # receipt handle -> mensaje
+        self.expirations = []  # heap de (visible desde, receipt handle)
+        self.visible_at = {}  # receipt handle -> instante vigente en que vuelve a la cola
+        self.first_received = {}  # MessageId -> instante de la primera recepción
+        self.latencies = []
+        self.total = 0
+        self.deleted = 0
+        self.redelivered = 0
+        self.calls = collections.Counter()
+        self.drained = threading.Event()
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def send(self, count):
+        now_ms = str(int(time.time() * 1000))
+        with self._cond:
+            for index in range(count):
+                self.visible.append({
+                    "MessageId": str(uuid.uuid4()),
+                    "Body": json.dumps({"transactionId": f"bench-{self.total + index}", "eventType": "Benchmark"}),
+                    "MD5OfBody": "",
+                    "Attributes": {"SentTimestamp": now_ms, "ApproximateReceiveCount": "0"},
+                    "MessageAttributes": {},
+                })
+            self.total += count
+            self._cond.notify_all()
+
+    def close(self):
+        """Despierta a los receives y a wait_drained en espera para que el escenario termine."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def _expire(self, now):
+        while self.expirations and self.expirations[0][0] <= now:
+            visible_at, handle = heapq.heappop(self.expirations)
+            # Una extensión de visibilidad deja una entrada vieja en el heap
+            if self.visible_at.get(handle) != visible_at:
+                continue
+            del self.visible_at[handle]
+            self.visible.append(self.in_flight.pop(handle))
+            self.redelivered += 1
+
+    def _take(self, wanted, visibility_timeout):
+        now = time.monotonic()
+        self._expire(now)
+        messages = []
+        while self.visible and len(messages) < wanted:
+            message = self.visible.popleft()
+            receive_count = int(message["Attributes"]["ApproximateReceiveCount"]) + 1
+            message["Attributes"]["ApproximateReceiveCount"] = str(receive_count)
+            handle = f"{message['MessageId']}#{receive_count}"
+            self.in_flight[handle] = message
+            self.visible_at[handle] = now + visibility_timeout
+            heapq.heappush(self.expirations, (self.visible_at[handle], handle))
+            self.first_received.setdefault(message["MessageId"], now)
+            messages.append(dict(message, ReceiptHandle=handle))
+        return messages
+
+    def try_receive(self, max_messages=1, visibility_timeout=None):
+        """Receive sin espera (lo usa el adaptador asyncio antes de bloquear un thread)."""
+        with self._cond:
+            return self._take(max_messages, visibility_timeout or self.visibility_timeout)
+
+    def receive_message(self, QueueUrl=None, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None, **_):
+        self.calls["receive"] += 1
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self._cond:
+            while True:
+                messages = self._take(MaxNumberOfMessages, VisibilityTimeout or self.visibility_timeout)
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0 or self.closed:
+                    return {"Messages": messages} if messages else {}
+                self._cond.wait(min(remaining, 0.5))
+
+    def _delete(self, handle):
+        message = self.in_flight.pop(handle, None)
+        if message is None:
+            return False
+        del self.visible_at[handle]
+        self.deleted += 1
+        self.latencies.append(time.monotonic() - self.first_received[message["MessageId"]])
+        if self.deleted >= self.total:
+            self.drained.set()
+            self._cond.notify_all()
+        return True
+
+    def delete_message(self, QueueUrl=None, ReceiptHandle=None):
+        self.calls["delete"] += 1
+        with self._cond:
+            self._delete(ReceiptHandle)
+        return {}
+
+    def delete_message_batch(self, QueueUrl=None, Entries=()):
+        self.calls["delete_batch"] += 1
+        with self._cond:
+            for entry in Entries:
+                self._delete(entry["ReceiptHandle"])
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def _change_visibility(self, handle, visibility_timeout):
+        message = self.in_flight.get(handle)
+        if message is None:
+            return
+        if visibility_timeout == 0:
+            del self.in_flight[handle]
+            del self.visible_at[handle]
+            self.visible.append(message)
+            self._cond.notify_all()
+        else:
+            self.visible_at[handle] = time.monotonic() + visibility_timeout
+            heapq.heappush(self.expirations, (self.visible_at[handle], handle))
+
+    def change_message_visibility(self, QueueUrl=None, ReceiptHandle=None, VisibilityTimeout=0):
+        self.calls["change_visibility"] += 1
+        with self._cond:
+            self._change_visibility(ReceiptHandle, VisibilityTimeout)
+        return {}
+
+    def change_message_visibility_batch(self, QueueUrl=None, Entries=()):
+        self.calls["change_visibility_batch"] += 1
+        with self._cond:
+            for entry in Entries:
+                self._change_visibility(entry["ReceiptHandle"], entry["VisibilityTimeout"])
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def get_queue_attributes(self, QueueUrl=None, AttributeNames=()):
+        with self._cond:
+            return {"Attributes": {
+                "ApproximateNumberOfMessages": str(len(self.visible)),
+                "ApproximateNumberOfMessagesNotVisible": str(len(self.in_flight)),
+                "VisibilityTimeout": str(self.visibility_timeout),
+            }}
+
+class AsyncInMemorySQS:
+    """Adaptador con la interfaz de AsyncSQSClient sobre InMemorySQS."""
+
+    def __init__(self, sqs):
+        self.sqs = sqs
+
+    async def receive_message(self, **params):
+        # Sin mensajes disponibles, el long polling espera en un thread para no bloquear el loop
+        messages = self.sqs.try_receive(params.get("MaxNumberOfMessages", 1), params.get("VisibilityTimeout"))
+        if messages:
+            self.sqs.calls["receive"] += 1
+            return {"Messages": messages}
+        return await asyncio.to_thread(self.sqs.receive_message, **params)
+
+    async def delete_message(self, **params):
+        return self.sqs.delete_message(**params)
+
+    async def delete_message_batch(self, **params):
+        return self.sqs.delete_message_batch(**params)
+
+    async def change_message_visibility(self, **params):
+        return self.sqs.change_message_visibility(**params)
+
+    async def change_message_visibility_batch(self, **params):
+        return self.sqs.change_message_visibility_batch(**params)
+
+    async def close(self):
+        pass
+
+# ---------------------------------------------------------------------------
+# Medición de CPU y memoria
+# ---------------------------------------------------------------------------
+
+def process_usage(pid):
+    """(segundos de CPU, RSS en bytes) de un proceso según /proc; None si no está disponible."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime y stime son los campos 14 y 15 de /proc/<pid>/stat (11 y 12 tras el nombre)
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, resident_pages * PAGE_SIZE
+
+def self_usage():
+    """(segundos de CPU, RSS actual en bytes) del proceso del poller."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    current = process_usage(os.getpid())
+    rss = current[1] if current else usage.ru_maxrss * 1024
+    return usage.ru_utime + usage.ru_stime, rss
+
+def worker_pids(pool):
+    pids = []
+    for worker in list(pool._workers):
+        process = worker.process
+        if process is not None and process.returncode is None:
+            pids.append(process.pid)
+    return pids
+
+class UsageSampler:
+    """Muestrea el RSS del poller y de los workers durante el escenario y acumula su CPU."""
+
+    def __init__(self, pool, interval=0.2):
+        self.pool = pool
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_worker_rss = 0
+        self.worker_cpu = {}  # pid -> último tiempo de CPU visto
+        self.worker_cpu_start = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-usage", daemon=True)
+
+    def start(self):
+        self.cpu_start, _ = self_usage()
+        self.sample()
+        self.worker_cpu_start = dict(self.worker_cpu)
+        self._thread.start()
+
+    def sample(self):
+        _, rss = self_usage()
+        self.peak_rss = max(self.peak_rss, rss)
+        total_worker_rss = 0
+        for pid in worker_pids(self.pool):
+            usage = process_usage(pid)
+            if usage is None:
+                continue
+            self.worker_cpu[pid] = usage[0]
+            total_worker_rss += usage[1]
+        self.peak_worker_rss = max(self.peak_worker_rss, total_worker_rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.sample()
+        self._stop.set()
+        self._thread.join()
+        cpu, _ = self_usage()
+        worker_cpu = sum(value - self.worker_cpu_start.get(pid, 0.0) for pid, value in self.worker_cpu.items())
+        return {
+            "pollerCpuSeconds": round(cpu - self.cpu_start, 3),
+            "pollerPeakRssMb": round(self.peak_rss / 2**20, 1),
+            "workersCpuSeconds": round(worker_cpu, 3),
+            "workersPeakRssMb": round(self.peak_worker_rss / 2**20, 1),
+        }
+
+# ---------------------------------------------------------------------------
+# Escenarios
+# ---------------------------------------------------------------------------
+
+def write_stub_backend(directory):
+    """Backend mínimo con el handler de prueba en dist/bench.js."""
+    os.makedirs(os.path.join(directory, "dist"), exist_ok=True)
+    with open(os.path.join(directory, "dist", "bench.js"), "w") as handler_file:
+        handler_file.write(STUB_HANDLER)
+    return directory
+
+def scenario_config(ordering, batch_size, concurrency, receivers):
+    return {
+        "partition_key": "transactionId" if ordering == "ordered" else "",
+        "function": "bench",
+        "handler": "dist/bench.handler",
+        "batch_size": batch_size,
+        "timeout": poller.DEFAULT_VISIBILITY_TIMEOUT,
+        "visibility_timeout": poller.DEFAULT_VISIBILITY_TIMEOUT,
+        "concurrency": concurrency,
+        "min_concurrency": concurrency,
+        "max_concurrency": concurrency,
+        "receivers": receivers or max(1, concurrency // 4),
+    }
+
+def wait_drained(sqs, timeout):
+    # También termina al cerrarse la cola (Ctrl-C), para no retener el escenario hasta el timeout
+    with sqs._cond:
+        sqs._cond.wait_for(lambda: sqs.drained.is_set() or sqs.closed, timeout)
+    return sqs.drained.is_set()
+
+def run_threads_scenario(sqs, config, backend_dir, timeout):
+    pool = poller.WorkerPool(config["handler"], backend_dir=backend_dir, size=config["concurrency"], function_name="bench")
+    if not pool.start():
+        raise RuntimeError("the stub handler could not be loaded (is node installed?)")
+    consumer = poller.QueueConsumer(sqs, "bench", "bench-queue", config, pool)
+    sampler = UsageSampler(pool)
+    sampler.start()
+    started = time.monotonic()
+    try:
+        consumer.start()
+        drained = wait_drained(sqs, timeout)
+        elapsed = time.monotonic() - started
+    finally:
+        # También con Ctrl-C: detener el consumidor y los workers Node antes de salir
+        usage = sampler.stop()
+        poller.RUNNING = False
+        sqs.close()
+        consumer.drain(time.monotonic() + DRAIN_TIMEOUT)
+        pool.shutdown()
+    return drained, elapsed, usage
+
+def run_asyncio_scenario(sqs, config, backend_dir, timeout):
+    async def run():
+        pool = poller.AsyncWorkerPool(config["handler"], backend_dir=backend_dir, size=config["concurrency"], function_name="bench")
+        if not await pool.start():
+            raise RuntimeError("the stub handler could not be loaded (is node installed?)")
+        consumer = poller.AsyncQueueConsumer(AsyncInMemorySQS(sqs), "bench", "bench-queue", config, pool)
+        sampler = UsageSampler(pool)
+        sampler.start()
+        started = time.monotonic()
+        try:
+            consumer.start()
+            drained = await asyncio.to_thread(wait_drained, sqs, timeout)
+            elapsed = time.monotonic() - started
+        finally:
+            usage = sampler.stop()
+            poller.RUNNING = False
+            sqs.close()
+            await consumer.drain(time.monotonic() + DRAIN_TIMEOUT)
+            await pool.shutdown()
+        return drained, elapsed, usage
+
+    return asyncio.run(run())
+
+ENGINE_RUNNERS = {"threads": run_threads_scenario, "asyncio": run_asyncio_scenario}
+
+def run_scenario(engine, ordering, batch_size, concurrency, args, backend_dir):
+    """Vacía una cola de `args.messages` mensajes con un consumidor del poller y retorna las métricas."""
+    sqs = InMemorySQS()
+    sqs.send(args.messages)
+    config = scenario_config(ordering, batch_size, concurrency, args.receivers)
+    poller.RUNNING = True
+    os.environ["BENCH_HANDLER_MS"] = str(args.handler_ms)
+
+    # La salida del poller (logs por batch) se descarta, pero su costo se sigue midiendo
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    try:
+        with contextlib.redirect_stdout(output):
+            drained, elapsed, usage = ENGINE_RUNNERS[engine](sqs, config, backend_dir, args.timeout)
+            # Los logs del poller se escriben desde un thread: vaciarlos mientras stdout sigue redirigido
+            poller.LOG.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    return {
+        "engine": engine,
+        "ordering": ordering,
+        "batchSize": batch_size,
+        "concurrency": concurrency,
+        "receivers": config["receivers"],
+        "messages": args.messages,
+        "completed": sqs.deleted,
+        "drained": drained,
+        "elapsedSeconds": round(elapsed, 3),
+        "messagesPerSecond": round(sqs.deleted / max(elapsed, 0.001), 1),
+        "latencyMs": {name: round(percentile(sqs.latencies, fraction) * 1000, 2)
+                      for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+        "redelivered": sqs.redelivered,
+        "sqsCalls": dict(sqs.calls),
+        **usage,
+    }
+
+def scenario_key(result):
+    return (result["engine"], result.get("ordering", "ordered"), result["batchSize"], result["concurrency"])
+
+def print_results(results, baseline=None):
+    baseline_by_key = {scenario_key(result): result for result in (baseline or {}).get("results", [])}
+    print("=" * 122)
+    print(f"{'Engine':<8} {'Ordering':<9} {'Batch':>5} {'Conc':>5} {'Msg/s':>10} {'vs base':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'Poller CPU':>11} {'RSS MB':>7} {'Workers CPU':>12} {'RSS MB':>7}")
+    for result in results:
+        previous = baseline_by_key.get(scenario_key(result))
+        delta = ""
+        if previous and previous["messagesPerSecond"]:
+            delta = f"{(result['messagesPerSecond'] / previous['messagesPerSecond'] - 1) * 100:+.1f}%"
+        print(f"{result['engine']:<8} {result['ordering']:<9} {result['batchSize']:>5} {result['concurrency']:>5} "
+              f"{result['messagesPerSecond']:>10.1f} {delta:>8} {result['latencyMs']['p50']:>8.1f} "
+              f"{result['latencyMs']['p99']:>8.1f} {result['pollerCpuSeconds']:>10.2f}s {result['pollerPeakRssMb']:>7.1f} "
+              f"{result['workersCpuSeconds']:>11.2f}s {result['workersPeakRssMb']:>7.1f}"
+              + ("" if result["drained"] else "  ⚠ timed out"))
+    print("=" * 122)
+
+def git_revision():
+    """(commit abreviado, True si hay cambios sin commitear) del repo que contiene el script."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=directory,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the SQS poller against an in-process SQS")
+    parser.add_argument("--engines", default=ENGINES, help=f"comma separated engines (default {ENGINES})")
+    parser.add_argument("--ordering", default=ORDERING, help=f"comma separated dispatch modes (default {ORDERING})")
+    parser.add_argument("--batch-sizes", default=BATCH_SIZES, help=f"comma separated batch sizes (default {BATCH_SIZES})")
+    parser.add_argument("--concurrency", default=CONCURRENCY_LEVELS, help=f"comma separated concurrency levels (default {CONCURRENCY_LEVELS})")
+    parser.add_argument("--receivers", type=int, help="receivers per queue (default: one per 4 concurrent handlers)")
+    parser.add_argument("--messages", type=int, default=MESSAGES, help=f"messages per scenario (default {MESSAGES})")
+    parser.add_argument("--handler-ms", type=float, default=HANDLER_MS, help="simulated handler duration in milliseconds")
+    parser.add_argument("--timeout", type=float, default=SCENARIO_TIMEOUT, help="max seconds per scenario")
+    parser.add_argument("--output-dir", default=RESULTS_DIR, help=f"directory for the results (default {RESULTS_DIR})")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the poller output")
+    args = parser.parse_args(argv)
+    args.engines = parse_list(args.engines)
+    unknown = set(args.engines) - set(ENGINE_RUNNERS)
+    if unknown:
+        parser.error(f"unknown engine(s): {', '.join(sorted(unknown))}")
+    args.ordering = parse_list(args.ordering)
+    if set(args.ordering) - {"unordered", "ordered"}:
+        parser.error("--ordering accepts unordered and ordered")
+    args.batch_sizes = [min(max(int(size), 1), 10) for size in parse_list(args.batch_sizes)]
+    args.concurrency = [max(int(level), 1) for level in parse_list(args.concurrency)]
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    commit, dirty = git_revision()
+    scenarios = [(engine, ordering, batch_size, concurrency)
+                 for engine in args.engines for ordering in args.ordering
+                 for batch_size in args.batch_sizes for concurrency in args.concurrency]
+    print(f"Benchmarking {len(scenarios)} scenario(s) at {commit}{' (dirty)' if dirty else ''}: "
+          f"{args.messages} message(s) each, handler {args.handler_ms:g}ms", flush=True)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sqs-poller-bench-") as backend_dir:
+        write_stub_backend(backend_dir)
+        for engine, ordering, batch_size, concurrency in scenarios:
+            print(f"  ▶ {engine}, {ordering}, batch {batch_size}, concurrency {concurrency}...", end=" ", flush=True)
+            result = run_scenario(engine, ordering, batch_size, concurrency, args, backend_dir)
+            results.append(result)
+            print(f"{result['messagesPerSecond']:.0f} msg/s", flush=True)
+
+    print_results(results, baseline)
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}{'-dirty' if dirty else ''}.json")
+    with open(path, "w") as output:
+        json.dump({
+            "commit": commit,
+            "dirty": dirty,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": sys.version.split()[0],
+            "cpuCount": os.cpu_count(),
+            "messages": args.messages,
+            "handlerMs": args.handler_ms,
+            "results": results,
+        }, output, indent=2)
+    print(f"✓ Results written to {path}")
+    return 0 if all(result["drained"] for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Reproduce el tráfico grabado por el poller (RECORD_FILE) para pruebas de carga.
+
+Los batches se reinyectan en una cola SQS (--to-queue) o directamente en un
+pool de workers Node del handler grabado (--to-handler). Se respetan los
+tiempos originales, escalados con --speed (p. ej. 10 para ir diez veces más
+rápido), o se envían lo más rápido posible con --fast. El archivo se lee con
+mmap, de modo que grabaciones grandes no se cargan enteras en memoria.
+
+Ejemplos:
+  python scripts/sqs-replay.py traffic.rec --to-queue --speed 10
+  python scripts/sqs-replay.py traffic.rec --to-queue dev-payments-queue --fast
+  python scripts/sqs-replay.py traffic.rec --to-handler --fast --concurrency 8 --backend-dir packages/backend
+"""
+
+import argparse
+import boto3
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqs_poller_tools import load_poller_module, percentile, restore_default_signals
+
+# Configuración
+SQS_ENDPOINT = os.getenv("SQS_ENDPOINT", "http://localhost:4566")  # LocalStack expuesto en el host
+REGION = os.getenv("AWS_REGION", "us-east-1")
+REPLAY_CONCURRENCY = 4  # batches reinyectados en paralelo
+
+poller = load_poller_module()
+restore_default_signals()
+
+class ReplayStats:
+    """Conteos y latencias de la reproducción."""
+
+    def __init__(self):
+        self.batches = 0
+        self.messages = 0
+        self.failed = 0
+        self.latencies = []
+        self.max_lag = 0.0  # atraso máximo respecto del tiempo programado
+        self._lock = threading.Lock()
+
+    def add(self, messages, failed, latency, lag):
+        with self._lock:
+            self.batches += 1
+            self.messages += messages
+            self.failed += failed
+            self.latencies.append(latency)
+            self.max_lag = max(self.max_lag, lag)
+
+    def print(self, elapsed, recorded_span):
+        print("=" * 60)
+        print(f"Replayed {self.batches} batch(es), {self.messages} message(s) in {elapsed:.2f}s "
+              f"(recorded over {recorded_span:.2f}s)")
+        print(f"Throughput: {self.messages / max(elapsed, 0.001):.1f} msg/s, {self.batches / max(elapsed, 0.001):.1f} batch/s")
+        print(f"Latency per batch: p50 {percentile(self.latencies, 0.5) * 1000:.1f}ms, "
+              f"p95 {percentile(self.latencies, 0.95) * 1000:.1f}ms, p99 {percentile(self.latencies, 0.99) * 1000:.1f}ms, "
+              f"max {max(self.latencies or [0]) * 1000:.1f}ms")
+        print(f"Failed messages: {self.failed}")
+        print(f"Max schedule lag: {self.max_lag * 1000:.1f}ms")
+        print("=" * 60)
+
+    def to_dict(self, elapsed):
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "failed": self.failed,
+            "elapsedSeconds": round(elapsed, 3),
+            "messagesPerSecond": round(self.messages / max(elapsed, 0.001), 1),
+            "latencyMs": {name: round(percentile(self.latencies, fraction) * 1000, 2)
+                          for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+            "maxScheduleLagMs": round(self.max_lag * 1000, 2),
+        }
+
+class QueueTarget:
+    """Reinyecta cada batch grabado en una cola con send_message_batch."""
+
+    def __init__(self, endpoint, queue_name=None):
+        self.sqs_client = boto3.client(
+            "sqs",
+            endpoint_url=endpoint,
+            region_name=REGION,
+            aws_access_key_id="local",
+            aws_secret_access_key="local"
+        )
+        self.queue_name = queue_name
+        self._urls = {}
+
+    def _queue_url(self, queue_name):
+        if queue_name not in self._urls:
+            self._urls[queue_name] = self.sqs_client.get_queue_url(QueueName=queue_name)["QueueUrl"]
+        return self._urls[queue_name]
+
+    def send(self, record):
+        queue_url = self._queue_url(self.queue_name or record["queue"])
+        records = record["event"]["Records"]
+        failed = 0
+        for start in range(0, len(records), poller.SQS_MAX_BATCH_ENTRIES):
+            entries = []
+            for index, sqs_record in enumerate(records[start:start + poller.SQS_MAX_BATCH_ENTRIES]):
+                entry = {"Id": str(index), "MessageBody": sqs_record["body"]}
+                attributes = {
+                    name: {key: value for key, value in attribute.items() if key in ("DataType", "StringValue", "BinaryValue")}
+                    for name, attribute in (sqs_record.get("messageAttributes") or {}).items()
+                }
+                if attributes:
+                    entry["MessageAttributes"] = attributes
+                entries.append(entry)
+            response = self.sqs_client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+            failed += len(response.get("Failed", []))
+        return failed
+
+    def close(self):
+        pass
+
+class HandlerTarget:
+    """Invoca el handler grabado de cada batch en un pool de workers Node por función."""
+
+    def __init__(self, backend_dir, pool_size, timeout):
+        self.backend_dir = backend_dir
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, record):
+        with self._lock:
+            key = record.get("function") or record["handler"]
+            if key not in self._pools:
+                pool = poller.WorkerPool(record["handler"], backend_dir=self.backend_dir, size=self.pool_size, function_name=key)
+                if not pool.start():
+                    print(f"⚠ Worker pool for {key} could not be preloaded, workers will be started on demand")
+                self._pools[key] = pool
+            return self._pools[key]
+
+    def preload(self, record):
+        self._pool(record)
+
+    def send(self, record):
+        return len(poller.invoke_lambda_handler(self._pool(record), record["event"], self.timeout))
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.shutdown()
+        # Los logs del poller se escriben desde un thread: vaciarlos antes del resumen
+        poller.LOG.flush()
+
+def replay(records, target, speed, concurrency):
+    """
+    Reinyecta los batches con el espaciado original dividido por `speed`
+    (0: sin esperas). Retorna (estadísticas, segundos transcurridos, segundos grabados).
+    """
+    stats = ReplayStats()
+    semaphore = threading.Semaphore(concurrency)
+    first_timestamp = None
+    last_timestamp = None
+    started = time.monotonic()
+
+    def run(record, due):
+        try:
+            begin = time.monotonic()
+            try:
+                failed = target.send(record)
+            except Exception as e:
+                print(f"✗ Error replaying a batch from {record['queue']}: {e}")
+                failed = len(record["event"]["Records"])
+            stats.add(len(record["event"]["Records"]), failed, time.monotonic() - begin, max(0.0, begin - due))
+        finally:
+            semaphore.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as executor:
+        for timestamp, record in records:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            last_timestamp = timestamp
+            due = started + (timestamp - first_timestamp) / speed if speed > 0 else time.monotonic()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            semaphore.acquire()
+            executor.submit(run, record, due)
+    return stats, time.monotonic() - started, (last_timestamp or 0) - (first_timestamp or 0)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay SQS traffic recorded by the poller (RECORD_FILE)")
+    parser.add_argument("file", help="record file written by the poller")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--to-queue", nargs="?", const="", metavar="QUEUE",
+                        help="send the messages to this queue (default: the queue they were recorded from)")
+    target.add_argument("--to-handler", action="store_true", help="invoke the recorded handler in local Node workers")
+    timing = parser.add_mutually_exclusive_group()
+    timing.add_argument("--speed", type=float, default=1.0, help="replay speed relative to the recording (default 1.0)")
+    timing.add_argument("--fast", action="store_true", help="replay as fast as possible")
+    parser.add_argument("--queue", action="append", help="only replay batches recorded from this queue (repeatable)")
+    parser.add_argument("--limit", type=int, help="replay at most this many batches")
+    parser.add_argument("--concurrency", type=int, default=REPLAY_CONCURRENCY, help="batches replayed in parallel")
+    parser.add_argument("--endpoint", default=SQS_ENDPOINT, help=f"SQS endpoint for --to-queue (default {SQS_ENDPOINT})")
+    parser.add_argument("--backend-dir", default=poller.BACKEND_DIR, help=f"backend directory for --to-handler (default {poller.BACKEND_DIR})")
+    parser.add_argument("--timeout", type=int, default=poller.DEFAULT_VISIBILITY_TIMEOUT, help="handler timeout in seconds")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    queues = set(args.queue or [])
+
+    def selected_records():
+        count = 0
+        for timestamp, record in poller.read_recorded_events(args.file):
+            if queues and record["queue"] not in queues:
+                continue
+            if args.limit is not None and count >= args.limit:
+                return
+            count += 1
+            yield timestamp, record
+
+    if args.to_handler:
+        target = HandlerTarget(os.path.abspath(args.backend_dir), args.concurrency, args.timeout)
+        # Cargar los handlers antes de empezar para no medir el arranque de los workers
+        for _, record in selected_records():
+            target.preload(record)
+        description = f"handlers in {args.backend_dir}"
+    else:
+        target = QueueTarget(args.endpoint, args.to_queue or None)
+        description = f"queue {args.to_queue or '(recorded queues)'} at {args.endpoint}"
+
+    speed = 0 if args.fast else args.speed
+    print(f"Replaying {args.file} -> {description} ({'as fast as possible' if not speed else f'{speed:g}x'}, "
+          f"concurrency {args.concurrency})")
+    try:
+        stats, elapsed, recorded_span = replay(selected_records(), target, speed, args.concurrency)
+    finally:
+        target.close()
+
+    stats.print(elapsed, recorded_span)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(stats.to_dict(elapsed), output, indent=2)
+        print(f"✓ Results written to {args.json}")
+    return 1 if stats.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
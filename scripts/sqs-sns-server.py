@@ -0,0 +1,874 @@
+#!/usr/bin/env python3
+"""
+Reemplazo liviano de LocalStack para SQS y SNS, en un solo proceso Python.
+
+Habla los protocolos que usan los scripts (boto3) y el backend (AWS SDK v3):
+SQS con el protocolo JSON (AmazonSQS.*) y SNS con el protocolo query (XML).
+Arranca en milisegundos y se usa como SQS_ENDPOINT/SNS_ENDPOINT en lugar de
+LocalStack:
+
+  python scripts/sqs-sns-server.py --port 4566
+  SQS_ENDPOINT=http://localhost:4566 python scripts/create-localstack-resources.py
+
+Soporta:
+  - colas estándar y FIFO (MessageGroupId, deduplicación), DelaySeconds,
+    MessageRetentionPeriod y long polling en ReceiveMessage
+  - visibility timeout, ChangeMessageVisibility y operaciones batch
+  - RedrivePolicy: un mensaje recibido más de maxReceiveCount veces pasa a la DLQ
+  - tópicos SNS con suscripciones sqs (fan-out con el sobre de notificación de
+    SNS o RawMessageDelivery, y FilterPolicy sobre los message attributes)
+
+El estado vive en memoria y se pierde al detener el servidor. Responde el
+health check de LocalStack (/_localstack/health) para que docker-compose lo
+pueda usar sin cambios.
+"""
+
+import argparse
+import base64
+import collections
+import hashlib
+import heapq
+import http.server
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from xml.sax.saxutils import escape
+
+# Configuración
+PORT = int(os.getenv("PORT", "4566"))
+REGION = os.getenv("AWS_REGION", "us-east-1")
+ACCOUNT_ID = "000000000000"  # cuenta que usa LocalStack por defecto
+MAX_WAIT_SECONDS = 20  # WaitTimeSeconds máximo de SQS
+MAX_VISIBILITY_TIMEOUT = 12 * 60 * 60
+FIFO_DEDUPLICATION_WINDOW = 5 * 60  # segundos en que un MessageDeduplicationId descarta duplicados
+SNS_NAMESPACE = "http://sns.amazonaws.com/doc/2010-03-31/"
+QUEUE_DEFAULTS = {
+    "VisibilityTimeout": "30",
+    "MessageRetentionPeriod": "345600",
+    "DelaySeconds": "0",
+    "ReceiveMessageWaitTimeSeconds": "0",
+    "MaximumMessageSize": "262144",
+}
+
+class ServiceError(Exception):
+    """Error de la API: código de AWS, mensaje y estado HTTP."""
+
+    def __init__(self, code, message, status=400, query_code=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+        self.query_code = query_code or code  # código del protocolo query (x-amzn-query-error)
+
+def queue_does_not_exist():
+    return ServiceError("QueueDoesNotExist", "The specified queue does not exist.",
+                        query_code="AWS.SimpleQueueService.NonExistentQueue")
+
+def md5_hex(data):
+    return hashlib.md5(data if isinstance(data, bytes) else data.encode()).hexdigest()
+
+def md5_of_message_attributes(attributes):
+    """MD5 de los message attributes con la codificación binaria que validan los SDKs."""
+    if not attributes:
+        return None
+    encoded = b""
+    for name in sorted(attributes):
+        attribute = attributes[name]
+        data_type = attribute["DataType"]
+        encoded += struct.pack(">I", len(name.encode())) + name.encode()
+        encoded += struct.pack(">I", len(data_type.encode())) + data_type.encode()
+        if "BinaryValue" in attribute and not data_type.startswith(("String", "Number")):
+            value = attribute["BinaryValue"]
+            value = base64.b64decode(value) if isinstance(value, str) else value
+            encoded += b"\x02" + struct.pack(">I", len(value)) + value
+        else:
+            value = attribute["StringValue"].encode()
+            encoded += b"\x01" + struct.pack(">I", len(value)) + value
+    return md5_hex(encoded)
+
+# ---------------------------------------------------------------------------
+# SQS
+# ---------------------------------------------------------------------------
+
+class Message:
+    __slots__ = ("message_id", "body", "attributes", "message_attributes", "sent_at", "visible_at",
+                 "receive_count", "first_received", "group_id", "deduplication_id", "sequence_number")
+
+    def __init__(self, body, message_attributes=None, delay=0, group_id=None, deduplication_id=None, sequence_number=None):
+        self.message_id = str(uuid.uuid4())
+        self.body = body
+        self.message_attributes = message_attributes or {}
+        self.sent_at = time.time()
+        self.visible_at = time.monotonic() + delay
+        self.receive_count = 0
+        self.first_received = None
+        self.group_id = group_id
+        self.deduplication_id = deduplication_id
+        self.sequence_number = sequence_number
+
+    def system_attributes(self):
+        attributes = {
+            "SenderId": ACCOUNT_ID,
+            "SentTimestamp": str(int(self.sent_at * 1000)),
+            "ApproximateReceiveCount": str(self.receive_count),
+            "ApproximateFirstReceiveTimestamp": str(int((self.first_received or self.sent_at) * 1000)),
+        }
+        if self.group_id:
+            attributes["MessageGroupId"] = self.group_id
+            attributes["MessageDeduplicationId"] = self.deduplication_id or ""
+            attributes["SequenceNumber"] = self.sequence_number or ""
+        return attributes
+
+class Queue:
+    """Cola en memoria. Todas las operaciones se hacen con `cond` tomado."""
+
+    def __init__(self, server, name, attributes):
+        self.server = server
+        self.name = name
+        self.arn = f"arn:aws:sqs:{REGION}:{ACCOUNT_ID}:{name}"
+        self.fifo = name.endswith(".fifo")
+        self.attributes = dict(QUEUE_DEFAULTS)
+        if self.fifo:
+            self.attributes["FifoQueue"] = "true"
+            self.attributes.setdefault("ContentBasedDeduplication", "false")
+        self.attributes.update(attributes or {})
+        self.created = int(time.time())
+        self.modified = self.created
+        self.visible = collections.deque()
+        self.delayed = []  # heap de (visible desde, contador, mensaje)
+        self.in_flight = {}  # receipt handle -> mensaje
+        self.expirations = []  # heap de (visible desde, receipt handle)
+        self.groups_in_flight = collections.Counter()  # FIFO: grupos con mensajes en vuelo
+        self.deduplication = {}  # FIFO: MessageDeduplicationId -> (expiración, MessageId)
+        self.sequence = 0
+        self.cond = threading.Condition()
+
+    def attribute(self, name, default=0):
+        try:
+            return int(self.attributes.get(name, default))
+        except ValueError:
+            return default
+
+    def redrive_policy(self):
+        try:
+            return json.loads(self.attributes.get("RedrivePolicy") or "null")
+        except ValueError:
+            return None
+
+    # Mantenimiento -------------------------------------------------------
+
+    def _refresh(self):
+        """Libera los mensajes cuyo delay o visibility timeout venció y descarta los vencidos por retención."""
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            self.visible.append(heapq.heappop(self.delayed)[2])
+        while self.expirations and self.expirations[0][0] <= now:
+            visible_at, handle = heapq.heappop(self.expirations)
+            message = self.in_flight.get(handle)
+            # Una extensión de visibilidad deja una entrada vieja en el heap
+            if message is None or message.visible_at > now:
+                continue
+            self._return(handle, message)
+
+    def _return(self, handle, message):
+        del self.in_flight[handle]
+        if message.group_id:
+            self.groups_in_flight[message.group_id] -= 1
+            # FIFO: el mensaje vuelve al frente de su grupo
+            self.visible.appendleft(message)
+        else:
+            self.visible.append(message)
+        self.cond.notify_all()
+
+    # Operaciones -----------------------------------------------------------
+
+    def send(self, body, message_attributes=None, delay=None, group_id=None, deduplication_id=None):
+        if self.fifo and not group_id:
+            raise ServiceError("MissingParameter", "The request must contain the parameter MessageGroupId.")
+        delay = self.attribute("DelaySeconds") if delay is None else int(delay)
+        with self.cond:
+            if self.fifo:
+                if not deduplication_id:
+                    if self.attributes.get("ContentBasedDeduplication") != "true":
+                        raise ServiceError("InvalidParameterValue", "The queue should either have ContentBasedDeduplication "
+                                           "enabled or MessageDeduplicationId provided explicitly")
+                    deduplication_id = hashlib.sha256(body.encode()).hexdigest()
+                now = time.monotonic()
+                previous = self.deduplication.get(deduplication_id)
+                if previous and previous[0] > now:
+                    return previous[1], None
+                self.sequence += 1
+                message = Message(body, message_attributes, 0, group_id, deduplication_id, str(self.sequence).zfill(20))
+                self.deduplication[deduplication_id] = (now + FIFO_DEDUPLICATION_WINDOW, message.message_id)
+            else:
+                message = Message(body, message_attributes, delay)
+            if delay > 0 and not self.fifo:
+                self.sequence += 1
+                heapq.heappush(self.delayed, (message.visible_at, self.sequence, message))
+            else:
+                self.visible.append(message)
+                self.cond.notify_all()
+        self.server.stats["sent"] += 1
+        return message.message_id, message
+
+    def receive(self, max_messages, visibility_timeout, wait_seconds):
+        deadline = time.monotonic() + wait_seconds
+        with self.cond:
+            while True:
+                self._refresh()
+                messages = self._take(max_messages, visibility_timeout)
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0 or self.server.stopping:
+                    return messages
+                wake = [remaining]
+                if self.delayed:
+                    wake.append(self.delayed[0][0] - time.monotonic())
+                if self.expirations:
+                    wake.append(self.expirations[0][0] - time.monotonic())
+                self.cond.wait(max(0.001, min(wake)))
+
+    def _take(self, max_messages, visibility_timeout):
+        policy = self.redrive_policy()
+        max_receive_count = int(policy.get("maxReceiveCount", 0)) if policy else 0
+        retention = self.attribute("MessageRetentionPeriod", 345600)
+        now = time.time()
+        taken = []
+        skipped = []
+        while self.visible and len(taken) < max_messages:
+            message = self.visible.popleft()
+            if now - message.sent_at > retention:
+                continue
+            if message.group_id and self.groups_in_flight[message.group_id]:
+                skipped.append(message)
+                continue
+            if max_receive_count and message.receive_count >= max_receive_count:
+                if self.server.move_to_dead_letter_queue(policy.get("deadLetterTargetArn"), message):
+                    continue
+            message.receive_count += 1
+            message.first_received = message.first_received or now
+            message.visible_at = time.monotonic() + visibility_timeout
+            handle = base64.urlsafe_b64encode(f"{self.name} {message.message_id} {uuid.uuid4().hex}".encode()).decode()
+            self.in_flight[handle] = message
+            heapq.heappush(self.expirations, (message.visible_at, handle))
+            if message.group_id:
+                self.groups_in_flight[message.group_id] += 1
+            taken.append((handle, message))
+        self.visible.extendleft(reversed(skipped))
+        return taken
+
+    def add_existing(self, message):
+        """Agrega un mensaje movido desde otra cola (redrive a la DLQ)."""
+        with self.cond:
+            message.receive_count = 0
+            message.visible_at = time.monotonic()
+            self.visible.append(message)
+            self.cond.notify_all()
+
+    def delete(self, handle):
+        with self.cond:
+            message = self.in_flight.pop(handle, None)
+            if message is not None:
+                if message.group_id:
+                    self.groups_in_flight[message.group_id] -= 1
+                    self.cond.notify_all()
+                self.server.stats["deleted"] += 1
+
+    def change_visibility(self, handle, visibility_timeout):
+        if not 0 <= visibility_timeout <= MAX_VISIBILITY_TIMEOUT:
+            raise ServiceError("InvalidParameterValue", f"Value {visibility_timeout} for parameter VisibilityTimeout is invalid.")
+        with self.cond:
+            message = self.in_flight.get(handle)
+            if message is None:
+                raise ServiceError("MessageNotInflight", "Message does not exist or is not available for visibility timeout change.",
+                                   query_code="AWS.SimpleQueueService.MessageNotInflight")
+            if visibility_timeout == 0:
+                self._return(handle, message)
+                return
+            message.visible_at = time.monotonic() + visibility_timeout
+            heapq.heappush(self.expirations, (message.visible_at, handle))
+
+    def purge(self):
+        with self.cond:
+            self.visible.clear()
+            self.delayed.clear()
+            self.in_flight.clear()
+            self.expirations.clear()
+            self.groups_in_flight.clear()
+
+    def get_attributes(self, names):
+        with self.cond:
+            self._refresh()
+            attributes = dict(self.attributes)
+            attributes.update({
+                "QueueArn": self.arn,
+                "ApproximateNumberOfMessages": str(len(self.visible)),
+                "ApproximateNumberOfMessagesNotVisible": str(len(self.in_flight)),
+                "ApproximateNumberOfMessagesDelayed": str(len(self.delayed)),
+                "CreatedTimestamp": str(self.created),
+                "LastModifiedTimestamp": str(self.modified),
+            })
+        if not names or "All" in names:
+            return attributes
+        return {name: attributes[name] for name in names if name in attributes}
+
+    def set_attributes(self, attributes):
+        with self.cond:
+            self.attributes.update(attributes)
+            self.modified = int(time.time())
+
+class LocalServices:
+    """Estado de SQS y SNS del servidor."""
+
+    def __init__(self):
+        self.queues = {}
+        self.topics = {}  # ARN -> {"name", "attributes", "subscriptions": [ARN]}
+        self.subscriptions = {}  # ARN -> {"TopicArn", "Protocol", "Endpoint", "Attributes"}
+        self.stats = collections.Counter()
+        self.stopping = False
+        self._lock = threading.Lock()
+
+    # SQS ------------------------------------------------------------------
+
+    def queue_url(self, host, queue):
+        return f"http://{host}/{ACCOUNT_ID}/{queue.name}"
+
+    def get_queue(self, queue_url):
+        name = (queue_url or "").rstrip("/").split("/")[-1]
+        queue = self.queues.get(name)
+        if queue is None:
+            raise queue_does_not_exist()
+        return queue
+
+    def get_queue_by_arn(self, arn):
+        return self.queues.get((arn or "").split(":")[-1])
+
+    def create_queue(self, name, attributes):
+        with self._lock:
+            queue = self.queues.get(name)
+            if queue is None:
+                queue = self.queues[name] = Queue(self, name, attributes)
+                print(f"✓ Created queue {name}", flush=True)
+            elif attributes:
+                queue.set_attributes(attributes)
+            return queue
+
+    def delete_queue(self, queue):
+        with self._lock:
+            self.queues.pop(queue.name, None)
+        with queue.cond:
+            queue.cond.notify_all()
+
+    def move_to_dead_letter_queue(self, dead_letter_arn, message):
+        dead_letter_queue = self.get_queue_by_arn(dead_letter_arn)
+        if dead_letter_queue is None:
+            return False
+        print(f"⚠ Message {message.message_id} moved to {dead_letter_queue.name} after {message.receive_count} receive(s)", flush=True)
+        dead_letter_queue.add_existing(message)
+        self.stats["dead_lettered"] += 1
+        return True
+
+    # SNS ------------------------------------------------------------------
+
+    def topic_arn(self, name):
+        return f"arn:aws:sns:{REGION}:{ACCOUNT_ID}:{name}"
+
+    def get_topic(self, arn):
+        # El backend puede usar otra cuenta en el ARN; los tópicos se identifican por nombre
+        topic = self.topics.get(self.topic_arn((arn or "").split(":")[-1]))
+        if topic is None:
+            raise ServiceError("NotFound", "Topic does not exist", status=404)
+        return topic
+
+    def create_topic(self, name, attributes):
+        with self._lock:
+            arn = self.topic_arn(name)
+            if arn not in self.topics:
+                self.topics[arn] = {"name": name, "arn": arn, "attributes": dict(attributes), "subscriptions": []}
+                print(f"✓ Created topic {name}", flush=True)
+            return self.topics[arn]
+
+    def subscribe(self, topic, protocol, endpoint, attributes):
+        with self._lock:
+            for subscription_arn in topic["subscriptions"]:
+                subscription = self.subscriptions[subscription_arn]
+                if subscription["Protocol"] == protocol and subscription["Endpoint"] == endpoint:
+                    return subscription_arn
+            subscription_arn = f"{topic['arn']}:{uuid.uuid4()}"
+            self.subscriptions[subscription_arn] = {
+                "SubscriptionArn": subscription_arn,
+                "TopicArn": topic["arn"],
+                "Protocol": protocol,
+                "Endpoint": endpoint,
+                "Owner": ACCOUNT_ID,
+                "Attributes": dict(attributes),
+            }
+            topic["subscriptions"].append(subscription_arn)
+            print(f"✓ Subscribed {endpoint} to {topic['name']} ({protocol})", flush=True)
+            return subscription_arn
+
+    def unsubscribe(self, subscription_arn):
+        with self._lock:
+            subscription = self.subscriptions.pop(subscription_arn, None)
+            if subscription:
+                topic = self.topics.get(subscription["TopicArn"])
+                if topic and subscription_arn in topic["subscriptions"]:
+                    topic["subscriptions"].remove(subscription_arn)
+
+    def publish(self, topic, message, subject, message_attributes, group_id=None, deduplication_id=None):
+        """Entrega el mensaje a las colas suscritas cuyo FilterPolicy acepta los atributos."""
+        message_id = str(uuid.uuid4())
+        self.stats["published"] += 1
+        for subscription_arn in list(topic["subscriptions"]):
+            subscription = self.subscriptions.get(subscription_arn)
+            if not subscription or subscription["Protocol"] != "sqs":
+                continue
+            if not filter_policy_matches(subscription["Attributes"].get("FilterPolicy"), message_attributes):
+                continue
+            queue = self.get_queue_by_arn(subscription["Endpoint"])
+            if queue is None:
+                continue
+            if subscription["Attributes"].get("RawMessageDelivery") == "true":
+                queue.send(message, message_attributes, group_id=group_id, deduplication_id=deduplication_id)
+                continue
+            envelope = {
+                "Type": "Notification",
+                "MessageId": message_id,
+                "TopicArn": topic["arn"],
+                "Message": message,
+                "Timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+                "SignatureVersion": "1",
+                "Signature": "EXAMPLE",
+                "SigningCertURL": "https://sns.us-east-1.amazonaws.com/SimpleNotificationService-0000000000000000000000.pem",
+                "UnsubscribeURL": f"http://localhost:{PORT}/?Action=Unsubscribe&SubscriptionArn={subscription_arn}",
+            }
+            if subject:
+                envelope["Subject"] = subject
+            if message_attributes:
+                envelope["MessageAttributes"] = {
+                    name: {"Type": attribute["DataType"],
+                           "Value": attribute.get("StringValue", attribute.get("BinaryValue"))}
+                    for name, attribute in message_attributes.items()
+                }
+            queue.send(json.dumps(envelope), group_id=group_id,
+                       deduplication_id=deduplication_id or (message_id if group_id else None))
+        return message_id
+
+def filter_policy_matches(policy, message_attributes):
+    """Evalúa un FilterPolicy (alcance MessageAttributes) sobre los atributos del mensaje."""
+    if not policy:
+        return True
+    try:
+        policy = json.loads(policy) if isinstance(policy, str) else policy
+    except ValueError:
+        return True
+    for name, conditions in policy.items():
+        attribute = message_attributes.get(name)
+        value = attribute.get("StringValue") if attribute else None
+        if not isinstance(conditions, list):
+            conditions = [conditions]
+        if not any(condition_matches(condition, value, attribute is not None) for condition in conditions):
+            return False
+    return True
+
+def condition_matches(condition, value, present):
+    if isinstance(condition, dict):
+        if "exists" in condition:
+            return present == bool(condition["exists"])
+        if value is None:
+            return False
+        if "prefix" in condition:
+            return value.startswith(condition["prefix"])
+        if "anything-but" in condition:
+            excluded = condition["anything-but"]
+            return value not in (excluded if isinstance(excluded, list) else [excluded])
+        if "numeric" in condition:
+            try:
+                number = float(value)
+            except ValueError:
+                return False
+            operations = condition["numeric"]
+            comparisons = {"=": number.__eq__, ">": number.__gt__, ">=": number.__ge__, "<": number.__lt__, "<=": number.__le__}
+            return all(comparisons[operations[index]](float(operations[index + 1])) for index in range(0, len(operations), 2))
+        return False
+    if isinstance(condition, (int, float)) and not isinstance(condition, bool):
+        try:
+            return value is not None and float(value) == condition
+        except ValueError:
+            return False
+    return value == condition
+
+# ---------------------------------------------------------------------------
+# Protocolos HTTP
+# ---------------------------------------------------------------------------
+
+def parse_query_map(params, prefix, key_name="key", value_name="value"):
+    """Lee un mapa del protocolo query (prefix.entry.N.key / prefix.entry.N.value)."""
+    result = {}
+    index = 1
+    while f"{prefix}.entry.{index}.{key_name}" in params:
+        result[params[f"{prefix}.entry.{index}.{key_name}"]] = params.get(f"{prefix}.entry.{index}.{value_name}", "")
+        index += 1
+    return result
+
+def parse_sns_message_attributes(params):
+    attributes = {}
+    index = 1
+    while f"MessageAttributes.entry.{index}.Name" in params:
+        prefix = f"MessageAttributes.entry.{index}"
+        attribute = {"DataType": params.get(f"{prefix}.Value.DataType", "String")}
+        if f"{prefix}.Value.BinaryValue" in params:
+            attribute["BinaryValue"] = params[f"{prefix}.Value.BinaryValue"]
+        else:
+            attribute["StringValue"] = params.get(f"{prefix}.Value.StringValue", "")
+        attributes[params[f"{prefix}.Name"]] = attribute
+        index += 1
+    return attributes
+
+def xml_element(name, value):
+    if isinstance(value, dict):
+        return f"<{name}>" + "".join(xml_element(key, item) for key, item in value.items()) + f"</{name}>"
+    if isinstance(value, list):
+        return f"<{name}>" + "".join(xml_element("member", item) for item in value) + f"</{name}>"
+    return f"<{name}>{escape(str(value))}</{name}>"
+
+def xml_attributes(attributes):
+    return [{"key": key, "value": value} for key, value in attributes.items()]
+
+class LocalServicesRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Atiende SQS (JSON 1.0, AmazonSQS.*) y SNS (query) en el mismo puerto, como LocalStack."""
+
+    services = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path in ("/_localstack/health", "/health"):
+            return self._send(200, json.dumps({"services": {"sqs": "running", "sns": "running"}}).encode(), "application/json")
+        if path == "/_stats":
+            return self._send(200, json.dumps(dict(self.services.stats)).encode(), "application/json")
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        if params.get("Action"):
+            return self._handle_query(params)
+        self._send(404, b"", "text/plain")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        target = self.headers.get("X-Amz-Target", "")
+        if target.startswith("AmazonSQS."):
+            return self._handle_sqs_json(target.split(".", 1)[1], body)
+        params = dict(urllib.parse.parse_qsl(body.decode()))
+        self._handle_query(params)
+
+    # SQS JSON ---------------------------------------------------------------
+
+    def _handle_sqs_json(self, action, body):
+        try:
+            params = json.loads(body or b"{}")
+            handler = getattr(self, f"sqs_{action}", None)
+            if handler is None:
+                raise ServiceError("UnsupportedOperation", f"Unsupported action '{action}'")
+            payload = json.dumps(handler(params)).encode()
+            self._send(200, payload, "application/x-amz-json-1.0")
+        except ServiceError as e:
+            payload = json.dumps({"__type": f"com.amazonaws.sqs#{e.code}", "message": e.message}).encode()
+            self._send(e.status, payload, "application/x-amz-json-1.0",
+                       {"x-amzn-query-error": f"{e.query_code};Sender"})
+        except (ValueError, KeyError, TypeError) as e:
+            payload = json.dumps({"__type": "com.amazonaws.sqs#InvalidParameterValue", "message": str(e)}).encode()
+            self._send(400, payload, "application/x-amz-json-1.0", {"x-amzn-query-error": "InvalidParameterValue;Sender"})
+
+    def _host(self):
+        return self.headers.get("Host") or f"localhost:{self.server.server_address[1]}"
+
+    def sqs_CreateQueue(self, params):
+        queue = self.services.create_queue(params["QueueName"], params.get("Attributes"))
+        return {"QueueUrl": self.services.queue_url(self._host(), queue)}
+
+    def sqs_GetQueueUrl(self, params):
+        queue = self.services.queues.get(params.get("QueueName"))
+        if queue is None:
+            raise queue_does_not_exist()
+        return {"QueueUrl": self.services.queue_url(self._host(), queue)}
+
+    def sqs_ListQueues(self, params):
+        prefix = params.get("QueueNamePrefix", "")
+        return {"QueueUrls": [self.services.queue_url(self._host(), queue)
+                              for name, queue in sorted(self.services.queues.items()) if name.startswith(prefix)]}
+
+    def sqs_DeleteQueue(self, params):
+        self.services.delete_queue(self.services.get_queue(params.get("QueueUrl")))
+        return {}
+
+    def sqs_PurgeQueue(self, params):
+        self.services.get_queue(params.get("QueueUrl")).purge()
+        return {}
+
+    def sqs_GetQueueAttributes(self, params):
+        queue = self.services.get_queue(params.get("QueueUrl"))
+        return {"Attributes": queue.get_attributes(params.get("AttributeNames") or [])}
+
+    def sqs_SetQueueAttributes(self, params):
+        self.services.get_queue(params.get("QueueUrl")).set_attributes(params.get("Attributes") or {})
+        return {}
+
+    def sqs_ListDeadLetterSourceQueues(self, params):
+        queue = self.services.get_queue(params.get("QueueUrl"))
+        sources = []
+        for source in list(self.services.queues.values()):
+            policy = source.redrive_policy()
+            if policy and policy.get("deadLetterTargetArn") == queue.arn:
+                sources.append(self.services.queue_url(self._host(), source))
+        return {"queueUrls": sources}
+
+    def _send_entry(self, queue, entry):
+        message_id, message = queue.send(
+            entry["MessageBody"],
+            entry.get("MessageAttributes"),
+            entry.get("DelaySeconds"),
+            entry.get("MessageGroupId"),
+            entry.get("MessageDeduplicationId"),
+        )
+        result = {"MessageId": message_id, "MD5OfMessageBody": md5_hex(entry["MessageBody"])}
+        if entry.get("MessageAttributes"):
+            result["MD5OfMessageAttributes"] = md5_of_message_attributes(entry["MessageAttributes"])
+        if message is not None and message.sequence_number:
+            result["SequenceNumber"] = message.sequence_number
+        return result
+
+    def sqs_SendMessage(self, params):
+        return self._send_entry(self.services.get_queue(params.get("QueueUrl")), params)
+
+    def sqs_SendMessageBatch(self, params):
+        queue = self.services.get_queue(params.get("QueueUrl"))
+        successful, failed = [], []
+        for entry in params.get("Entries", []):
+            try:
+                successful.append({"Id": entry["Id"], **self._send_entry(queue, entry)})
+            except ServiceError as e:
+                failed.append({"Id": entry["Id"], "SenderFault": True, "Code": e.code, "Message": e.message})
+        return {"Successful": successful, "Failed": failed}
+
+    def sqs_ReceiveMessage(self, params):
+        queue = self.services.get_queue(params.get("QueueUrl"))
+        max_messages = int(params.get("MaxNumberOfMessages", 1))
+        if not 1 <= max_messages <= 10:
+            raise ServiceError("InvalidParameterValue", f"Value {max_messages} for parameter MaxNumberOfMessages is invalid.")
+        visibility_timeout = int(params.get("VisibilityTimeout", queue.attribute("VisibilityTimeout", 30)))
+        wait_seconds = min(int(params.get("WaitTimeSeconds", queue.attribute("ReceiveMessageWaitTimeSeconds"))), MAX_WAIT_SECONDS)
+        attribute_names = set(params.get("AttributeNames") or []) | set(params.get("MessageSystemAttributeNames") or [])
+        message_attribute_names = set(params.get("MessageAttributeNames") or [])
+
+        messages = []
+        for handle, message in queue.receive(max_messages, visibility_timeout, wait_seconds):
+            result = {
+                "MessageId": message.message_id,
+                "ReceiptHandle": handle,
+                "MD5OfBody": md5_hex(message.body),
+                "Body": message.body,
+            }
+            if attribute_names:
+                system_attributes = message.system_attributes()
+                result["Attributes"] = (system_attributes if "All" in attribute_names
+                                        else {name: value for name, value in system_attributes.items() if name in attribute_names})
+            selected = {
+                name: attribute for name, attribute in message.message_attributes.items()
+                if {"All", ".*"} & message_attribute_names or name in message_attribute_names
+                or any(pattern.endswith(".*") and name.startswith(pattern[:-2]) for pattern in message_attribute_names)
+            }
+            if selected:
+                result["MessageAttributes"] = selected
+                result["MD5OfMessageAttributes"] = md5_of_message_attributes(selected)
+            messages.append(result)
+        self.services.stats["received"] += len(messages)
+        return {"Messages": messages} if messages else {}
+
+    def sqs_DeleteMessage(self, params):
+        self.services.get_queue(params.get("QueueUrl")).delete(params["ReceiptHandle"])
+        return {}
+
+    def sqs_DeleteMessageBatch(self, params):
+        queue = self.services.get_queue(params.get("QueueUrl"))
+        for entry in params.get("Entries", []):
+            queue.delete(entry["ReceiptHandle"])
+        return {"Successful": [{"Id": entry["Id"]} for entry in params.get("Entries", [])], "Failed": []}
+
+    def sqs_ChangeMessageVisibility(self, params):
+        self.services.get_queue(params.get("QueueUrl")).change_visibility(params["ReceiptHandle"], int(params["VisibilityTimeout"]))
+        return {}
+
+    def sqs_ChangeMessageVisibilityBatch(self, params):
+        queue = self.services.get_queue(params.get("QueueUrl"))
+        successful, failed = [], []
+        for entry in params.get("Entries", []):
+            try:
+                queue.change_visibility(entry["ReceiptHandle"], int(entry["VisibilityTimeout"]))
+                successful.append({"Id": entry["Id"]})
+            except ServiceError as e:
+                failed.append({"Id": entry["Id"], "SenderFault": True, "Code": e.code, "Message": e.message})
+        return {"Successful": successful, "Failed": failed}
+
+    # SNS query --------------------------------------------------------------
+
+    def _handle_query(self, params):
+        action = params.get("Action", "")
+        try:
+            handler = getattr(self, f"sns_{action}", None)
+            if handler is None:
+                raise ServiceError("InvalidAction", f"The action {action} is not valid for this endpoint.")
+            result = handler(params)
+            request_id = str(uuid.uuid4())
+            body = (f'<{action}Response xmlns="{SNS_NAMESPACE}">'
+                    + (xml_element(f"{action}Result", result) if result is not None else "")
+                    + f"<ResponseMetadata><RequestId>{request_id}</RequestId></ResponseMetadata></{action}Response>")
+            self._send(200, body.encode(), "text/xml")
+        except ServiceError as e:
+            body = (f'<ErrorResponse xmlns="{SNS_NAMESPACE}"><Error><Type>Sender</Type><Code>{escape(e.code)}</Code>'
+                    f"<Message>{escape(e.message)}</Message></Error><RequestId>{uuid.uuid4()}</RequestId></ErrorResponse>")
+            self._send(e.status, body.encode(), "text/xml")
+
+    def sns_CreateTopic(self, params):
+        topic = self.services.create_topic(params["Name"], parse_query_map(params, "Attributes"))
+        return {"TopicArn": topic["arn"]}
+
+    def sns_ListTopics(self, params):
+        return {"Topics": [{"TopicArn": arn} for arn in sorted(self.services.topics)]}
+
+    def sns_DeleteTopic(self, params):
+        topic = self.services.get_topic(params.get("TopicArn"))
+        for subscription_arn in list(topic["subscriptions"]):
+            self.services.unsubscribe(subscription_arn)
+        self.services.topics.pop(topic["arn"], None)
+        return None
+
+    def sns_GetTopicAttributes(self, params):
+        topic = self.services.get_topic(params.get("TopicArn"))
+        attributes = {
+            "TopicArn": topic["arn"],
+            "Owner": ACCOUNT_ID,
+            "DisplayName": topic["attributes"].get("DisplayName", ""),
+            "SubscriptionsConfirmed": str(len(topic["subscriptions"])),
+            "SubscriptionsPending": "0",
+            "SubscriptionsDeleted": "0",
+            **topic["attributes"],
+        }
+        return {"Attributes": xml_attributes(attributes)}
+
+    def sns_SetTopicAttributes(self, params):
+        topic = self.services.get_topic(params.get("TopicArn"))
+        topic["attributes"][params["AttributeName"]] = params.get("AttributeValue", "")
+        return None
+
+    def sns_Subscribe(self, params):
+        topic = self.services.get_topic(params.get("TopicArn"))
+        protocol = params.get("Protocol", "")
+        if protocol != "sqs":
+            raise ServiceError("InvalidParameter", f"Invalid parameter: Protocol {protocol} is not supported locally")
+        subscription_arn = self.services.subscribe(topic, protocol, params.get("Endpoint", ""), parse_query_map(params, "Attributes"))
+        return {"SubscriptionArn": subscription_arn}
+
+    def sns_Unsubscribe(self, params):
+        self.services.unsubscribe(params.get("SubscriptionArn"))
+        return None
+
+    def sns_SetSubscriptionAttributes(self, params):
+        subscription = self.services.subscriptions.get(params.get("SubscriptionArn"))
+        if subscription is None:
+            raise ServiceError("NotFound", "Subscription does not exist", status=404)
+        subscription["Attributes"][params["AttributeName"]] = params.get("AttributeValue", "")
+        return None
+
+    def sns_GetSubscriptionAttributes(self, params):
+        subscription = self.services.subscriptions.get(params.get("SubscriptionArn"))
+        if subscription is None:
+            raise ServiceError("NotFound", "Subscription does not exist", status=404)
+        attributes = {key: subscription[key] for key in ("SubscriptionArn", "TopicArn", "Protocol", "Endpoint", "Owner")}
+        attributes.update(subscription["Attributes"])
+        attributes["ConfirmationWasAuthenticated"] = "true"
+        attributes["PendingConfirmation"] = "false"
+        return {"Attributes": xml_attributes(attributes)}
+
+    def _subscription_members(self, subscriptions):
+        return [{key: subscription[key] for key in ("SubscriptionArn", "Owner", "Protocol", "Endpoint", "TopicArn")}
+                for subscription in subscriptions]
+
+    def sns_ListSubscriptions(self, params):
+        return {"Subscriptions": self._subscription_members(list(self.services.subscriptions.values()))}
+
+    def sns_ListSubscriptionsByTopic(self, params):
+        topic = self.services.get_topic(params.get("TopicArn"))
+        return {"Subscriptions": self._subscription_members(
+            [self.services.subscriptions[arn] for arn in topic["subscriptions"] if arn in self.services.subscriptions]
+        )}
+
+    def sns_Publish(self, params):
+        topic = self.services.get_topic(params.get("TopicArn") or params.get("TargetArn"))
+        message_id = self.services.publish(
+            topic,
+            params.get("Message", ""),
+            params.get("Subject"),
+            parse_sns_message_attributes(params),
+            params.get("MessageGroupId"),
+            params.get("MessageDeduplicationId"),
+        )
+        return {"MessageId": message_id}
+
+    # ------------------------------------------------------------------------
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class LocalServicesServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Los receives con long polling mantienen conexiones abiertas; evitar el backlog por defecto (5)
+    request_queue_size = 128
+
+def start_server(port=PORT, host="0.0.0.0"):
+    """Inicia el servidor en un thread y retorna (servidor, servicios)."""
+    services = LocalServices()
+    handler = type("BoundLocalServicesRequestHandler", (LocalServicesRequestHandler,), {"services": services})
+    server = LocalServicesServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="sqs-sns-server", daemon=True).start()
+    return server, services
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lightweight local SQS/SNS endpoint")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default {PORT})")
+    parser.add_argument("--host", default="0.0.0.0", help="interface to listen on")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    try:
+        server, services = start_server(args.port, args.host)
+    except OSError as e:
+        print(f"✗ Error: could not listen on port {args.port}: {e}", flush=True)
+        return 1
+    print(f"✓ SQS/SNS endpoint at http://{args.host}:{args.port} (ready in {(time.monotonic() - started) * 1000:.0f}ms)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        services.stopping = True
+        for queue in list(services.queues.values()):
+            with queue.cond:
+                queue.cond.notify_all()
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+Utilidades compartidas por los pollers SQS -> Lambda locales
+(sqs-lambda-poller.py y sqs-lambda-poller-service.py).
+
+Este módulo no tiene dependencias externas: los scripts que lo usan se
+ejecutan directamente y lo importan desde su mismo directorio.
+"""
+
+def parse_batch_item_failures(event, result):
+    """
+    Interpreta la respuesta `batchItemFailures` de Lambda (ReportBatchItemFailures).
+    Retorna los messageId fallidos; una respuesta inválida hace fallar todo el batch,
+    igual que en AWS Lambda.
+    """
+    message_ids = {record["messageId"] for record in event["Records"]}
+    if not isinstance(result, dict) or result.get("batchItemFailures") is None:
+        return set()
+
+    failures = result["batchItemFailures"]
+    if not isinstance(failures, list):
+        return message_ids
+
+    failed = set()
+    for item in failures:
+        identifier = item.get("itemIdentifier") if isinstance(item, dict) else None
+        if not identifier or identifier not in message_ids:
+            return message_ids
+        failed.add(identifier)
+    return failed
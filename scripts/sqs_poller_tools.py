@@ -0,0 +1,45 @@
+"""
+Utilidades compartidas por las herramientas que reutilizan el servicio del
+poller (sqs-replay.py, sqs-poller-benchmark.py y step-functions-local.py).
+
+Como sqs_lambda_events.py, no tiene dependencias externas y los scripts lo
+importan desde su mismo directorio.
+"""
+
+import importlib.util
+import os
+import signal
+import sys
+
+POLLER_SCRIPTS = ("sqs-lambda-poller-service.py", "sqs-poller.py")  # nombre en el repo y en la imagen Docker
+
+def load_poller_module():
+    """
+    Carga el servicio del poller (SQS_POLLER_SCRIPT o el script junto a este
+    módulo) para reutilizar sus workers, consumidores, métricas y rate limits.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    candidates = [os.getenv("SQS_POLLER_SCRIPT")] + [os.path.join(directory, name) for name in POLLER_SCRIPTS]
+    for path in filter(None, candidates):
+        if os.path.exists(path):
+            spec = importlib.util.spec_from_file_location("sqs_poller", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+    sys.exit("✗ Error: poller script not found (set SQS_POLLER_SCRIPT)")
+
+def restore_default_signals():
+    """
+    Al importarse, el poller instala sus handlers de SIGINT/SIGTERM (que solo
+    bajan RUNNING y, a la segunda señal, terminan con os._exit). Las
+    herramientas que no usan su ciclo de vida los reemplazan por los de Python
+    para que Ctrl-C interrumpa con KeyboardInterrupt.
+    """
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,742 @@
+#!/usr/bin/env python3
+"""
+Reemplazo local de Step Functions para las state machines de serverless.yml.
+
+Ejecuta en proceso los estados Task, Choice, Pass, Wait, Succeed y Fail (con
+Retry y Catch) invocando las funciones en workers Node precargados (el pool de
+workers del poller, sin pasar por LocalStack), y expone StartExecution,
+DescribeExecution, StopExecution, GetExecutionHistory y ListStateMachines por
+HTTP (protocolo JSON de AWS) para que el StepFunctionsService del backend
+apunte aquí con STEP_FUNCTIONS_ENDPOINT:
+
+  python scripts/step-functions-local.py --port 8083
+  STEP_FUNCTIONS_ENDPOINT=http://localhost:8083 npm run dev
+
+Corre como servicio propio (step-functions-local en docker-compose), separado
+del poller de SQS: reiniciar o detener el poller no corta ejecuciones de pagos
+en curso. Al recibir SIGTERM/SIGINT deja de aceptar ejecuciones, espera hasta
+DRAIN_TIMEOUT segundos a las que están en curso y aborta las que no terminaron.
+
+La duración de cada estado se registra en el historial, en el log y en
+/metrics (METRICS_PORT). RATE_LIMITS limita las invocaciones por segundo de
+cada función, con el mismo formato que en el poller.
+"""
+
+import argparse
+import collections
+import http.server
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from sqs_poller_tools import load_poller_module
+
+# Configuración
+PORT = int(os.getenv("STEP_FUNCTIONS_PORT", "8083"))  # puerto del endpoint de Step Functions
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))  # puerto HTTP de /metrics y /health (0 lo deshabilita)
+REGION = os.getenv("AWS_REGION", "us-east-1")
+STEP_FUNCTIONS_POOL_SIZE = int(os.getenv("STEP_FUNCTIONS_POOL_SIZE", "1"))  # workers Node por función de las state machines
+STEP_FUNCTIONS_MAX_EXECUTIONS = int(os.getenv("STEP_FUNCTIONS_MAX_EXECUTIONS", "10"))  # ejecuciones simultáneas
+STEP_FUNCTIONS_HISTORY_SIZE = 1000  # ejecuciones que se conservan para DescribeExecution
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))  # segundos para que terminen las ejecuciones en curso al detener el servicio
+
+poller = load_poller_module()
+
+STATE_DURATION = poller.METRICS.histogram("sqs_poller_state_duration_seconds", "Duration of each Step Functions state executed locally")
+STATE_MACHINE_EXECUTIONS_TOTAL = poller.METRICS.counter("sqs_poller_state_machine_executions_total", "Local Step Functions executions by final status")
+
+LAMBDA_INVOKE_RESOURCE = "arn:aws:states:::lambda:invoke"
+
+class StatesError(Exception):
+    """Error de una ejecución con su nombre de Step Functions (States.Timeout, Error, ...)."""
+
+    def __init__(self, error, cause=""):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+def get_function_logical_id(function_name):
+    """Logical ID que serverless asigna a una función (processPayment -> ProcessPaymentLambdaFunction)."""
+    name = function_name.replace("-", "Dash").replace("_", "Underscore")
+    return name[:1].upper() + name[1:] + "LambdaFunction"
+
+def resolve_state_machine_definition(definition, document, functions):
+    """Resuelve el DefinitionString (Fn::Sub con los ARN de las funciones) a un dict."""
+    variables = {"AWS::Region": REGION, "AWS::AccountId": "000000000000", "AWS::Partition": "aws"}
+    if isinstance(definition, dict) and "Fn::Sub" in definition:
+        definition = definition["Fn::Sub"]
+        if isinstance(definition, list):
+            definition, sub_variables = definition[0], definition[1] if len(definition) > 1 else {}
+            logical_ids = {get_function_logical_id(name): name for name in functions}
+            for variable, value in (sub_variables or {}).items():
+                if isinstance(value, dict) and "Fn::GetAtt" in value and value["Fn::GetAtt"][0] in logical_ids:
+                    value = f"arn:aws:lambda:{REGION}:000000000000:function:{logical_ids[value['Fn::GetAtt'][0]]}"
+                variables[variable] = str(value)
+    if isinstance(definition, dict):
+        return definition
+
+    definition = poller.resolve_serverless_variables(definition, document)
+    definition = re.sub(r"\$\{([^${}!]+)\}", lambda match: variables.get(match.group(1), match.group(0)), definition)
+    return json.loads(definition)
+
+def load_serverless_state_machines(path=poller.SERVERLESS_CONFIG):
+    """
+    Retorna (state_machines, functions): las definiciones de las state machines
+    de serverless.yml por nombre y el handler/timeout de cada función.
+    """
+    document = poller.read_serverless_config(path)
+    if document is None:
+        return {}, {}
+
+    provider = document.get("provider", {})
+    functions = {
+        name: {
+            "handler": function["handler"],
+            "timeout": int(function.get("timeout") or provider.get("timeout") or poller.DEFAULT_VISIBILITY_TIMEOUT)
+        }
+        for name, function in (document.get("functions", {}) or {}).items()
+    }
+
+    state_machines = {}
+    resources = (document.get("resources", {}) or {}).get("Resources", {}) or {}
+    for logical_id, resource in resources.items():
+        if resource.get("Type") != "AWS::StepFunctions::StateMachine":
+            continue
+        properties = resource.get("Properties", {})
+        name = poller.resolve_serverless_variables(properties.get("StateMachineName") or logical_id, document)
+        try:
+            state_machines[name] = resolve_state_machine_definition(
+                properties.get("DefinitionString") or properties.get("Definition"), document, functions
+            )
+        except (ValueError, TypeError, IndexError) as e:
+            print(f"✗ Could not parse the definition of state machine {name}: {e}", flush=True)
+    return state_machines, functions
+
+JSON_PATH_TOKEN = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]|\['([^']*)'\]")
+
+def get_json_path(data, path, context=None):
+    """Evalúa un JSONPath simple ($, $.a.b, $.a[0], $$.Execution.Id) sobre `data`."""
+    if path.startswith("$$"):
+        data, path = context or {}, path[1:]
+    if not path.startswith("$"):
+        raise StatesError("States.Runtime", f"Invalid path '{path}'")
+    position = 1
+    for match in JSON_PATH_TOKEN.finditer(path, 1):
+        if match.start() != position:
+            break
+        position = match.end()
+        key = match.group(1) if match.group(1) is not None else match.group(3)
+        try:
+            data = data[int(match.group(2))] if key is None else data[key]
+        except (KeyError, IndexError, TypeError):
+            raise StatesError("States.Runtime", f"The JSONPath '{path}' could not be found in the input")
+    if position != len(path):
+        raise StatesError("States.Runtime", f"Unsupported JSONPath '{path}'")
+    return data
+
+def set_json_path(data, path, value):
+    """Retorna una copia de `data` con `value` en `path` (semántica de ResultPath)."""
+    if path == "$":
+        return value
+    keys = [match.group(1) or match.group(3) for match in JSON_PATH_TOKEN.finditer(path, 1)]
+    if not keys or None in keys:
+        raise StatesError("States.Runtime", f"Unsupported ResultPath '{path}'")
+    result = dict(data) if isinstance(data, dict) else {}
+    node = result
+    for key in keys[:-1]:
+        node[key] = dict(node[key]) if isinstance(node.get(key), dict) else {}
+        node = node[key]
+    node[keys[-1]] = value
+    return result
+
+def apply_parameters(template, data, context):
+    """Evalúa un bloque Parameters/ResultSelector: las claves `x.$` toman su valor de un JSONPath."""
+    if isinstance(template, dict):
+        result = {}
+        for key, value in template.items():
+            if key.endswith(".$"):
+                if not isinstance(value, str) or value.startswith("States."):
+                    raise StatesError("States.Runtime", f"Unsupported value for '{key}': {value}")
+                result[key[:-2]] = get_json_path(data, value, context)
+            else:
+                result[key] = apply_parameters(value, data, context)
+        return result
+    if isinstance(template, list):
+        return [apply_parameters(value, data, context) for value in template]
+    return template
+
+def error_matches(error_equals, error):
+    """ErrorEquals de Retry/Catch: States.ALL atrapa todo salvo States.Runtime."""
+    for name in error_equals:
+        if name == error:
+            return True
+        if name == "States.ALL" and error != "States.Runtime":
+            return True
+        if name == "States.TaskFailed" and error not in ("States.Timeout", "States.Runtime"):
+            return True
+    return False
+
+CHOICE_COMPARISONS = {
+    "Equals": lambda a, b: a == b,
+    "LessThan": lambda a, b: a < b,
+    "GreaterThan": lambda a, b: a > b,
+    "LessThanEquals": lambda a, b: a <= b,
+    "GreaterThanEquals": lambda a, b: a >= b,
+}
+CHOICE_TYPES = {"String": str, "Numeric": (int, float), "Boolean": bool, "Timestamp": str}
+
+def evaluate_choice_rule(rule, data, context):
+    """Evalúa una regla de un estado Choice (incluidas And, Or y Not)."""
+    if "And" in rule:
+        return all(evaluate_choice_rule(item, data, context) for item in rule["And"])
+    if "Or" in rule:
+        return any(evaluate_choice_rule(item, data, context) for item in rule["Or"])
+    if "Not" in rule:
+        return not evaluate_choice_rule(rule["Not"], data, context)
+
+    try:
+        value = get_json_path(data, rule["Variable"], context)
+        present = True
+    except StatesError:
+        value, present = None, False
+    if "IsPresent" in rule:
+        return present == rule["IsPresent"]
+    if not present:
+        return False
+    if "IsNull" in rule:
+        return (value is None) == rule["IsNull"]
+    for kind, expected in CHOICE_TYPES.items():
+        if f"Is{kind}" in rule:
+            matches = isinstance(value, expected) and not (kind == "Numeric" and isinstance(value, bool))
+            return matches == rule[f"Is{kind}"]
+    if "StringMatches" in rule:
+        pattern = re.escape(rule["StringMatches"]).replace(r"\*", ".*")
+        return isinstance(value, str) and re.fullmatch(pattern, value) is not None
+
+    for operator, expected in rule.items():
+        if operator == "Next" or operator == "Variable":
+            continue
+        if operator.endswith("Path"):
+            operator, expected = operator[:-len("Path")], get_json_path(data, expected, context)
+        for kind, value_type in CHOICE_TYPES.items():
+            if operator.startswith(kind) and operator[len(kind):] in CHOICE_COMPARISONS:
+                if not isinstance(value, value_type) or (kind == "Numeric" and isinstance(value, bool)):
+                    return False
+                return CHOICE_COMPARISONS[operator[len(kind):]](value, expected)
+        raise StatesError("States.Runtime", f"Unsupported Choice operator '{operator}'")
+    return False
+
+class StateMachineExecution:
+    """Estado e historial de una ejecución (lo que retorna DescribeExecution)."""
+
+    def __init__(self, execution_arn, state_machine_arn, name, definition, input_text):
+        self.execution_arn = execution_arn
+        self.state_machine_arn = state_machine_arn
+        self.state_machine_name = state_machine_arn.split(":")[-1]
+        self.name = name
+        self.definition = definition
+        self.input = input_text
+        self.output = None
+        self.error = None
+        self.cause = None
+        self.status = "RUNNING"
+        self.start_date = time.time()
+        self.stop_date = None
+        self.events = []
+        self.stop_requested = threading.Event()
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        self.add_event("ExecutionStarted", executionStartedEventDetails={"input": input_text})
+
+    def add_event(self, event_type, **details):
+        with self._lock:
+            self.events.append({
+                "id": len(self.events) + 1,
+                "previousEventId": len(self.events),
+                "timestamp": time.time(),
+                "type": event_type,
+                **details
+            })
+
+    def finish(self, status, output=None, error=None, cause=None):
+        with self._lock:
+            if self.status != "RUNNING":
+                return
+            self.status = status
+            self.output = None if output is None else json.dumps(output)
+            self.error = error
+            self.cause = cause
+            self.stop_date = time.time()
+        if status == "SUCCEEDED":
+            self.add_event("ExecutionSucceeded", executionSucceededEventDetails={"output": self.output})
+        elif status == "ABORTED":
+            self.add_event("ExecutionAborted", executionAbortedEventDetails={"error": error or "", "cause": cause or ""})
+        else:
+            self.add_event("ExecutionFailed", executionFailedEventDetails={"error": error or "", "cause": cause or ""})
+        STATE_MACHINE_EXECUTIONS_TOTAL.inc(state_machine=self.state_machine_name, status=status)
+        self.finished.set()
+
+    def describe(self):
+        """Respuesta de DescribeExecution."""
+        with self._lock:
+            response = {
+                "executionArn": self.execution_arn,
+                "stateMachineArn": self.state_machine_arn,
+                "name": self.name,
+                "status": self.status,
+                "startDate": self.start_date,
+                "input": self.input,
+            }
+            for key, value in (("stopDate", self.stop_date), ("output", self.output),
+                               ("error", self.error), ("cause", self.cause)):
+                if value is not None:
+                    response[key] = value
+            return response
+
+class StepFunctionsExecutor:
+    """
+    Ejecuta las state machines en un pool de threads. Las Task de Lambda se
+    invocan en un WorkerPool por función (sin pasar por LocalStack), y cada
+    estado registra su duración en el historial, el log y /metrics.
+    """
+
+    def __init__(self, state_machines, functions, pools=None, max_executions=STEP_FUNCTIONS_MAX_EXECUTIONS):
+        self.state_machines = state_machines
+        self.functions = functions
+        self.pools = dict(pools or {})
+        self.executions = collections.OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_executions, thread_name_prefix="sfn-execution")
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def get_pool(self, function_name):
+        """Pool de workers de una función; se crea la primera vez que se usa."""
+        with self._lock:
+            if function_name not in self.pools:
+                function = self.functions[function_name]
+                self.pools[function_name] = poller.WorkerPool(
+                    function["handler"], size=STEP_FUNCTIONS_POOL_SIZE, function_name=function_name
+                )
+            return self.pools[function_name]
+
+    def preload(self):
+        """Precarga en segundo plano los workers de las funciones usadas por las state machines."""
+        used = set()
+        for definition in self.state_machines.values():
+            for state in definition.get("States", {}).values():
+                function_name = self._task_function(state)
+                if function_name in self.functions:
+                    used.add(function_name)
+
+        def preload_pools():
+            for function_name in sorted(used):
+                self.get_pool(function_name).start()
+        threading.Thread(target=preload_pools, name="sfn-preload", daemon=True).start()
+
+    def start_execution(self, state_machine_arn, name=None, input_text=None):
+        """StartExecution: valida la entrada y lanza la ejecución en segundo plano."""
+        state_machine_name = state_machine_arn.split(":")[-1]
+        definition = self.state_machines.get(state_machine_name)
+        if definition is None:
+            raise StatesError("StateMachineDoesNotExist", f"State Machine Does Not Exist: '{state_machine_arn}'")
+        input_text = input_text or "{}"
+        try:
+            json.loads(input_text)
+        except ValueError:
+            raise StatesError("InvalidExecutionInput", "Invalid State Machine Execution Input")
+
+        name = name or str(uuid.uuid4())
+        prefix = state_machine_arn.rsplit(":stateMachine:", 1)[0]
+        execution_arn = f"{prefix}:execution:{state_machine_name}:{name}"
+        with self._lock:
+            if self.closed:
+                raise StatesError("ServiceUnavailable", "The Step Functions endpoint is shutting down")
+            existing = self.executions.get(execution_arn)
+            if existing is not None:
+                if existing.input == input_text:
+                    return existing
+                raise StatesError("ExecutionAlreadyExists", f"Execution Already Exists: '{execution_arn}'")
+            execution = StateMachineExecution(execution_arn, state_machine_arn, name, definition, input_text)
+            self.executions[execution_arn] = execution
+            self._trim_history()
+        self._executor.submit(self._run, execution)
+        return execution
+
+    def get_execution(self, execution_arn):
+        with self._lock:
+            execution = self.executions.get(execution_arn)
+        if execution is None:
+            raise StatesError("ExecutionDoesNotExist", f"Execution Does Not Exist: '{execution_arn}'")
+        return execution
+
+    def _trim_history(self):
+        """Descarta las ejecuciones terminadas más antiguas."""
+        finished = [arn for arn, execution in self.executions.items() if execution.status != "RUNNING"]
+        for arn in finished[:max(0, len(self.executions) - STEP_FUNCTIONS_HISTORY_SIZE)]:
+            del self.executions[arn]
+
+    def _task_function(self, state):
+        """Función de serverless que invoca un estado Task (None si no es una Task de Lambda)."""
+        if state.get("Type") != "Task":
+            return None
+        resource = state.get("Resource", "")
+        arn = state.get("Parameters", {}).get("FunctionName", "") if resource.startswith(LAMBDA_INVOKE_RESOURCE) else resource
+        if not isinstance(arn, str) or ":function:" not in arn:
+            return arn or None
+        name = arn.split(":function:", 1)[1].split(":")[0]
+        if name not in self.functions:
+            # Nombre desplegado: <service>-<stage>-<función>
+            name = next((function for function in self.functions if name.endswith(f"-{function}")), name)
+        return name
+
+    def _run(self, execution):
+        """Recorre los estados desde StartAt hasta un estado final."""
+        definition = execution.definition
+        context = {
+            "Execution": {"Id": execution.execution_arn, "Name": execution.name, "StartTime": execution.start_date},
+            "StateMachine": {"Id": execution.state_machine_arn, "Name": execution.state_machine_name},
+        }
+        data = json.loads(execution.input)
+        state_name = definition["StartAt"]
+        print(f"▶ [{execution.state_machine_name}] Execution {execution.name} started", flush=True)
+        try:
+            while True:
+                if execution.stop_requested.is_set():
+                    return
+                state = definition["States"].get(state_name)
+                if state is None:
+                    raise StatesError("States.Runtime", f"State '{state_name}' does not exist")
+                context["State"] = {"Name": state_name, "EnteredTime": time.time()}
+                execution.add_event(f"{state['Type']}StateEntered",
+                                    stateEnteredEventDetails={"name": state_name, "input": json.dumps(data)})
+                started = time.monotonic()
+                result = "failed"
+                try:
+                    data, next_state = self._run_state(execution, state_name, state, data, context)
+                    caught = next_state != state.get("Next") and any(
+                        catcher.get("Next") == next_state for catcher in state.get("Catch", [])
+                    )
+                    result = "caught" if caught else "succeeded"
+                finally:
+                    duration = time.monotonic() - started
+                    STATE_DURATION.observe(duration, state_machine=execution.state_machine_name, state=state_name, result=result)
+                    print(f"  ⏱ [{execution.name}] {state_name} ({state['Type']}) {result} in {duration * 1000:.1f} ms", flush=True)
+                execution.add_event(f"{state['Type']}StateExited",
+                                    stateExitedEventDetails={"name": state_name, "output": json.dumps(data)})
+                if state["Type"] == "Fail":
+                    execution.finish("FAILED", error=state.get("Error"), cause=state.get("Cause"))
+                    break
+                if next_state is None:
+                    execution.finish("SUCCEEDED", output=data)
+                    break
+                state_name = next_state
+        except StatesError as e:
+            execution.finish("TIMED_OUT" if e.error == "States.Timeout" else "FAILED", error=e.error, cause=e.cause)
+        except Exception as e:
+            execution.finish("FAILED", error="States.Runtime", cause=str(e))
+
+        elapsed = (execution.stop_date or time.time()) - execution.start_date
+        symbol = "✓" if execution.status == "SUCCEEDED" else "✗"
+        print(f"{symbol} [{execution.state_machine_name}] Execution {execution.name} {execution.status} "
+              f"in {elapsed * 1000:.0f} ms{f' ({execution.error})' if execution.error else ''}", flush=True)
+
+    def _run_state(self, execution, state_name, state, data, context):
+        """Ejecuta un estado y retorna (salida, siguiente estado o None si termina)."""
+        state_type = state["Type"]
+        next_state = None if state.get("End") else state.get("Next")
+        if state_type == "Succeed":
+            return self._filter_output(state, self._filter_input(state, data, context), context), None
+        if state_type == "Fail":
+            return data, None
+        if state_type == "Choice":
+            effective = self._filter_input(state, data, context)
+            for rule in state.get("Choices", []):
+                if evaluate_choice_rule(rule, effective, context):
+                    return self._filter_output(state, effective, context), rule["Next"]
+            if "Default" not in state:
+                raise StatesError("States.NoChoiceMatched", f"No Choice matched in state '{state_name}'")
+            return self._filter_output(state, effective, context), state["Default"]
+        if state_type == "Wait":
+            effective = self._filter_input(state, data, context)
+            seconds = state.get("Seconds")
+            if "SecondsPath" in state:
+                seconds = get_json_path(effective, state["SecondsPath"], context)
+            if seconds is None:
+                raise StatesError("States.Runtime", f"Unsupported Wait state '{state_name}' (only Seconds/SecondsPath)")
+            execution.stop_requested.wait(max(0, float(seconds)))
+            return self._filter_output(state, effective, context), next_state
+        if state_type == "Pass":
+            effective = self._filter_input(state, data, context)
+            if "Parameters" in state:
+                effective = apply_parameters(state["Parameters"], effective, context)
+            result = state.get("Result", effective)
+            return self._filter_output(state, self._apply_result_path(state, data, result), context), next_state
+        if state_type == "Task":
+            return self._run_task(execution, state_name, state, data, context, next_state)
+        raise StatesError("States.Runtime", f"Unsupported state type '{state_type}' in state '{state_name}'")
+
+    def _run_task(self, execution, state_name, state, data, context, next_state):
+        """Ejecuta una Task con sus Retry; si falla, busca un Catch que la atrape."""
+        attempts = {}
+        while True:
+            try:
+                effective = self._filter_input(state, data, context)
+                if "Parameters" in state:
+                    effective = apply_parameters(state["Parameters"], effective, context)
+                result = self._invoke_task(execution, state_name, state, effective)
+                if "ResultSelector" in state:
+                    result = apply_parameters(state["ResultSelector"], result, context)
+                return self._filter_output(state, self._apply_result_path(state, data, result), context), next_state
+            except StatesError as e:
+                retrier = next((index for index, retry in enumerate(state.get("Retry", []))
+                                if error_matches(retry.get("ErrorEquals", []), e.error)), None)
+                if retrier is not None:
+                    retry = state["Retry"][retrier]
+                    attempts[retrier] = attempts.get(retrier, 0) + 1
+                    if attempts[retrier] <= retry.get("MaxAttempts", 3):
+                        delay = retry.get("IntervalSeconds", 1) * retry.get("BackoffRate", 2.0) ** (attempts[retrier] - 1)
+                        delay = min(delay, retry.get("MaxDelaySeconds", delay))
+                        print(f"  ↻ [{execution.name}] {state_name} failed with {e.error}, "
+                              f"retry {attempts[retrier]}/{retry.get('MaxAttempts', 3)} in {delay:.1f}s", flush=True)
+                        if execution.stop_requested.wait(delay):
+                            raise
+                        continue
+
+                for catcher in state.get("Catch", []):
+                    if error_matches(catcher.get("ErrorEquals", []), e.error):
+                        print(f"  ⚠ [{execution.name}] {state_name} failed with {e.error}, caught -> {catcher['Next']}", flush=True)
+                        error_output = {"Error": e.error, "Cause": e.cause}
+                        result_path = catcher.get("ResultPath", "$")
+                        output = data if result_path is None else set_json_path(data, result_path, error_output)
+                        return output, catcher["Next"]
+                raise
+
+    def _invoke_task(self, execution, state_name, state, payload):
+        """Invoca la función de la Task en un worker Node y retorna su resultado."""
+        function_name = self._task_function(state)
+        if function_name not in self.functions:
+            raise StatesError("States.Runtime", f"Unsupported Task resource in state '{state_name}': {state.get('Resource')}")
+
+        timeout = self.functions[function_name]["timeout"]
+        if state.get("TimeoutSeconds"):
+            timeout = min(timeout, state["TimeoutSeconds"])
+        event = payload.get("Payload", {}) if state["Resource"].startswith(LAMBDA_INVOKE_RESOURCE) else payload
+        execution.add_event("LambdaFunctionScheduled", lambdaFunctionScheduledEventDetails={
+            "resource": function_name, "input": json.dumps(event)
+        })
+        if not poller.get_rate_limiter(function_name).wait(1, execution.stop_requested) or execution.stop_requested.is_set():
+            raise StatesError("States.Runtime", f"Execution stopped before invoking {function_name}")
+        response = self.get_pool(function_name).invoke(event, timeout)
+        if not response.get("ok"):
+            if response.get("timedOut"):
+                error = "States.Timeout" if timeout == state.get("TimeoutSeconds") else "Sandbox.Timedout"
+            else:
+                error = response.get("errorType") or "Lambda.Unknown"
+            cause = json.dumps({"errorType": error, "errorMessage": response.get("error", "")})
+            execution.add_event("LambdaFunctionFailed", lambdaFunctionFailedEventDetails={"error": error, "cause": cause})
+            raise StatesError(error, cause)
+
+        result = response.get("result")
+        execution.add_event("LambdaFunctionSucceeded", lambdaFunctionSucceededEventDetails={"output": json.dumps(result)})
+        if state["Resource"].startswith(LAMBDA_INVOKE_RESOURCE):
+            # Misma forma que la integración optimizada lambda:invoke
+            return {"ExecutedVersion": "$LATEST", "Payload": result, "StatusCode": 200}
+        return result
+
+    @staticmethod
+    def _filter_input(state, data, context):
+        input_path = state.get("InputPath", "$")
+        return {} if input_path is None else get_json_path(data, input_path, context)
+
+    @staticmethod
+    def _apply_result_path(state, data, result):
+        result_path = state.get("ResultPath", "$")
+        return data if result_path is None else set_json_path(data, result_path, result)
+
+    @staticmethod
+    def _filter_output(state, data, context):
+        output_path = state.get("OutputPath", "$")
+        return {} if output_path is None else get_json_path(data, output_path, context)
+
+    def stop_execution(self, execution_arn, error=None, cause=None):
+        """StopExecution: la ejecución se aborta al terminar el estado en curso."""
+        execution = self.get_execution(execution_arn)
+        execution.stop_requested.set()
+        execution.finish("ABORTED", error=error, cause=cause)
+        return execution
+
+    def shutdown(self, timeout=DRAIN_TIMEOUT):
+        """
+        Deja de aceptar ejecuciones y espera hasta `timeout` segundos a las que
+        están en curso; las que no terminaron se abortan (ExecutionAborted) antes
+        de detener los workers. Retorna cuántas se abortaron.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self.closed = True
+            running = [execution for execution in self.executions.values() if execution.status == "RUNNING"]
+        if running:
+            print(f"Waiting for {len(running)} running execution(s) (up to {timeout:g}s)...", flush=True)
+        aborted = 0
+        for execution in running:
+            if not execution.finished.wait(max(0, deadline - time.monotonic())):
+                execution.stop_requested.set()
+                execution.finish("ABORTED", cause="The Step Functions endpoint stopped before the execution finished")
+                print(f"⛔ [{execution.state_machine_name}] Execution {execution.name} aborted by shutdown", flush=True)
+                aborted += 1
+        # Detener los workers corta las invocaciones en curso de las ejecuciones abortadas,
+        # de modo que sus threads terminan y el executor se cierra sin esperar al handler
+        for pool in list(self.pools.values()):
+            pool.shutdown()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        return aborted
+
+class StepFunctionsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Atiende las acciones AWSStepFunctions.* del protocolo JSON 1.0."""
+
+    executor = None
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        action = self.headers.get("X-Amz-Target", "").split(".")[-1]
+        try:
+            params = json.loads(body or b"{}")
+            handler = getattr(self, f"action_{action}", None)
+            if handler is None:
+                raise StatesError("UnknownOperationException", f"Unsupported action '{action}'")
+            self._send(200, handler(params))
+        except StatesError as e:
+            self._send(400, {"__type": e.error, "message": e.cause}, e.error)
+        except ValueError as e:
+            self._send(400, {"__type": "SerializationException", "message": str(e)}, "SerializationException")
+
+    def action_StartExecution(self, params):
+        execution = self.executor.start_execution(params.get("stateMachineArn", ""), params.get("name"), params.get("input"))
+        return {"executionArn": execution.execution_arn, "startDate": execution.start_date}
+
+    def action_DescribeExecution(self, params):
+        return self.executor.get_execution(params.get("executionArn", "")).describe()
+
+    def action_StopExecution(self, params):
+        execution = self.executor.stop_execution(params.get("executionArn", ""), params.get("error"), params.get("cause"))
+        return {"stopDate": execution.stop_date}
+
+    def action_GetExecutionHistory(self, params):
+        events = list(self.executor.get_execution(params.get("executionArn", "")).events)
+        return {"events": events[::-1] if params.get("reverseOrder") else events}
+
+    def action_ListStateMachines(self, params):
+        return {"stateMachines": [
+            {"stateMachineArn": f"arn:aws:states:{REGION}:000000000000:stateMachine:{name}",
+             "name": name, "type": "STANDARD", "creationDate": 0}
+            for name in self.executor.state_machines
+        ]}
+
+    def _send(self, status, payload, error_type=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(body)))
+        if error_type:
+            self.send_header("x-amzn-ErrorType", error_type)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StepFunctionsMetricsRequestHandler(poller.MetricsRequestHandler):
+    """/metrics del poller con el /health de este servicio."""
+
+    executor = None
+
+    def health(self):
+        if self.executor.closed:
+            return False, {"status": "draining"}
+        running = sum(1 for execution in list(self.executor.executions.values()) if execution.status == "RUNNING")
+        return True, {"status": "ok", "stateMachines": sorted(self.executor.state_machines), "runningExecutions": running}
+
+def start_step_functions_server(port=PORT, host="0.0.0.0"):
+    """
+    Carga las state machines de serverless.yml e inicia el endpoint en un
+    thread. Retorna (servidor, executor), o None si no hay state machines.
+    """
+    state_machines, functions = load_serverless_state_machines()
+    if not state_machines:
+        print(f"✗ Error: no state machines found in {poller.SERVERLESS_CONFIG}", flush=True)
+        return None
+
+    executor = StepFunctionsExecutor(state_machines, functions)
+    handler = type("BoundStepFunctionsRequestHandler", (StepFunctionsRequestHandler,), {"executor": executor})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="sfn-server", daemon=True).start()
+    executor.preload()
+    print(f"✓ Step Functions endpoint at http://{host}:{port} ({', '.join(state_machines)})", flush=True)
+    return server, executor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Step Functions endpoint for the state machines in serverless.yml")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default {PORT})")
+    parser.add_argument("--host", default="0.0.0.0", help="interface to listen on")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help=f"port of /metrics and /health, 0 disables it (default {METRICS_PORT})")
+    args = parser.parse_args(argv)
+
+    print("=" * 60, flush=True)
+    print("Step Functions Local", flush=True)
+    print("=" * 60, flush=True)
+    print(f"Serverless config: {poller.SERVERLESS_CONFIG}", flush=True)
+    print(f"Backend dir: {poller.BACKEND_DIR}", flush=True)
+    print(f"Worker pool: {STEP_FUNCTIONS_POOL_SIZE} per function, {STEP_FUNCTIONS_MAX_EXECUTIONS} concurrent executions", flush=True)
+    print(f"Rate limits: {poller.describe_rate_limits(poller.RATE_LIMIT_CONFIG) or 'disabled'}", flush=True)
+    print(f"Drain timeout: {DRAIN_TIMEOUT:g}s", flush=True)
+    print("=" * 60, flush=True)
+    print(flush=True)
+
+    # Señales propias: el drenaje del poller (RUNNING) cortaría las esperas de rate limit
+    stopping = threading.Event()
+
+    def handle_signal(sig, frame):
+        if stopping.is_set():
+            print("\nReceived second shutdown signal, exiting without draining", flush=True)
+            os._exit(1)
+        print(f"\nReceived shutdown signal, waiting for running executions (up to {DRAIN_TIMEOUT:g}s)...", flush=True)
+        stopping.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        started = start_step_functions_server(args.port, args.host)
+    except OSError as e:
+        print(f"✗ Error: could not listen on port {args.port}: {e}", flush=True)
+        return 1
+    if started is None:
+        return 1
+    server, executor = started
+    metrics_handler = type("BoundStepFunctionsMetricsRequestHandler", (StepFunctionsMetricsRequestHandler,), {"executor": executor})
+    metrics_server = poller.start_metrics_server(args.metrics_port, metrics_handler)
+    print("Press Ctrl+C to stop\n", flush=True)
+
+    try:
+        while not stopping.is_set():
+            time.sleep(0.5)
+    finally:
+        server.shutdown()
+        drain_started = time.monotonic()
+        aborted = executor.shutdown(DRAIN_TIMEOUT)
+        print(f"✓ Step Functions endpoint stopped in {time.monotonic() - drain_started:.1f}s"
+              f"{f' ({aborted} execution(s) aborted)' if aborted else ''}", flush=True)
+        if metrics_server:
+            metrics_server.shutdown()
+        poller.LOG.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())